@@ -102,13 +102,14 @@ class NSFWDetector:
         
         return output
     
-    def extract_frames(self, video_path: str, fps: int = 1) -> List[Tuple]:
+    def extract_frames(self, video_path: str, fps: int = 1, video_fps: float = None) -> List[Tuple]:
         """
         从视频中抽取帧
         
         Args:
             video_path: 视频文件路径
             fps: 每秒抽取的帧数
+            video_fps: 源视频帧率（来自 ffprobe 探测结果），不传时由 OpenCV 读取
             
         Returns:
             (帧图像, 帧编号, 时间戳)的列表
@@ -117,7 +118,8 @@ class NSFWDetector:
         if not cap.isOpened():
             raise ValueError(f"无法打开视频文件: {video_path}")
         
-        video_fps = cap.get(cv2.CAP_PROP_FPS)
+        if not video_fps:
+            video_fps = cap.get(cv2.CAP_PROP_FPS)
         if video_fps <= 0:
             video_fps = 25  # 默认 FPS
         
@@ -158,7 +160,8 @@ class NSFWDetector:
         batch_size: int = 4,
         save_frames: bool = True,
         frames_dir: str = None,
-        progress_callback: callable = None
+        progress_callback: callable = None,
+        video_fps: float = None
     ) -> Dict:
         """
         检测视频 NSFW 内容
@@ -173,6 +176,7 @@ class NSFWDetector:
             save_frames: 是否保存问题帧图片
             frames_dir: 保存帧图片的目录
             progress_callback: 进度回调函数 callback(current, total, flagged_frames)
+            video_fps: 源视频帧率（来自 ffprobe 探测结果）
             
         Returns:
             检测结果字典
@@ -182,7 +186,7 @@ class NSFWDetector:
         
         # 抽取帧
         logger.info(f"开始处理视频: {video_path}")
-        frames_data = self.extract_frames(video_path, fps)
+        frames_data = self.extract_frames(video_path, fps, video_fps=video_fps)
         
         if not frames_data:
             return {
@@ -3,10 +3,9 @@ OCR 字幕检测服务
 使用 PaddleOCR 检测视频中的硬字幕
 """
 import os
-import json
 import subprocess
 import tempfile
-from typing import Dict, List
+from typing import Dict, List, Optional
 from pathlib import Path
 from django.conf import settings
 import logging
@@ -71,12 +70,13 @@ class OCRService:
             logger.error(f"PaddleOCR 加载失败: {e}", exc_info=True)
             return None
     
-    def detect_subtitle(self, video_path: str) -> Dict:
+    def detect_subtitle(self, video_path: str, max_time: Optional[float] = None) -> Dict:
         """
         检测视频字幕（软字幕 + 硬字幕）
         
         Args:
             video_path: 视频文件路径
+            max_time: 硬字幕只在前 max_time 秒内采样（上传中的文件只有开头部分可读）
             
         Returns:
             {
@@ -105,7 +105,7 @@ class OCRService:
         
         # 2. 检测硬字幕（较慢）
         logger.info("检测硬字幕...")
-        hard_result = self._detect_hard_subtitle(video_path)
+        hard_result = self._detect_hard_subtitle(video_path, max_time=max_time)
         
         if hard_result['has_subtitle']:
             logger.info(f"检测到硬字幕: {hard_result}")
@@ -139,47 +139,18 @@ class OCRService:
             }
         """
         try:
-            cmd = [
-                'ffprobe',
-                '-v', 'error',
-                '-select_streams', 's',
-                '-show_entries', 'stream=index,codec_name,codec_type:stream_tags=language',
-                '-of', 'json',
-                video_path
-            ]
+            from videos.services.probe import probe_video
             
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
+            # 字幕轨道信息来自统一的探测结果（有缓存时不再执行 ffprobe）
+            tracks = probe_video(video_path).subtitle_tracks
             
-            if result.returncode != 0:
-                logger.error(f"FFprobe 错误: {result.stderr}")
+            if not tracks:
                 return {'has_subtitle': False, 'tracks': [], 'language': ''}
             
-            data = json.loads(result.stdout)
-            streams = data.get('streams', [])
-            
-            if not streams:
-                return {'has_subtitle': False, 'tracks': [], 'language': ''}
-            
-            # 提取字幕轨道信息
-            tracks = []
-            languages = set()
-            
-            for stream in streams:
-                track_info = {
-                    'index': stream.get('index'),
-                    'codec': stream.get('codec_name'),
-                    'language': stream.get('tags', {}).get('language', 'unknown')
-                }
-                tracks.append(track_info)
-                
-                lang = track_info['language']
-                if lang and lang != 'unknown':
-                    languages.add(lang)
+            languages = {
+                track['language'] for track in tracks
+                if track['language'] and track['language'] != 'unknown'
+            }
             
             return {
                 'has_subtitle': True,
@@ -191,13 +162,15 @@ class OCRService:
             logger.error(f"软字幕检测失败: {e}", exc_info=True)
             return {'has_subtitle': False, 'tracks': [], 'language': ''}
     
-    def _detect_hard_subtitle(self, video_path: str, sample_count: int = 10) -> Dict:
+    def _detect_hard_subtitle(self, video_path: str, sample_count: int = 10,
+                              max_time: Optional[float] = None) -> Dict:
         """
         使用 PaddleOCR 检测硬字幕
         
         Args:
             video_path: 视频文件路径
             sample_count: 采样帧数
+            max_time: 采样范围上限（秒）
             
         Returns:
             {
@@ -216,6 +189,8 @@ class OCRService:
         try:
             # 获取视频时长
             duration = self._get_video_duration(video_path)
+            if max_time is not None:
+                duration = min(duration, max_time)
             if duration <= 0:
                 logger.error(f"无效的视频时长: {duration}")
                 return {'has_subtitle': False, 'detected_frames': 0, 'total_frames': 0, 'language': ''}
@@ -263,20 +238,8 @@ class OCRService:
     def _get_video_duration(self, video_path: str) -> float:
         """获取视频时长（秒）"""
         try:
-            cmd = [
-                'ffprobe',
-                '-v', 'error',
-                '-show_entries', 'format=duration',
-                '-of', 'json',
-                video_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            
-            if result.returncode == 0:
-                data = json.loads(result.stdout)
-                return float(data.get('format', {}).get('duration', 0))
-            
+            from videos.services.probe import probe_video
+            return probe_video(video_path).duration
         except Exception as e:
             logger.error(f"获取视频时长失败: {e}")
         
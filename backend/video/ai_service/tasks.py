@@ -175,9 +175,18 @@ def detect_video_subtitle(self, video_id):
         
         logger.info(f"[Task {task_id}] 视频文件: {video_file_path}")
         
-        # 使用 OCR 服务检测字幕
-        ocr = OCRService()
-        result = ocr.detect_subtitle(video_file_path)
+        # 上传过程中已在开头部分检测到字幕时直接采用；开头没有字幕时仍检测完整文件
+        result = None
+        if getattr(settings, 'VIDEO_PROGRESSIVE_UPLOAD', False):
+            from videos.services.progressive import get_progressive_subtitle
+            result = get_progressive_subtitle(video_id)
+        
+        if result and result['has_subtitle']:
+            logger.info(f"[Task {task_id}] 使用上传过程中的字幕检测结果")
+        else:
+            # 使用 OCR 服务检测字幕
+            ocr = OCRService()
+            result = ocr.detect_subtitle(video_file_path)
         
         logger.info(f"[Task {task_id}] 检测结果: {result}")
         
@@ -291,6 +300,86 @@ def detect_video_subtitle(self, video_id):
         }
 
 
+@shared_task(bind=True)
+def detect_upload_prefix_subtitle(self, user_id, upload_id, max_time):
+    """
+    边上传边处理：对上传中文件已到达的开头部分检测字幕
+
+    结果记录在渐进式处理状态中，上传完成后 detect_video_subtitle 检测到字幕时直接复用
+    
+    Args:
+        max_time: 已到达数据覆盖的时长（秒），硬字幕只在该范围内采样
+    """
+    from videos.services.uploads import upload_file_path
+    from videos.services.progressive import get_progressive_state, update_progressive_state
+    
+    task_id = self.request.id or 'unknown'
+    logger.info(f"[Task {task_id}] 开始检测上传中文件的字幕: upload_id={upload_id}, 范围 {max_time:.1f} 秒")
+    
+    try:
+        result = OCRService().detect_subtitle(upload_file_path(user_id, upload_id), max_time=max_time)
+    except Exception as e:
+        logger.warning(f"[Task {task_id}] 上传中文件字幕检测失败: {e}")
+        return {"status": "error", "reason": str(e)}
+    
+    # 上传已取消或处理状态已被清理时不再记录
+    if not get_progressive_state(user_id, upload_id):
+        return {"status": "skipped", "reason": "upload_gone"}
+    update_progressive_state(user_id, upload_id, subtitle=result)
+    
+    logger.info(f"[Task {task_id}] 上传中文件字幕检测完成: has_subtitle={result['has_subtitle']}, type={result['subtitle_type']}")
+    return {"status": "success", "subtitle_info": result}
+
+
+def reuse_duplicate_moderation(video, moderation, threshold_level, threshold, fps):
+    """
+    复用近似重复视频的审核结果
+
+    需要开启 VIDEO_FINGERPRINT_REUSE_MODERATION，且对方视频指纹相似度达到阈值、
+    以相同参数完成过审核
+
+    Returns:
+        ModerationResult | None: 被复用的审核记录
+    """
+    if not getattr(settings, 'VIDEO_FINGERPRINT_REUSE_MODERATION', False):
+        return None
+
+    from videos.models import VideoFingerprint
+
+    fingerprint = VideoFingerprint.objects.filter(video=video).first()
+    if fingerprint is None:
+        return None
+
+    min_similarity = getattr(settings, 'VIDEO_FINGERPRINT_REUSE_SIMILARITY', 0.9)
+    for match in fingerprint.matches:
+        if match['similarity'] < min_similarity:
+            break
+        source = ModerationResult.objects.filter(video_id=match['video_id'], status='completed').first()
+        if source is None:
+            continue
+        params = source.details or {}
+        if (params.get('threshold_level'), params.get('threshold'), params.get('fps')) != (threshold_level, threshold, fps):
+            continue
+
+        moderation.status = 'completed'
+        moderation.result = source.result
+        moderation.confidence = source.confidence
+        moderation.neutral_score = source.neutral_score
+        moderation.low_score = source.low_score
+        moderation.medium_score = source.medium_score
+        moderation.high_score = source.high_score
+        moderation.flagged_frames = source.flagged_frames
+        moderation.details = {
+            **params,
+            'reused_from': source.video_id,
+            'similarity': match['similarity'],
+        }
+        moderation.save()
+        return source
+
+    return None
+
+
 @shared_task(bind=True, max_retries=2, default_retry_delay=120)
 def moderate_video_task(self, video_id, threshold_level='medium', threshold=0.6, fps=1):
     """
@@ -333,7 +422,20 @@ def moderate_video_task(self, video_id, threshold_level='medium', threshold=0.6,
             moderation.status = 'processing'
             moderation.error_message = ''
             moderation.save(update_fields=['status', 'error_message'])
-        
+
+        # 近似重复视频已有审核结果时直接复用，跳过逐帧检测
+        reused = reuse_duplicate_moderation(video, moderation, threshold_level, threshold, fps)
+        if reused:
+            logger.info(f"[Task {task_id}] 复用近似重复视频 {reused.video_id} 的审核结果: {reused.result}")
+            return {
+                'video_id': video_id,
+                'status': 'completed',
+                'result': moderation.result,
+                'confidence': moderation.confidence,
+                'flagged_count': len(moderation.flagged_frames),
+                'reused_from': reused.video_id
+            }
+
         # 模型路径
         model_path = os.path.join(
             settings.BASE_DIR,
@@ -356,7 +458,15 @@ def moderate_video_task(self, video_id, threshold_level='medium', threshold=0.6,
         
         logger.info(f"[Task {task_id}] 开始检测，参数: level={threshold_level}, threshold={threshold}, fps={fps}")
         logger.info(f"[Task {task_id}] 问题帧保存目录: {frames_dir}")
-        
+
+        # 源视频帧率复用转码时的探测结果
+        video_fps = None
+        try:
+            from videos.services.probe import probe_video_for
+            video_fps = probe_video_for(video, video_file_path).frame_rate or None
+        except Exception as e:
+            logger.warning(f"[Task {task_id}] 读取探测信息失败，使用 OpenCV 帧率: {e}")
+
         # 执行检测（带进度回调）
         def progress_callback(current, total, flagged_frames):
             """进度回调函数"""
@@ -400,7 +510,8 @@ def moderate_video_task(self, video_id, threshold_level='medium', threshold=0.6,
             batch_size=4,
             save_frames=True,
             frames_dir=frames_dir,
-            progress_callback=progress_callback  # 传入进度回调
+            progress_callback=progress_callback,  # 传入进度回调
+            video_fps=video_fps
         )
         
         # 直接使用模型返回的累积概率
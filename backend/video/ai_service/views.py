@@ -7,7 +7,6 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
 from django.utils import timezone
 from celery.result import AsyncResult
 import logging
@@ -813,42 +812,8 @@ class SubtitleViewSet(viewsets.ViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        subtitles = video.subtitles_draft or []
-        lines = ["WEBVTT", ""]
-        
-        def _format_vtt_time(seconds):
-            try:
-                seconds = float(seconds)
-            except Exception:
-                seconds = 0.0
-            if seconds < 0:
-                seconds = 0.0
-            hours = int(seconds // 3600)
-            minutes = int((seconds % 3600) // 60)
-            secs = int(seconds % 60)
-            ms = int(round((seconds - int(seconds)) * 1000))
-            return f"{hours:02d}:{minutes:02d}:{secs:02d}.{ms:03d}"
-        
-        for i, sub in enumerate(subtitles):
-            if not isinstance(sub, dict):
-                continue
-            start = sub.get('startTime', 0)
-            end = sub.get('endTime', 0)
-            text = (sub.get('text') or '').strip()
-            translation = (sub.get('translation') or '').strip()
-            if not text and not translation:
-                continue
-            
-            lines.append(str(i + 1))
-            lines.append(f"{_format_vtt_time(start)} --> {_format_vtt_time(end)}")
-            if text:
-                lines.append(text)
-            if translation:
-                lines.append(translation)
-            lines.append("")
-        
-        content = "\n".join(lines)
-        return HttpResponse(content, content_type='text/vtt; charset=utf-8')
+        from videos.services.subtitles import subtitle_response
+        return subtitle_response(request, video, 'vtt')
     
     @action(detail=True, methods=['post'], url_path='generate')
     def generate(self, request, pk=None):
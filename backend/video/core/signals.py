@@ -135,6 +135,22 @@ def video_post_save(sender, instance, created, **kwargs):
                 logger.warning(f"发送视频状态通知失败: {e}")
 
 
+@receiver(post_save, sender=Video)
+def video_subtitles_post_save(sender, instance, update_fields=None, **kwargs):
+    """
+    字幕草稿保存后预先生成 VTT / SRT 文件，播放器请求时直接发送
+    """
+    if update_fields is not None and 'subtitles_draft' not in update_fields:
+        return
+    try:
+        from videos.services.subtitles import compile_subtitles
+        compile_subtitles(instance)
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.warning(f"生成字幕文件失败: {e}")
+
+
 @receiver(post_delete, sender=VideoLike)
 def video_like_post_delete(sender, instance, **kwargs):
     """
@@ -15,6 +15,7 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from core.permissions import IsSuperAdmin
 from users.models_monitoring import SystemMonitoringLog
+from videos.services.uploads import get_sweep_stats
 import redis
 
 logger = logging.getLogger(__name__)
@@ -290,6 +291,8 @@ class SystemSettingsViewSet(viewsets.ViewSet):
                 'total_size': media_size,
                 'total_size_gb': round(media_size / (1024**3), 2),
                 'video_count': video_count,
+                # 上传临时文件清理统计（定时任务写入）
+                'upload_temp': get_sweep_stats(),
             }
             
             # Django 配置信息
@@ -28,6 +28,21 @@ app.conf.beat_schedule = {
         'task': 'users.tasks.collect_system_monitoring_data',
         'schedule': 10.0,
     },
+    # 任务4：每小时清理一次放弃的上传临时文件
+    'cleanup-stale-uploads-hourly': {
+        'task': 'videos.tasks.cleanup_stale_uploads',
+        'schedule': crontab(minute=30),
+    },
+    # 任务5：每 5 秒把 Redis 中累计的播放次数批量写入数据库
+    'flush-video-views': {
+        'task': 'videos.tasks.flush_video_views',
+        'schedule': 5.0,
+    },
+    # 任务6：每 5 秒把 Redis 队列中的观看事件批量写入观看记录
+    'ingest-video-views': {
+        'task': 'videos.tasks.ingest_video_views',
+        'schedule': 5.0,
+    },
 }
 
 @app.task(bind=True)
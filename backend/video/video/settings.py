@@ -149,6 +149,13 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# HLS 媒体投递（api/videos/media/<视频ID>/...）：django 直接发送；nginx 使用 X-Accel-Redirect，
+# 需要把 MEDIA_ACCEL_REDIRECT_PREFIX 配置为指向 MEDIA_ROOT 的 internal location；sendfile 使用 X-Sendfile
+MEDIA_DELIVERY_BACKEND = os.environ.get('MEDIA_DELIVERY_BACKEND', 'django')
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+# 播放地址签名密钥和有效期（秒），切片请求只校验签名
+MEDIA_SIGNING_KEY = os.environ.get('MEDIA_SIGNING_KEY', SECRET_KEY)
+MEDIA_TOKEN_TTL = int(os.environ.get('MEDIA_TOKEN_TTL', 6 * 3600))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
@@ -231,11 +238,26 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
     'range', 
+    # tus 断点续传
+    'tus-resumable',
+    'upload-length',
+    'upload-metadata',
+    'upload-offset',
+    'upload-checksum',
 ]
 CORS_EXPOSE_HEADERS = [
     'content-range',
     'content-length',
     'accept-ranges',
+    # tus 断点续传
+    'location',
+    'tus-resumable',
+    'tus-version',
+    'tus-extension',
+    'tus-checksum-algorithm',
+    'upload-offset',
+    'upload-length',
+    'upload-task-id',
 ]
 
 
@@ -278,6 +300,37 @@ VIDEO_UPLOAD_PATH = os.path.join(MEDIA_ROOT, 'videos/uploads')
 VIDEO_PROCESSED_PATH = os.path.join(MEDIA_ROOT, 'videos/processed')
 VIDEO_THUMBNAIL_PATH = os.path.join(MEDIA_ROOT, 'videos/thumbnails')
 
+# 视频转码设置
+# single: 单个 FFmpeg 命令同时输出所有分辨率
+# fanout: 每个分辨率和共享音轨拆分为独立 Celery 子任务，由多个 worker 并行转码
+# chunked: 在 fanout 基础上按关键帧把视频切分为多个时间段并行转码
+VIDEO_TRANSCODE_MODE = os.environ.get('VIDEO_TRANSCODE_MODE', 'single')
+# fanout 模式下时长超过该值（秒）的视频自动使用 chunked 分段转码
+VIDEO_CHUNKED_MIN_DURATION = int(os.environ.get('VIDEO_CHUNKED_MIN_DURATION', 3600))
+# 分段转码时每段的目标时长（秒），实际切分点对齐到关键帧
+VIDEO_CHUNK_DURATION = int(os.environ.get('VIDEO_CHUNK_DURATION', 300))
+# 转码前做低分辨率试编码估计画面复杂度，按内容选择每个分辨率的码率和 CRF（默认关闭，开启后每个视频多做三次试编码）
+VIDEO_CONTENT_AWARE_LADDER = os.environ.get('VIDEO_CONTENT_AWARE_LADDER', 'False') == 'True'
+# 新视频默认的 HLS 切片格式：ts / fmp4（CMAF 切片）/ fmp4_single（每个分辨率一个文件，使用字节范围）
+# 已转码的视频按各自记录的格式播放
+VIDEO_HLS_SEGMENT_FORMAT = os.environ.get('VIDEO_HLS_SEGMENT_FORMAT', 'ts')
+# 近似重复视频（感知哈希指纹相似度不低于该值）直接复用已完成的 AI 审核结果，跳过逐帧检测
+VIDEO_FINGERPRINT_REUSE_MODERATION = os.environ.get('VIDEO_FINGERPRINT_REUSE_MODERATION', 'False') == 'True'
+VIDEO_FINGERPRINT_REUSE_SIMILARITY = float(os.environ.get('VIDEO_FINGERPRINT_REUSE_SIMILARITY', 0.9))
+
+# 分片上传：已收到分片的位图所在 Redis，未完成的上传会话保留时间（秒）
+UPLOAD_REDIS_URL = os.environ.get('UPLOAD_REDIS_URL', CACHES['default']['LOCATION'])
+UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', 86400))
+# 每个用户未完成上传的临时数据上限（字节，按预分配的完整文件大小计算），0 表示不限制
+UPLOAD_USER_TEMP_QUOTA = int(os.environ.get('UPLOAD_USER_TEMP_QUOTA', 20 * 1024 ** 3))
+# 临时文件超过该时间（秒）没有写入且上传会话已过期时，由定时任务清理
+UPLOAD_STALE_AGE = int(os.environ.get('UPLOAD_STALE_AGE', UPLOAD_SESSION_TTL))
+# 边上传边处理：开头连续到达的数据达到该字节数后，对 faststart MP4 提前探测、选封面、检测字幕并开始转码
+VIDEO_PROGRESSIVE_UPLOAD = os.environ.get('VIDEO_PROGRESSIVE_UPLOAD', 'False') == 'True'
+VIDEO_PROGRESSIVE_PREFIX_BYTES = int(os.environ.get('VIDEO_PROGRESSIVE_PREFIX_BYTES', 32 * 1024 * 1024))
+# 同一观众在该时间（秒）内重复观看同一视频只计一次播放
+VIDEO_VIEW_DEDUP_WINDOW = int(os.environ.get('VIDEO_VIEW_DEDUP_WINDOW', 3600))
+
 # 邮件设置
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.163.com'  # 163邮箱SMTP服务器
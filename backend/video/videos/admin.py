@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Tag, Video, VideoLike, Comment, VideoView
+from .models import Category, Tag, Video, VideoLike, Comment, VideoView, MediaAsset
 
 
 @admin.register(Category)
@@ -26,7 +26,17 @@ class VideoAdmin(admin.ModelAdmin):
     ordering = ('-created_at',)
     filter_horizontal = ('tags',)
     date_hierarchy = 'created_at'
-    raw_id_fields = ('user',)
+    raw_id_fields = ('user', 'media_asset')
+
+
+@admin.register(MediaAsset)
+class MediaAssetAdmin(admin.ModelAdmin):
+    list_display = ('file_md5', 'file_size', 'status', 'ref_count', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('file_md5', 'sha256')
+    readonly_fields = ('ref_count', 'created_at', 'updated_at')
+    ordering = ('-created_at',)
+    raw_id_fields = ('transcoding_video',)
 
 
 @admin.register(VideoLike)
@@ -11,6 +11,9 @@ urlpatterns = [
     # 审核通过视频
     path('videos/<int:video_id>/approve/', AdminVideoViewSet.as_view({'post': 'approve_video'}), name='admin-approve-video'),
     
+    # 近似重复视频
+    path('videos/<int:video_id>/duplicates/', AdminVideoViewSet.as_view({'get': 'get_near_duplicates'}), name='admin-video-duplicates'),
+    
     # 拒绝视频
     path('videos/<int:video_id>/reject/', AdminVideoViewSet.as_view({'post': 'reject_video'}), name='admin-reject-video'),
 ] 
\ No newline at end of file
@@ -4,8 +4,9 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from .models import Video
+from .models import Video, VideoFingerprint
 from .serializers import VideoDetailSerializer
+from .services.fingerprint import find_near_duplicates
 from users.utils.log_utils import log_video_review
 
 class IsAdminUser(permissions.BasePermission):
@@ -27,6 +28,37 @@ class IsAdminUser(permissions.BasePermission):
         # 只检查role属性
         return user_role in ['admin', 'superadmin']
 
+def load_match_videos(video_ids):
+    """一次查询近似重复视频的标题、状态和上传者，已删除的视频不返回"""
+    return {
+        item['id']: item
+        for item in Video.objects.filter(
+            id__in=set(video_ids),
+            deleted_at__isnull=True
+        ).values('id', 'title', 'status', 'user__username')
+    }
+
+
+def describe_near_duplicates(matches, videos=None):
+    """
+    补充近似重复视频的标题、状态和上传者，已删除的视频不再显示
+
+    Args:
+        videos: load_match_videos 的结果，列表页为整页视频一次查询后传入；不传时单独查询
+    """
+    if videos is None:
+        videos = load_match_videos(match['video_id'] for match in matches)
+    return [
+        {
+            **match,
+            'title': videos[match['video_id']]['title'],
+            'status': videos[match['video_id']]['status'],
+            'username': videos[match['video_id']]['user__username'],
+        }
+        for match in matches if match['video_id'] in videos
+    ]
+
+
 class AdminVideoViewSet(viewsets.ViewSet):
     """
     管理员视频管理视图集
@@ -54,15 +86,45 @@ class AdminVideoViewSet(viewsets.ViewSet):
         videos = queryset[start:end]
         
         serializer = VideoDetailSerializer(videos, many=True, context={'request': request})
+        results = serializer.data
+        
+        # 附加近似重复检测结果，供审核员参考
+        matches_by_video = dict(
+            VideoFingerprint.objects.filter(video_id__in=[item['id'] for item in results])
+            .values_list('video_id', 'matches')
+        )
+        match_videos = load_match_videos(
+            match['video_id'] for matches in matches_by_video.values() for match in matches
+        )
+        for item in results:
+            item['near_duplicates'] = describe_near_duplicates(matches_by_video.get(item['id'], []), match_videos)
         
         return Response({
-            'results': serializer.data,
+            'results': results,
             'count': total,
             'page': page,
             'page_size': page_size,
             'total_pages': (total + page_size - 1) // page_size
         })
     
+    def get_near_duplicates(self, request, video_id):
+        """
+        获取视频的近似重复列表
+        
+        按当前指纹索引重新查找，包含该视频指纹计算之后上传的视频
+        """
+        video = get_object_or_404(Video, id=video_id)
+        fingerprint = VideoFingerprint.objects.filter(video=video).first()
+        if fingerprint is None:
+            return Response({'video_id': video.id, 'fingerprinted': False, 'results': []})
+        
+        matches = find_near_duplicates(fingerprint)
+        return Response({
+            'video_id': video.id,
+            'fingerprinted': True,
+            'results': describe_near_duplicates(matches)
+        })
+    
     def get_reviewed_videos(self, request):
         """
         获取已审核的视频列表
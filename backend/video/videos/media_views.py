@@ -0,0 +1,109 @@
+"""
+HLS 媒体投递视图
+请求携带详情接口签发的播放令牌时只校验签名，不查询数据库；播放列表在发送时给其中的地址加上令牌。
+没有令牌或令牌过期时，播放列表请求按视频观看权限完整鉴权后重新签发，切片请求直接拒绝。
+播放列表从进程内缓存读取，带 ETag，支持 304。
+文件由 X-Accel-Redirect / X-Sendfile 交给前置服务器发送，或由 Django 发送（支持 Range）
+"""
+import os
+import hashlib
+import logging
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import permissions
+from rest_framework.exceptions import NotFound, PermissionDenied
+from rest_framework.views import APIView
+
+from .models import Video
+from .services.delivery import media_response, media_content_type, resolve_media_path, IMMUTABLE_MAX_AGE
+from .services.playlist_cache import read_playlist
+from .services.signing import (
+    TOKEN_PARAM, hls_key_from_file, mint_playback_token, verify_playback_token, sign_playlist,
+)
+from .views import check_video_view_permission
+
+logger = logging.getLogger(__name__)
+
+PLAYLIST_SUFFIX = '.m3u8'
+
+
+def authorize_video_media(video_id, hls_key, user):
+    """
+    完整鉴权并签发新的播放令牌
+
+    Raises:
+        NotFound: 视频不存在、已删除、尚未转码或 HLS 目录不属于该视频
+        PermissionDenied: 没有观看权限
+    """
+    video = Video.objects.select_related('user').filter(id=video_id, deleted_at__isnull=True).first()
+    if video is None or not video.hls_file or hls_key_from_file(video.hls_file) != hls_key:
+        raise NotFound("视频不存在")
+
+    has_permission, error_message = check_video_view_permission(video, user)
+    if not has_permission:
+        raise PermissionDenied(error_message)
+
+    return mint_playback_token(video_id, hls_key, viewer_id=user.id if user.is_authenticated else None)
+
+
+class HLSMediaView(APIView):
+    """
+    HLS 播放列表、切片和预览图
+
+    master.m3u8 从这里加载后，子播放列表和切片的相对地址带着同一个令牌也经过这里
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def perform_authentication(self, request):
+        # 登录状态只在回退到完整鉴权时才解析，带令牌的请求不查询用户
+        pass
+
+    def get(self, request, video_id, hls_key, path, *args, **kwargs):
+        is_playlist = path.endswith(PLAYLIST_SUFFIX)
+
+        token = request.query_params.get(TOKEN_PARAM)
+        signed = verify_playback_token(token, video_id, hls_key)
+        if not signed:
+            if not is_playlist:
+                raise PermissionDenied("播放地址无效或已过期")
+            token = authorize_video_media(video_id, hls_key, request.user)
+
+        hls_dir = os.path.join(settings.MEDIA_ROOT, 'videos', 'hls', hls_key)
+        file_path = resolve_media_path(hls_dir, path)
+        if file_path is None:
+            raise NotFound("文件不存在")
+
+        if is_playlist:
+            return self.playlist_response(request, file_path, token, signed)
+
+        # 地址中的令牌因观众而异，共享缓存命中率很低，只允许浏览器缓存
+        return media_response(request, file_path, f'private, max-age={IMMUTABLE_MAX_AGE}, immutable')
+
+    def playlist_response(self, request, file_path, token, signed):
+        """
+        发送加上令牌的播放列表，支持 If-None-Match
+
+        点播播放列表在令牌有效期内不会变化，带有效令牌的请求允许浏览器缓存到令牌过期；
+        回退鉴权时每次签发的令牌不同，不缓存
+        """
+        playlist = read_playlist(file_path)
+        if playlist is None:
+            raise NotFound("文件不存在")
+
+        # 响应内容由文件内容和令牌共同决定
+        etag = quote_etag(hashlib.sha1(f"{playlist['etag']}:{token}".encode()).hexdigest())
+        if signed and playlist['vod']:
+            cache_control = f'private, max-age={settings.MEDIA_TOKEN_TTL}, immutable'
+        else:
+            cache_control = 'private, no-cache'
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(sign_playlist(playlist['content'], token),
+                                    content_type=media_content_type(file_path))
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        return response
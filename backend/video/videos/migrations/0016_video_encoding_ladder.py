@@ -0,0 +1,18 @@
+# Generated migration file
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0015_add_taken_down_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='encoding_ladder',
+            field=models.JSONField(blank=True, default=dict, help_text='按内容复杂度选择的分辨率、码率和 CRF', verbose_name='转码阶梯'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated migration file
+
+from django.db import migrations, models
+import videos.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0016_video_encoding_ladder'),
+    ]
+
+    operations = [
+        # 已有视频都是 TS 切片
+        migrations.AddField(
+            model_name='video',
+            name='hls_segment_format',
+            field=models.CharField(
+                choices=[('ts', 'MPEG-TS 切片'), ('fmp4', 'fMP4 切片'), ('fmp4_single', 'fMP4 单文件')],
+                default='ts',
+                max_length=20,
+                verbose_name='HLS切片格式'
+            ),
+        ),
+        # 新视频使用 VIDEO_HLS_SEGMENT_FORMAT 配置
+        migrations.AlterField(
+            model_name='video',
+            name='hls_segment_format',
+            field=models.CharField(
+                choices=[('ts', 'MPEG-TS 切片'), ('fmp4', 'fMP4 切片'), ('fmp4_single', 'fMP4 单文件')],
+                default=videos.models.default_hls_segment_format,
+                max_length=20,
+                verbose_name='HLS切片格式'
+            ),
+        ),
+    ]
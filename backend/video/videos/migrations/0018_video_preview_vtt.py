@@ -0,0 +1,18 @@
+# Generated migration file
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0017_video_hls_segment_format'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='preview_vtt',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='预览缩略图轨道'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated migration file
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0018_video_preview_vtt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='thumbnail_candidates',
+            field=models.JSONField(blank=True, default=list, help_text='自动抽取的候选帧，按得分从高到低排列', verbose_name='候选封面'),
+        ),
+    ]
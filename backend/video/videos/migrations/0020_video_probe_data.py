@@ -0,0 +1,18 @@
+# Generated migration file
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0019_video_thumbnail_candidates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='probe_data',
+            field=models.JSONField(blank=True, default=dict, help_text='ffprobe 探测结果缓存，按源文件路径、大小、修改时间校验', verbose_name='探测信息'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated migration file
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0020_video_probe_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaAsset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_md5', models.CharField(max_length=32, verbose_name='文件MD5')),
+                ('file_size', models.BigIntegerField(verbose_name='文件大小(字节)')),
+                ('sha256', models.CharField(blank=True, max_length=64, verbose_name='文件SHA256')),
+                ('video_file', models.CharField(max_length=255, verbose_name='源文件路径')),
+                ('hls_file', models.CharField(blank=True, max_length=255, null=True, verbose_name='HLS文件路径')),
+                ('thumbnail', models.CharField(blank=True, max_length=255, verbose_name='自动封面路径')),
+                ('media_info', models.JSONField(blank=True, default=dict, help_text='转码完成后的技术参数，关联视频直接复用', verbose_name='转码结果')),
+                ('status', models.CharField(choices=[('uploaded', '已上传'), ('processing', '转码中'), ('ready', '就绪')], default='uploaded', max_length=20, verbose_name='状态')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='引用计数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('transcoding_video', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='videos.video')),
+            ],
+            options={
+                'verbose_name': '媒体资源',
+                'verbose_name_plural': '媒体资源',
+                'unique_together': {('file_md5', 'file_size')},
+            },
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='media_asset',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='videos', to='videos.mediaasset'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated migration file
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0021_mediaasset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hashes', models.BinaryField(verbose_name='帧哈希')),
+                ('frame_count', models.PositiveSmallIntegerField(default=0, verbose_name='帧数')),
+                ('matches', models.JSONField(blank=True, default=list, help_text='[{video_id, similarity, distance}]，按相似度从高到低', verbose_name='近似重复')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('video', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprint', to='videos.video')),
+            ],
+            options={
+                'verbose_name': '视频指纹',
+                'verbose_name_plural': '视频指纹',
+            },
+        ),
+        migrations.CreateModel(
+            name='FingerprintBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(db_index=True, verbose_name='索引键')),
+                ('fingerprint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='videos.videofingerprint')),
+            ],
+            options={
+                'verbose_name': '指纹索引',
+                'verbose_name_plural': '指纹索引',
+                'unique_together': {('fingerprint', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated migration file
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0022_videofingerprint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='videoview',
+            name='view_date',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False, verbose_name='观看时间'),
+        ),
+    ]
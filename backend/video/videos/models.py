@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 
@@ -30,6 +31,47 @@ class Tag(models.Model):
         return self.name
 
 
+def default_hls_segment_format():
+    """新视频默认的 HLS 切片格式"""
+    return getattr(settings, 'VIDEO_HLS_SEGMENT_FORMAT', 'ts')
+
+
+class MediaAsset(models.Model):
+    """
+    共享媒体资源
+
+    相同内容（MD5 + 文件大小）的上传共用一份源文件和 HLS 转码结果，按引用计数删除
+    """
+    STATUS_CHOICES = (
+        ('uploaded', '已上传'),
+        ('processing', '转码中'),
+        ('ready', '就绪'),
+    )
+
+    file_md5 = models.CharField(_('文件MD5'), max_length=32)
+    file_size = models.BigIntegerField(_('文件大小(字节)'))
+    sha256 = models.CharField(_('文件SHA256'), max_length=64, blank=True)
+    video_file = models.CharField(_('源文件路径'), max_length=255)
+    hls_file = models.CharField(_('HLS文件路径'), max_length=255, blank=True, null=True)
+    thumbnail = models.CharField(_('自动封面路径'), max_length=255, blank=True)
+    media_info = models.JSONField(_('转码结果'), default=dict, blank=True, help_text='转码完成后的技术参数，关联视频直接复用')
+    status = models.CharField(_('状态'), max_length=20, choices=STATUS_CHOICES, default='uploaded')
+    transcoding_video = models.ForeignKey(
+        'Video', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )  # 正在为该资源转码的视频，其他关联视频等待其完成
+    ref_count = models.PositiveIntegerField(_('引用计数'), default=0)
+    created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('更新时间'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('媒体资源')
+        verbose_name_plural = _('媒体资源')
+        unique_together = ('file_md5', 'file_size')
+
+    def __str__(self):
+        return f"{self.file_md5} ({self.ref_count} refs)"
+
+
 class Video(models.Model):
     """视频模型"""
     STATUS_CHOICES = (
@@ -43,6 +85,11 @@ class Video(models.Model):
         ('rejected', '已拒绝'),
         ('taken_down', '已下架'),  # 新增：因举报等原因被下架
     )
+    SEGMENT_FORMAT_CHOICES = (
+        ('ts', 'MPEG-TS 切片'),
+        ('fmp4', 'fMP4 切片'),
+        ('fmp4_single', 'fMP4 单文件'),
+    )
     
     title = models.CharField(_('标题'), max_length=100, db_index=True)  # 添加索引：用于搜索
     description = models.TextField(_('描述'), blank=True)
@@ -52,7 +99,17 @@ class Video(models.Model):
     
     # 视频文件
     video_file = models.FileField(_('视频文件'), upload_to='videos/uploads/%Y/%m/%d/')
+    media_asset = models.ForeignKey(
+        MediaAsset, on_delete=models.SET_NULL, null=True, blank=True, related_name='videos'
+    )  # 内容去重：相同内容的视频共享源文件和转码结果
     hls_file = models.CharField(_('HLS文件路径'), max_length=255, blank=True, null=True)
+    hls_segment_format = models.CharField(
+        _('HLS切片格式'),
+        max_length=20,
+        choices=SEGMENT_FORMAT_CHOICES,
+        default=default_hls_segment_format
+    )
+    preview_vtt = models.CharField(_('预览缩略图轨道'), max_length=255, blank=True, null=True)  # 雪碧图 WebVTT，用于进度条预览
     duration = models.FloatField(_('时长(秒)'), default=0, db_index=True)  # 添加索引：用于时长筛选
     resolution = models.PositiveIntegerField(_('最高分辨率'), default=0, db_index=True)  # 存储最高分辨率的高度值，如 2160(4K), 1440(2K), 1080 等
     
@@ -67,6 +124,8 @@ class Video(models.Model):
     audio_bitrate = models.PositiveIntegerField(_('音频码率(kbps)'), default=0)
     frame_rate = models.FloatField(_('帧率'), default=0)  # 如 24, 30, 60
     file_size = models.BigIntegerField(_('文件大小(字节)'), default=0)
+    probe_data = models.JSONField(_('探测信息'), default=dict, blank=True, help_text='ffprobe 探测结果缓存，按源文件路径、大小、修改时间校验')
+    encoding_ladder = models.JSONField(_('转码阶梯'), default=dict, blank=True, help_text='按内容复杂度选择的分辨率、码率和 CRF')
     
     # 字幕信息
     has_subtitle = models.BooleanField(_('是否有字幕'), default=False, db_index=True)  # 用于筛选有字幕的视频
@@ -88,6 +147,7 @@ class Video(models.Model):
     
     # 缩略图
     thumbnail = models.ImageField(_('缩略图'), upload_to='videos/thumbnails/%Y/%m/%d/', blank=True, null=True)
+    thumbnail_candidates = models.JSONField(_('候选封面'), default=list, blank=True, help_text='自动抽取的候选帧，按得分从高到低排列')
     
     # 统计信息
     views_count = models.PositiveIntegerField(_('观看次数'), default=0, db_index=True)  # 添加索引：用于热门排序
@@ -176,7 +236,6 @@ class Video(models.Model):
     
     def soft_delete(self):
         """软删除视频"""
-        from django.utils import timezone
         self.deleted_at = timezone.now()
         self.is_published = False  # 取消发布
         self.save(update_fields=['deleted_at', 'is_published'])
@@ -234,7 +293,8 @@ class VideoView(models.Model):
     video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='views', db_index=True)
     ip_address = models.GenericIPAddressField(_('IP地址'), blank=True, null=True)
     user_agent = models.CharField(_('User Agent'), max_length=255, blank=True)
-    view_date = models.DateTimeField(_('观看时间'), auto_now_add=True, db_index=True)  # 添加索引：用于时间查询
+    # 批量写入时使用观看事件的时间，不能用 auto_now_add（创建时总是覆盖为当前时间）
+    view_date = models.DateTimeField(_('观看时间'), default=timezone.now, editable=False, db_index=True)  # 添加索引：用于时间查询
     watched_duration = models.FloatField(_('观看时长(秒)'), default=0)
     
     class Meta:
@@ -338,3 +398,31 @@ class VideoReport(models.Model):
     
     def __str__(self):
         return f"{self.reporter.username} 举报 {self.video.title}"
+
+
+class VideoFingerprint(models.Model):
+    """视频指纹：抽样帧的感知哈希，用于近似重复检测"""
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, related_name='fingerprint')
+    hashes = models.BinaryField(_('帧哈希'))  # 每帧 8 字节 pHash 依次拼接
+    frame_count = models.PositiveSmallIntegerField(_('帧数'), default=0)
+    matches = models.JSONField(_('近似重复'), default=list, blank=True, help_text='[{video_id, similarity, distance}]，按相似度从高到低')
+    created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('更新时间'), auto_now=True)
+    
+    class Meta:
+        verbose_name = _('视频指纹')
+        verbose_name_plural = _('视频指纹')
+    
+    def __str__(self):
+        return f"{self.video_id} ({self.frame_count} frames)"
+
+
+class FingerprintBand(models.Model):
+    """视频指纹倒排索引：每帧哈希切段后的索引键"""
+    fingerprint = models.ForeignKey(VideoFingerprint, on_delete=models.CASCADE, related_name='bands')
+    key = models.BigIntegerField(_('索引键'), db_index=True)
+    
+    class Meta:
+        verbose_name = _('指纹索引')
+        verbose_name_plural = _('指纹索引')
+        unique_together = ('fingerprint', 'key')
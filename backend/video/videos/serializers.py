@@ -1,5 +1,9 @@
+import os
+
+from django.urls import reverse
 from rest_framework import serializers
 from .models import Category, Tag, Video, VideoLike, Comment, VideoView, VideoCollection, VideoReport
+from .services.signing import TOKEN_PARAM, hls_key_from_file, mint_playback_token
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -141,7 +145,7 @@ class VideoCreateSerializer(serializers.ModelSerializer):
                   # 发布设置
                   'view_permission', 'comment_permission', 'allow_download', 
                   'enable_danmaku', 'show_in_profile', 'scheduled_publish_time', 
-                  'original_type')
+                  'original_type', 'hls_segment_format')
     
     def create(self, validated_data):
         tag_ids = validated_data.pop('tag_ids', [])
@@ -216,13 +220,14 @@ class VideoCreateSerializer(serializers.ModelSerializer):
 class VideoDetailSerializer(VideoSerializer):
     """视频详细信息序列化器"""
     hls_file = serializers.SerializerMethodField()
+    hls_url = serializers.SerializerMethodField()
     duration = serializers.FloatField(read_only=True)
     is_liked = serializers.SerializerMethodField()
     is_collected = serializers.SerializerMethodField()
     reviewer = UserBriefSerializer(read_only=True)
     
     class Meta(VideoSerializer.Meta):
-        fields = VideoSerializer.Meta.fields + ('hls_file', 'duration', 'is_liked', 'is_collected', 
+        fields = VideoSerializer.Meta.fields + ('hls_file', 'hls_url', 'preview_vtt', 'duration', 'is_liked', 'is_collected', 
                                                'reviewer', 'reviewed_at', 'review_remark')
     
     def get_hls_file(self, obj):
@@ -232,6 +237,22 @@ class VideoDetailSerializer(VideoSerializer):
             return obj.hls_file.replace('\\', '/')
         return None
     
+    def get_hls_url(self, obj):
+        """
+        带签名令牌的播放地址（master.m3u8），私密、粉丝可见视频的切片也需要通过这里访问
+        调用方已经检查过观看权限，这里直接签发令牌
+        """
+        hls_key = hls_key_from_file(obj.hls_file) if obj.hls_file else None
+        if not hls_key:
+            return None
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
+        viewer_id = user.id if user is not None and user.is_authenticated else None
+        
+        url = reverse('hls-media', args=[obj.id, hls_key, os.path.basename(obj.hls_file)])
+        url = f"{url}?{TOKEN_PARAM}={mint_playback_token(obj.id, hls_key, viewer_id=viewer_id)}"
+        return request.build_absolute_uri(url) if request else url
+    
     def get_is_liked(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
@@ -0,0 +1,4 @@
+"""
+视频服务层
+封装转码、HLS 播放列表等与视频文件处理相关的公共逻辑
+"""
@@ -0,0 +1,217 @@
+"""
+分段并行转码
+按关键帧把源视频切分为若干时间段，每段独立转码后再拼接为连续编号的 HLS 切片
+"""
+import os
+import json
+import math
+import shutil
+import subprocess
+import logging
+
+from .hls import (
+    build_video_encode_args,
+    build_hls_output_args,
+    HLS_SEGMENT_TIME,
+    SEGMENT_FORMAT_TS,
+    SEGMENT_FORMAT_FMP4,
+    FMP4_INIT_FILENAME,
+)
+
+logger = logging.getLogger(__name__)
+
+# 分段完成标记文件（断点续转）
+CHUNK_DONE_MARKER = '.done'
+CHUNKS_DIR_NAME = 'chunks'
+
+
+def probe_keyframe_times(video_file_path, read_duration=None):
+    """
+    获取视频流所有关键帧的时间戳（秒）
+
+    只读取 packet 信息，不解码画面；传入 read_duration 时只读取开头若干秒
+    """
+    probe_cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0',
+    ]
+    if read_duration:
+        probe_cmd.extend(['-read_intervals', f'%+{read_duration}'])
+    probe_cmd.append(video_file_path)
+
+    probe_process = subprocess.run(
+        probe_cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+
+    if probe_process.returncode != 0:
+        raise Exception(f"获取关键帧信息失败: {probe_process.stderr}")
+
+    keyframes = []
+    for line in probe_process.stdout.splitlines():
+        parts = line.strip().split(',')
+        if len(parts) < 2 or 'K' not in parts[1]:
+            continue
+        try:
+            keyframes.append(float(parts[0]))
+        except ValueError:
+            continue
+
+    return sorted(keyframes)
+
+
+def plan_chunks(keyframes, duration, chunk_duration):
+    """
+    按关键帧规划分段
+
+    每段起点都是关键帧，时长约为 chunk_duration；最后一段过短时并入前一段
+
+    Returns:
+        list: [{'index': 0, 'start': 0.0, 'end': 301.2}, ..., {'index': n, 'start': x, 'end': None}]
+        最后一段的 end 为 None，表示转码到文件结尾
+    """
+    boundaries = [0.0]
+    next_target = chunk_duration
+
+    for keyframe_time in keyframes:
+        if keyframe_time < next_target:
+            continue
+        # 剩余时长太短的不再单独成段
+        if duration and duration - keyframe_time < chunk_duration * 0.25:
+            break
+        boundaries.append(keyframe_time)
+        next_target = keyframe_time + chunk_duration
+
+    chunks = []
+    for index, start in enumerate(boundaries):
+        end = boundaries[index + 1] if index + 1 < len(boundaries) else None
+        chunks.append({'index': index, 'start': start, 'end': end})
+    return chunks
+
+
+def chunk_dir_for(rendition_dir, chunk):
+    """分段的输出目录，如 1080p/chunks/0003"""
+    return os.path.join(rendition_dir, CHUNKS_DIR_NAME, f"{chunk['index']:04d}")
+
+
+def build_chunk_command(video_file_path, output_dir, rung, video_codec, chunk, segment_format=SEGMENT_FORMAT_TS):
+    """
+    构建单个分段的转码命令
+
+    输入端 -ss 从关键帧开始读取，-output_ts_offset 保持时间戳与整段视频连续；
+    分段转码不支持 fMP4 单文件输出，调用方需改用 fmp4
+    """
+    start = chunk['start']
+    command = ['ffmpeg', '-y', '-ss', f'{start:.6f}', '-i', video_file_path]
+    if chunk['end'] is not None:
+        command.extend(['-t', f"{chunk['end'] - start:.6f}"])
+    command.extend([
+        '-map', '0:v:0',
+        *build_video_encode_args(rung, video_codec),
+        '-an',
+        '-output_ts_offset', f'{start:.6f}',
+        *build_hls_output_args(output_dir, segment_format),
+    ])
+    return command
+
+
+def is_chunk_complete(chunk_dir):
+    """分段是否已转码完成（存在完成标记）"""
+    return os.path.exists(os.path.join(chunk_dir, CHUNK_DONE_MARKER))
+
+
+def mark_chunk_complete(chunk_dir, chunk):
+    """写入分段完成标记，重试时跳过已完成的分段"""
+    with open(os.path.join(chunk_dir, CHUNK_DONE_MARKER), 'w') as f:
+        json.dump(chunk, f)
+
+
+def parse_media_playlist(m3u8_path):
+    """
+    解析子播放列表
+
+    Returns:
+        list: [(时长, 切片文件名), ...]
+    """
+    entries = []
+    pending_duration = None
+    with open(m3u8_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('#EXTINF:'):
+                pending_duration = float(line[len('#EXTINF:'):].split(',')[0])
+            elif line and not line.startswith('#') and pending_duration is not None:
+                entries.append((pending_duration, line))
+                pending_duration = None
+    return entries
+
+
+def move_chunk_file(source_path, target_path):
+    """移动分段产物；上次拼接中断时，部分文件可能已经移动过"""
+    if os.path.exists(source_path):
+        os.replace(source_path, target_path)
+    elif not os.path.exists(target_path):
+        raise Exception(f"切片丢失: {source_path}")
+
+
+def assemble_chunked_rendition(rendition_dir, chunks, segment_format=SEGMENT_FORMAT_TS):
+    """
+    把各分段的切片拼接为一个连续编号（segment_%03d.ts / .m4s）的 index.m3u8
+
+    fMP4 每个分段有自己的初始化段，拼接时改名为 init_0000.mp4 等，
+    并在分段边界插入 #EXT-X-DISCONTINUITY 和新的 #EXT-X-MAP。
+    切片通过重命名移动，不复制数据；全部完成后才删除分段目录
+    """
+    is_fmp4 = segment_format == SEGMENT_FORMAT_FMP4
+    extension = 'm4s' if is_fmp4 else 'ts'
+
+    segments = []
+    for chunk in chunks:
+        chunk_dir = chunk_dir_for(rendition_dir, chunk)
+        if not is_chunk_complete(chunk_dir):
+            raise Exception(f"分段 {chunk['index']} 尚未完成: {chunk_dir}")
+        for duration, filename in parse_media_playlist(os.path.join(chunk_dir, 'index.m3u8')):
+            segments.append((chunk, duration, os.path.join(chunk_dir, filename)))
+
+    if not segments:
+        raise Exception(f"没有可拼接的切片: {rendition_dir}")
+
+    lines = [
+        '#EXTM3U',
+        f'#EXT-X-VERSION:{7 if is_fmp4 else 3}',
+        f'#EXT-X-TARGETDURATION:{max(HLS_SEGMENT_TIME, math.ceil(max(d for _, d, _ in segments)))}',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+    ]
+    current_chunk = None
+    for number, (chunk, duration, source_path) in enumerate(segments):
+        if is_fmp4 and chunk is not current_chunk:
+            init_name = f"init_{chunk['index']:04d}.mp4"
+            move_chunk_file(
+                os.path.join(chunk_dir_for(rendition_dir, chunk), FMP4_INIT_FILENAME),
+                os.path.join(rendition_dir, init_name)
+            )
+            if current_chunk is not None:
+                lines.append('#EXT-X-DISCONTINUITY')
+            lines.append(f'#EXT-X-MAP:URI="{init_name}"')
+            current_chunk = chunk
+
+        segment_name = f'segment_{number:03d}.{extension}'
+        move_chunk_file(source_path, os.path.join(rendition_dir, segment_name))
+        lines.append(f'#EXTINF:{duration:.6f},')
+        lines.append(segment_name)
+    lines.append('#EXT-X-ENDLIST')
+
+    tmp_path = os.path.join(rendition_dir, 'index.m3u8.tmp')
+    with open(tmp_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, os.path.join(rendition_dir, 'index.m3u8'))
+
+    shutil.rmtree(os.path.join(rendition_dir, CHUNKS_DIR_NAME), ignore_errors=True)
+    logger.info(f"{rendition_dir} 拼接完成: {len(chunks)} 个分段，{len(segments)} 个切片")
+    return len(segments)
@@ -0,0 +1,132 @@
+"""
+媒体文件投递
+配置了前置服务器时通过 X-Accel-Redirect（nginx）或 X-Sendfile（Apache/lighttpd）交给服务器零拷贝发送，
+Django 只负责鉴权；没有前置服务器时由 FileResponse 发送（WSGI 服务器的 file_wrapper 使用 sendfile），支持单个 Range
+"""
+import os
+import re
+import mimetypes
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+
+DELIVERY_NGINX = 'nginx'
+DELIVERY_SENDFILE = 'sendfile'
+DELIVERY_DJANGO = 'django'
+
+# 切片内容不会变化，浏览器和 CDN 可以缓存一年
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+RANGE_READ_SIZE = 512 * 1024
+
+MEDIA_CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+    '.vtt': 'text/vtt; charset=utf-8',
+    '.srt': 'application/x-subrip; charset=utf-8',
+    '.jpg': 'image/jpeg',
+}
+
+_RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def media_content_type(path):
+    ext = os.path.splitext(path)[1].lower()
+    return MEDIA_CONTENT_TYPES.get(ext) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def parse_range(header, size):
+    """
+    解析 Range 请求头
+
+    Returns:
+        tuple | None: (起始, 结束) 闭区间；没有 Range、格式不支持或多段请求时返回 None（发送完整文件）
+
+    Raises:
+        RangeNotSatisfiable: 范围超出文件大小
+    """
+    match = _RANGE_PATTERN.match((header or '').strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        # bytes=-500：最后 500 字节
+        length = int(end)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def resolve_media_path(base_dir, relative_path):
+    """把请求路径解析为 base_dir 下的文件，路径越界或文件不存在时返回 None"""
+    base_dir = os.path.realpath(base_dir)
+    full_path = os.path.realpath(os.path.join(base_dir, relative_path))
+    if os.path.commonpath([base_dir, full_path]) != base_dir or not os.path.isfile(full_path):
+        return None
+    return full_path
+
+
+def _iter_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(RANGE_READ_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def media_response(request, path, cache_control):
+    """
+    发送 MEDIA_ROOT 下的文件
+
+    MEDIA_DELIVERY_BACKEND 为 nginx / sendfile 时只返回内部重定向头，Range 由前置服务器处理
+    """
+    backend = getattr(settings, 'MEDIA_DELIVERY_BACKEND', DELIVERY_DJANGO)
+    content_type = media_content_type(path)
+
+    if backend == DELIVERY_NGINX:
+        relative_path = os.path.relpath(path, settings.MEDIA_ROOT).replace('\\', '/')
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(f"{settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{relative_path}")
+    elif backend == DELIVERY_SENDFILE:
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+    else:
+        size = os.path.getsize(path)
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        if byte_range is None:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _iter_range(path, start, end - start + 1), status=206, content_type=content_type
+            )
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Accept-Ranges'] = 'bytes'
+
+    response['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,221 @@
+"""
+FFmpeg 进程执行
+通过 -progress pipe:1 实时解析转码进度，stderr 只保留最后若干行
+"""
+import time
+import queue
+import threading
+import subprocess
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# stderr 环形缓冲区保留的行数
+STDERR_TAIL_LINES = 200
+# 进度回调的最小间隔（秒）
+PROGRESS_INTERVAL = 2.0
+# 从 stdin_source 读取输入的块大小
+STDIN_READ_SIZE = 1024 * 1024
+
+
+class FFmpegError(Exception):
+    """FFmpeg 返回非零退出码"""
+
+    def __init__(self, returncode, stderr_tail):
+        self.returncode = returncode
+        self.stderr_tail = stderr_tail
+        super().__init__(f"FFmpeg 退出码 {returncode}")
+
+    def error_summary(self, lines=20):
+        """最后若干行错误输出"""
+        return '\n'.join(self.stderr_tail[-lines:])
+
+
+def with_progress_args(command):
+    """在 ffmpeg 后插入 -progress pipe:1 -nostats，让进度以 key=value 形式输出到 stdout"""
+    return [command[0], '-progress', 'pipe:1', '-nostats', *command[1:]]
+
+
+def parse_out_time(values):
+    """从进度字段中取出已处理的时长（秒）"""
+    # out_time_ms 实际单位也是微秒
+    for key in ('out_time_us', 'out_time_ms'):
+        raw = values.get(key)
+        if raw and raw.lstrip('-').isdigit():
+            return max(0.0, int(raw) / 1_000_000)
+
+    raw = values.get('out_time')
+    if raw and ':' in raw:
+        try:
+            hours, minutes, seconds = raw.split(':')
+            return max(0.0, int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+        except ValueError:
+            pass
+    return None
+
+
+def build_progress_snapshot(values, duration, elapsed):
+    """
+    根据一组进度字段计算进度快照
+
+    Returns:
+        dict: {'out_time', 'speed', 'fps', 'percent', 'eta', 'elapsed'}
+    """
+    out_time = parse_out_time(values)
+
+    speed = None
+    raw_speed = (values.get('speed') or '').strip().rstrip('x')
+    try:
+        speed = float(raw_speed) if raw_speed and raw_speed != 'N/A' else None
+    except ValueError:
+        speed = None
+
+    fps = None
+    try:
+        fps = float(values['fps']) if values.get('fps') else None
+    except ValueError:
+        fps = None
+
+    percent = None
+    eta = None
+    if duration and out_time is not None:
+        percent = min(100.0, round(out_time / duration * 100, 1))
+        if speed:
+            eta = max(0, int((duration - out_time) / speed))
+        elif out_time > 0:
+            eta = max(0, int(elapsed * (duration - out_time) / out_time))
+
+    return {
+        'out_time': round(out_time, 2) if out_time is not None else None,
+        'speed': speed,
+        'fps': fps,
+        'percent': percent,
+        'eta': eta,
+        'elapsed': round(elapsed, 2),
+    }
+
+
+def run_ffmpeg(command, duration=None, on_progress=None,
+               progress_interval=PROGRESS_INTERVAL, stderr_lines=STDERR_TAIL_LINES, stdin_source=None):
+    """
+    执行 FFmpeg 命令并实时回报进度
+
+    stdout（进度）和 stderr（日志）各由一个线程读取（Windows 的 select 不支持管道），stderr 只保留最后 stderr_lines 行。
+    进度回调在调用线程中执行（Celery 的 task.request 是线程局部的）
+
+    Args:
+        command: FFmpeg 命令（不含 -progress 参数）
+        duration: 源视频时长（秒），用于计算百分比和剩余时间
+        on_progress: 进度回调 callback(snapshot)，最多每 progress_interval 秒调用一次
+        progress_interval: 进度回调最小间隔（秒）
+        stderr_lines: stderr 环形缓冲区行数
+        stdin_source: 带 read(size) 方法的输入，由后台线程写入 FFmpeg 的 stdin（命令中用 -i pipe:0）
+
+    Returns:
+        dict: {'elapsed': 耗时, 'stderr_tail': 最后若干行 stderr}
+
+    Raises:
+        FFmpegError: FFmpeg 返回非零退出码
+        stdin_source.read 抛出的异常（此时 FFmpeg 进程被终止）
+    """
+    start_time = time.time()
+    stderr_tail = deque(maxlen=stderr_lines)
+    values = {}
+    last_report = 0.0
+
+    process = subprocess.Popen(
+        with_progress_args(command),
+        stdin=subprocess.DEVNULL if stdin_source is None else subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    feed_error = []
+
+    def feed_stdin():
+        try:
+            while True:
+                data = stdin_source.read(STDIN_READ_SIZE)
+                if not data:
+                    break
+                process.stdin.write(data)
+        except BrokenPipeError:
+            # FFmpeg 提前退出，退出码由主线程处理
+            pass
+        except Exception as e:
+            feed_error.append(e)
+            process.kill()
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    if stdin_source is not None:
+        threading.Thread(target=feed_stdin, daemon=True).start()
+
+    # 读取线程解析出的进度快照，None 表示 stdout 已关闭
+    snapshots = queue.Queue()
+
+    def read_progress():
+        nonlocal last_report
+        try:
+            for line in process.stdout:
+                key, sep, value = line.decode('utf-8', errors='replace').partition('=')
+                if not sep:
+                    continue
+                key, value = key.strip(), value.strip()
+                values[key] = value
+
+                # 每组进度字段以 progress=continue/end 结尾
+                if key != 'progress' or on_progress is None:
+                    continue
+                now = time.time()
+                if value == 'end' or now - last_report >= progress_interval:
+                    last_report = now
+                    snapshots.put(build_progress_snapshot(values, duration, now - start_time))
+        finally:
+            snapshots.put(None)
+
+    def read_stderr():
+        for line in process.stderr:
+            text = line.decode('utf-8', errors='replace').rstrip('\r\n')
+            if text:
+                stderr_tail.append(text)
+
+    readers = [
+        threading.Thread(target=read_progress, daemon=True),
+        threading.Thread(target=read_stderr, daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    try:
+        while True:
+            snapshot = snapshots.get()
+            if snapshot is None:
+                break
+            try:
+                on_progress(snapshot)
+            except Exception as e:
+                logger.warning(f"进度回调失败: {e}")
+        returncode = process.wait()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        # 进程退出后管道关闭，读取线程随之结束
+        for reader in readers:
+            reader.join()
+        process.stdout.close()
+        process.stderr.close()
+
+    # 输入读取失败时 feed_stdin 先记录异常再终止 FFmpeg，这里不等待线程结束（它可能正阻塞在等待上传数据）
+    if feed_error:
+        raise feed_error[0]
+    if returncode != 0:
+        raise FFmpegError(returncode, list(stderr_tail))
+
+    return {'elapsed': time.time() - start_time, 'stderr_tail': list(stderr_tail)}
@@ -0,0 +1,199 @@
+"""
+视频指纹与近似重复检测
+一次 FFmpeg 调用抽取若干 32x32 灰度帧，用 NumPy 批量计算 64 位感知哈希（pHash），打包为字节串存储；
+每个哈希切成若干段建立倒排索引，先按段精确匹配找出候选视频，再按 Hamming 距离精确比较
+"""
+import subprocess
+import logging
+
+import numpy as np
+from django.db.models import Count
+
+from ..models import VideoFingerprint, FingerprintBand
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_FRAMES = 16
+DCT_SIZE = 32
+# 取 8x8 低频 DCT 系数，每帧 64 位
+HASH_SIZE = 8
+HASH_BYTES = HASH_SIZE * HASH_SIZE // 8
+
+# 64 位哈希切成 4 段，每段 16 位；Hamming 距离不超过 3 的两个哈希至少有一段完全相同
+BAND_COUNT = 4
+BAND_BYTES = HASH_BYTES // BAND_COUNT
+BAND_BITS = BAND_BYTES * 8
+
+# 单帧 Hamming 距离不超过该值视为同一画面（重新编码、轻微裁剪、水印）
+FRAME_MATCH_DISTANCE = 10
+# 候选视频至少命中的索引段数量
+MIN_BAND_HITS = 2
+MAX_CANDIDATES = 50
+# 至少这个比例的帧能在对方视频中找到相近帧，才视为近似重复
+MIN_MATCH_RATIO = 0.6
+
+
+def _dct_matrix(n):
+    """正交 DCT-II 变换矩阵"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+DCT_MATRIX = _dct_matrix(DCT_SIZE)
+
+
+def extract_fingerprint_frames(video_file_path, duration, count=FINGERPRINT_FRAMES):
+    """
+    一次解码抽取指纹帧
+
+    只解码关键帧，按固定间隔挑选，缩放为 32x32 灰度后以 rawvideo 输出到管道，不落盘
+
+    Returns:
+        np.ndarray: (K, 32, 32) uint8
+    """
+    step = duration / count if duration > 0 else 1
+    command = [
+        'ffmpeg',
+        '-v', 'error',
+        '-skip_frame', 'nokey',
+        '-i', video_file_path,
+        '-map', '0:v:0',
+        '-an',
+        '-vf', (
+            f"select='isnan(prev_selected_t)+gte(t-prev_selected_t,{step:.3f})',"
+            f"scale={DCT_SIZE}:{DCT_SIZE},format=gray"
+        ),
+        '-vsync', 'vfr',
+        '-frames:v', str(count),
+        '-f', 'rawvideo',
+        'pipe:1',
+    ]
+    result = subprocess.run(command, check=True, capture_output=True)
+
+    frame_bytes = DCT_SIZE * DCT_SIZE
+    usable = len(result.stdout) // frame_bytes * frame_bytes
+    return np.frombuffer(result.stdout[:usable], dtype=np.uint8).reshape(-1, DCT_SIZE, DCT_SIZE)
+
+
+def phash_frames(frames):
+    """
+    批量计算感知哈希
+
+    二维 DCT 后取左上角 8x8 低频系数，与中位数（不含直流分量）比较得到 64 位
+
+    Args:
+        frames: 灰度图数组 (K, 32, 32)
+
+    Returns:
+        np.ndarray: (K, 8) uint8，每行是一帧打包后的 64 位哈希
+    """
+    coefficients = DCT_MATRIX @ frames.astype(np.float32) @ DCT_MATRIX.T
+    low = coefficients[:, :HASH_SIZE, :HASH_SIZE].reshape(len(frames), -1)
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    return np.packbits(low > median, axis=1)
+
+
+def pack_hashes(hashes):
+    """哈希数组转为字节串存储"""
+    return np.ascontiguousarray(hashes, dtype=np.uint8).tobytes()
+
+
+def unpack_hashes(data):
+    """字节串还原为 (K, 8) 哈希数组"""
+    return np.frombuffer(bytes(data), dtype=np.uint8).reshape(-1, HASH_BYTES)
+
+
+def band_keys(hashes):
+    """
+    计算倒排索引键：每帧哈希切成 BAND_COUNT 段，段号放在高位，避免不同位置的段相互匹配
+
+    Returns:
+        list: 去重后的索引键
+    """
+    if not len(hashes):
+        return []
+    bands = hashes.reshape(len(hashes), BAND_COUNT, BAND_BYTES).astype(np.int64)
+    values = np.zeros(bands.shape[:2], dtype=np.int64)
+    for offset in range(BAND_BYTES):
+        values = (values << 8) | bands[..., offset]
+    keys = (np.arange(BAND_COUNT, dtype=np.int64) << BAND_BITS) | values
+    return sorted(set(keys.ravel().tolist()))
+
+
+def hamming_matrix(a, b):
+    """两组哈希两两之间的 Hamming 距离，(K, 8) 与 (M, 8) 得到 (K, M)"""
+    xor = np.bitwise_xor(a[:, None, :], b[None, :, :])
+    return np.unpackbits(xor, axis=2).sum(axis=2)
+
+
+def compare_fingerprints(a, b):
+    """
+    比较两个视频指纹
+
+    每一帧取对方视频中最相近的帧，不要求时间位置对齐，片头片尾被剪掉也能匹配
+
+    Returns:
+        dict: {'similarity': 找到相近帧的比例, 'distance': 相近帧的平均 Hamming 距离}
+    """
+    if not len(a) or not len(b):
+        return {'similarity': 0.0, 'distance': float(HASH_BYTES * 8)}
+
+    nearest = hamming_matrix(a, b).min(axis=1)
+    matched = nearest <= FRAME_MATCH_DISTANCE
+    distance = nearest[matched].mean() if matched.any() else HASH_BYTES * 8
+    return {
+        'similarity': round(float(matched.mean()), 3),
+        'distance': round(float(distance), 2),
+    }
+
+
+def save_fingerprint(video, hashes):
+    """保存视频指纹并重建其倒排索引"""
+    fingerprint, _ = VideoFingerprint.objects.update_or_create(
+        video=video,
+        defaults={'hashes': pack_hashes(hashes), 'frame_count': len(hashes)},
+    )
+    fingerprint.bands.all().delete()
+    FingerprintBand.objects.bulk_create([
+        FingerprintBand(fingerprint=fingerprint, key=key) for key in band_keys(hashes)
+    ])
+    return fingerprint
+
+
+def find_near_duplicates(fingerprint, hashes=None):
+    """
+    查找近似重复的视频
+
+    先在倒排索引中找出命中段数最多的候选，只对候选计算 Hamming 距离，不扫描全部指纹
+
+    Returns:
+        list: [{'video_id', 'similarity', 'distance'}, ...]，按相似度从高到低
+    """
+    if hashes is None:
+        hashes = unpack_hashes(fingerprint.hashes)
+    keys = band_keys(hashes)
+    if not keys:
+        return []
+
+    candidates = (
+        FingerprintBand.objects
+        .filter(key__in=keys)
+        .exclude(fingerprint_id=fingerprint.id)
+        .values('fingerprint_id')
+        .annotate(hits=Count('id'))
+        .filter(hits__gte=MIN_BAND_HITS)
+        .order_by('-hits')[:MAX_CANDIDATES]
+    )
+    candidate_ids = [candidate['fingerprint_id'] for candidate in candidates]
+
+    matches = []
+    for other in VideoFingerprint.objects.filter(id__in=candidate_ids).only('video_id', 'hashes'):
+        result = compare_fingerprints(hashes, unpack_hashes(other.hashes))
+        if result['similarity'] >= MIN_MATCH_RATIO:
+            matches.append({'video_id': other.video_id, **result})
+
+    matches.sort(key=lambda item: (-item['similarity'], item['distance']))
+    return matches
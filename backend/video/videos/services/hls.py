@@ -0,0 +1,280 @@
+"""
+HLS 转码公共逻辑
+包括分辨率阶梯选择、FFmpeg 参数构建、master.m3u8 生成和完整性检查
+"""
+import os
+import re
+import logging
+
+from .playlist_cache import read_playlist
+
+logger = logging.getLogger(__name__)
+
+
+# 转码分辨率 (宽, 高, 预估带宽用于m3u8, CRF值)
+# CRF 值越小质量越高：18-23 是视觉无损范围
+STANDARD_RESOLUTIONS = [
+    (3840, 2160, 15000, 22),
+    (2560, 1440, 8000, 22),
+    (1920, 1080, 5000, 23),
+    (1280, 720, 2800, 23),
+    (854, 480, 1400, 24),
+    (640, 360, 800, 25),
+]
+
+# 共享音频轨道
+AUDIO_GROUP_ID = 'audio'
+AUDIO_RENDITION_NAME = 'audio'
+AUDIO_BITRATE = 128  # kbps
+
+# HLS 切片时长（秒）
+HLS_SEGMENT_TIME = 6
+
+# 切片格式
+# ts: MPEG-TS 切片（segment_%03d.ts）
+# fmp4: CMAF/fMP4 切片（init.mp4 + segment_%03d.m4s）
+# fmp4_single: 每个分辨率一个 fMP4 文件（stream.mp4），播放列表使用 #EXT-X-BYTERANGE
+SEGMENT_FORMAT_TS = 'ts'
+SEGMENT_FORMAT_FMP4 = 'fmp4'
+SEGMENT_FORMAT_FMP4_SINGLE = 'fmp4_single'
+SEGMENT_FORMATS = (SEGMENT_FORMAT_TS, SEGMENT_FORMAT_FMP4, SEGMENT_FORMAT_FMP4_SINGLE)
+FMP4_INIT_FILENAME = 'init.mp4'
+FMP4_SINGLE_FILENAME = 'stream.mp4'
+SEGMENT_EXTENSIONS = ('.ts', '.m4s', '.mp4')
+
+# 直接复制视频流（不重新编码）的条件
+# 源视频已经是 HLS 兼容的 H.264 且分辨率恰好等于某个分辨率时，该分辨率只做切片
+PASSTHROUGH_PROFILES = ('High', 'Main', 'Constrained Baseline')
+PASSTHROUGH_PIX_FMTS = ('yuv420p', 'yuvj420p')
+PASSTHROUGH_MAX_LEVEL = 42  # 4.2
+PASSTHROUGH_MAX_KEYFRAME_INTERVAL = HLS_SEGMENT_TIME  # 秒
+PASSTHROUGH_MAX_BITRATE_RATIO = 1.5  # 源码率最多为该分辨率预估带宽的倍数
+
+# master.m3u8 中引用的子播放列表，如 1080p/index.m3u8、audio/index.m3u8
+RENDITION_PLAYLIST_PATTERN = re.compile(r'([0-9A-Za-z_]+)/index\.m3u8')
+
+
+def select_resolutions(width, height):
+    """
+    根据源视频分辨率选择需要生成的分辨率阶梯
+
+    Returns:
+        list: [{'width', 'height', 'bitrate', 'crf'}, ...]，按分辨率从高到低排列
+    """
+    src_short_side = min(width, height)
+    resolutions = [
+        {'width': w, 'height': h, 'bitrate': b, 'crf': crf}
+        for w, h, b, crf in STANDARD_RESOLUTIONS
+        if min(w, h) <= src_short_side
+    ]
+
+    if not resolutions:
+        bitrate = max(800, int(height * width / 1000))
+        resolutions = [{'width': width, 'height': height, 'bitrate': bitrate, 'crf': 23}]
+
+    return resolutions
+
+
+def rendition_name(rung):
+    """分辨率对应的子目录名，如 1080p"""
+    return f"{rung['height']}p"
+
+
+def find_passthrough_rung(resolutions, source):
+    """
+    查找可以直接复制源视频流的分辨率（不检查关键帧间隔）
+
+    Args:
+        resolutions: 分辨率阶梯
+        source: 源视频流信息 {'video_codec', 'profile', 'pix_fmt', 'level', 'width', 'height', 'video_bitrate'}
+
+    Returns:
+        dict | None: 分辨率与源视频完全一致且编码兼容时返回该分辨率
+    """
+    if source.get('video_codec') != 'h264':
+        return None
+    if source.get('profile') not in PASSTHROUGH_PROFILES:
+        return None
+    if source.get('pix_fmt') not in PASSTHROUGH_PIX_FMTS:
+        return None
+    if not source.get('level') or source['level'] > PASSTHROUGH_MAX_LEVEL:
+        return None
+
+    for rung in resolutions:
+        if rung['width'] != source.get('width') or rung['height'] != source.get('height'):
+            continue
+        video_bitrate = source.get('video_bitrate') or 0
+        if video_bitrate > rung['bitrate'] * PASSTHROUGH_MAX_BITRATE_RATIO:
+            return None
+        return rung
+    return None
+
+
+def build_video_encode_args(rung, video_codec):
+    """
+    构建单个分辨率的视频编码参数
+
+    直通分辨率直接复制视频流；
+    VP9 视频可能是 10-bit，使用 H.265 保留色深，其余使用 H.264
+    """
+    if rung.get('passthrough'):
+        return ['-c:v', 'copy']
+
+    res_width, res_height = rung['width'], rung['height']
+    bitrate, crf = rung['bitrate'], rung['crf']
+    scale_filter = (
+        f'scale={res_width}:{res_height}:force_original_aspect_ratio=decrease,'
+        f'pad={res_width}:{res_height}:(ow-iw)/2:(oh-ih)/2'
+    )
+
+    if video_codec == 'vp9':
+        return [
+            '-c:v', 'libx265',
+            '-preset', 'fast',
+            '-crf', str(crf),
+            '-maxrate', f'{bitrate}k',
+            '-bufsize', f'{bitrate * 2}k',
+            '-vf', scale_filter,
+            '-tag:v', 'hvc1',
+        ]
+
+    return [
+        '-c:v', 'libx264',
+        '-preset', 'fast',
+        '-crf', str(crf),
+        '-maxrate', f'{bitrate}k',
+        '-bufsize', f'{bitrate * 2}k',
+        '-pix_fmt', 'yuv420p',
+        '-vf', scale_filter,
+        '-profile:v', 'high',
+        '-level', '4.0',
+    ]
+
+
+def build_audio_encode_args():
+    """AAC 音频编码参数"""
+    return ['-c:a', 'aac', '-b:a', f'{AUDIO_BITRATE}k']
+
+
+def build_hls_output_args(output_dir, segment_format=SEGMENT_FORMAT_TS):
+    """构建 HLS 切片输出参数（VOD 播放列表）"""
+    args = [
+        '-start_number', '0',
+        '-hls_time', str(HLS_SEGMENT_TIME),
+        '-hls_list_size', '0',
+        '-hls_playlist_type', 'vod',
+    ]
+
+    if segment_format == SEGMENT_FORMAT_FMP4:
+        args.extend([
+            '-hls_segment_type', 'fmp4',
+            '-hls_fmp4_init_filename', FMP4_INIT_FILENAME,
+            '-hls_segment_filename', os.path.join(output_dir, 'segment_%03d.m4s'),
+        ])
+    elif segment_format == SEGMENT_FORMAT_FMP4_SINGLE:
+        args.extend([
+            '-hls_segment_type', 'fmp4',
+            '-hls_flags', 'single_file',
+            '-hls_segment_filename', os.path.join(output_dir, FMP4_SINGLE_FILENAME),
+        ])
+    else:
+        args.extend(['-hls_segment_filename', os.path.join(output_dir, 'segment_%03d.ts')])
+
+    args.append(os.path.join(output_dir, 'index.m3u8'))
+    return args
+
+
+def build_rendition_command(video_file_path, output_dir, rung, video_codec, segment_format=SEGMENT_FORMAT_TS):
+    """
+    构建单个视频分辨率的独立转码命令（仅视频流，音频由共享音轨提供）
+    """
+    return [
+        'ffmpeg', '-y',
+        '-i', video_file_path,
+        '-map', '0:v:0',
+        *build_video_encode_args(rung, video_codec),
+        '-an',
+        *build_hls_output_args(output_dir, segment_format),
+    ]
+
+
+def build_audio_command(video_file_path, output_dir, segment_format=SEGMENT_FORMAT_TS):
+    """构建共享音频轨道的独立转码命令"""
+    return [
+        'ffmpeg', '-y',
+        '-i', video_file_path,
+        '-map', '0:a:0',
+        '-vn',
+        *build_audio_encode_args(),
+        *build_hls_output_args(output_dir, segment_format),
+    ]
+
+
+def write_master_playlist(master_m3u8_path, resolutions, has_shared_audio=False,
+                          segment_format=SEGMENT_FORMAT_TS):
+    """
+    生成 master.m3u8
+
+    Args:
+        master_m3u8_path: master.m3u8 路径
+        resolutions: 分辨率阶梯
+        has_shared_audio: 是否引用独立的共享音频轨道（audio/index.m3u8）
+        segment_format: 切片格式，fMP4 需要 EXT-X-VERSION:7
+    """
+    version = 3 if segment_format == SEGMENT_FORMAT_TS else 7
+    lines = ['#EXTM3U', f'#EXT-X-VERSION:{version}']
+
+    if has_shared_audio:
+        lines.append(
+            f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="{AUDIO_GROUP_ID}",NAME="default",'
+            f'DEFAULT=YES,AUTOSELECT=YES,URI="{AUDIO_RENDITION_NAME}/index.m3u8"'
+        )
+
+    for rung in resolutions:
+        stream_inf = f"#EXT-X-STREAM-INF:BANDWIDTH={rung['bitrate']}000,RESOLUTION={rung['width']}x{rung['height']}"
+        if has_shared_audio:
+            # 带宽需要包含音频码率
+            stream_inf = (
+                f"#EXT-X-STREAM-INF:BANDWIDTH={(rung['bitrate'] + AUDIO_BITRATE) * 1000},"
+                f"RESOLUTION={rung['width']}x{rung['height']},AUDIO=\"{AUDIO_GROUP_ID}\""
+            )
+        lines.append(stream_inf)
+        lines.append(f'{rendition_name(rung)}/index.m3u8')
+
+    with open(master_m3u8_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def is_rendition_complete(rendition_dir):
+    """检查单个分辨率（或音轨）的 index.m3u8 是否存在且至少引用了一个切片（.ts/.m4s/单文件 .mp4）"""
+    playlist = read_playlist(os.path.join(rendition_dir, 'index.m3u8'))
+    if playlist is None:
+        return False
+    return any(
+        line.strip().endswith(SEGMENT_EXTENSIONS)
+        for line in playlist['content'].splitlines()
+        if not line.startswith('#')
+    )
+
+
+def check_hls_integrity(hls_dir):
+    """
+    检查 HLS 目录是否完整：master.m3u8 引用的每个子播放列表都存在且有切片
+
+    Returns:
+        tuple: (is_complete: bool, missing: list)
+    """
+    master = read_playlist(os.path.join(hls_dir, 'master.m3u8'))
+    if master is None:
+        return False, ['master.m3u8']
+
+    renditions = RENDITION_PLAYLIST_PATTERN.findall(master['content'])
+
+    if not renditions:
+        return False, ['master.m3u8']
+
+    missing = [
+        name for name in dict.fromkeys(renditions)
+        if not is_rendition_complete(os.path.join(hls_dir, name))
+    ]
+    return not missing, missing
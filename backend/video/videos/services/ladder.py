@@ -0,0 +1,119 @@
+"""
+按内容复杂度选择转码阶梯
+对几个采样片段做低分辨率 CRF 试编码，用产出码率估计画面复杂度，据此调整每个分辨率的码率、CRF 和取舍
+"""
+import os
+import subprocess
+import tempfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 试编码参数：360p、CRF 23、ultrafast
+PROBE_HEIGHT = 360
+PROBE_CRF = 23
+PROBE_WINDOWS = 3
+PROBE_WINDOW_SECONDS = 4
+
+# 普通内容在试编码参数下的参考码率（kbps），复杂度 = 实测码率 / 参考码率
+REFERENCE_PROBE_KBPS = 900
+
+# 复杂度系数的范围
+MIN_COMPLEXITY = 0.3
+MAX_COMPLEXITY = 1.6
+
+# 相邻两档码率至少相差的倍数，差距不足的中间档位对画质没有明显提升，直接跳过
+# 画面越简单，相邻分辨率之间的可见差异越小，实际要求的倍数为 MIN_LADDER_STEP / 复杂度
+MIN_LADDER_STEP = 1.5
+
+# 每档的最低码率（kbps）
+MIN_RUNG_BITRATE = 200
+
+
+def sample_window_starts(duration, windows=PROBE_WINDOWS, window_seconds=PROBE_WINDOW_SECONDS):
+    """在视频中均匀选取采样片段的起点（避开片头片尾）"""
+    if duration <= window_seconds:
+        return [0.0]
+    usable = duration - window_seconds
+    return [round(usable * (i + 1) / (windows + 1), 3) for i in range(windows)]
+
+
+def probe_complexity(video_file_path, duration):
+    """
+    估计视频画面复杂度
+
+    每个采样片段单独做一次 360p CRF 试编码，统计总输出大小换算成码率
+
+    Returns:
+        float: 复杂度系数，1.0 表示普通内容，小于 1 表示静态/简单画面
+    """
+    total_bytes = 0
+    total_seconds = 0.0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for index, start in enumerate(sample_window_starts(duration)):
+            window = min(PROBE_WINDOW_SECONDS, duration - start) if duration else PROBE_WINDOW_SECONDS
+            output_path = os.path.join(tmp_dir, f'probe_{index}.ts')
+            command = [
+                'ffmpeg', '-y',
+                '-ss', f'{start:.3f}',
+                '-i', video_file_path,
+                '-t', f'{window:.3f}',
+                '-map', '0:v:0',
+                '-an',
+                '-vf', f'scale=-2:{PROBE_HEIGHT}',
+                '-c:v', 'libx264',
+                '-preset', 'ultrafast',
+                '-crf', str(PROBE_CRF),
+                '-f', 'mpegts',
+                output_path,
+            ]
+            subprocess.run(command, check=True, capture_output=True)
+            total_bytes += os.path.getsize(output_path)
+            total_seconds += window
+
+    if total_seconds <= 0:
+        return 1.0
+
+    probe_kbps = total_bytes * 8 / 1000 / total_seconds
+    complexity = probe_kbps / REFERENCE_PROBE_KBPS
+    logger.info(f"试编码码率 {probe_kbps:.0f}kbps，复杂度系数 {complexity:.2f}")
+    return max(MIN_COMPLEXITY, min(MAX_COMPLEXITY, complexity))
+
+
+def build_content_aware_ladder(resolutions, complexity):
+    """
+    按复杂度调整分辨率阶梯
+
+    - 码率按复杂度系数缩放
+    - 简单画面 CRF 降低 1（画质提升代价很小），复杂画面 CRF 提高 1（避免一直顶着码率上限）
+    - 最高和最低分辨率总是保留，中间档位与上一个保留档位的码率差距不足要求倍数时跳过
+
+    Returns:
+        list: 新的分辨率阶梯
+    """
+    crf_delta = 0
+    if complexity < 0.5:
+        crf_delta = -1
+    elif complexity > 1.2:
+        crf_delta = 1
+
+    scaled = [
+        {
+            **rung,
+            'bitrate': max(MIN_RUNG_BITRATE, int(rung['bitrate'] * complexity)),
+            'crf': rung['crf'] + crf_delta,
+        }
+        for rung in resolutions
+    ]
+
+    if len(scaled) <= 2:
+        return scaled
+
+    required_step = MIN_LADDER_STEP / min(complexity, 1.0)
+    ladder = [scaled[0]]
+    for rung in scaled[1:-1]:
+        if ladder[-1]['bitrate'] >= rung['bitrate'] * required_step:
+            ladder.append(rung)
+    ladder.append(scaled[-1])
+    return ladder
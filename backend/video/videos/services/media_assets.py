@@ -0,0 +1,254 @@
+"""
+全局内容去重
+相同内容（MD5 + 文件大小）的上传共用一份源文件和 HLS 转码结果，删除视频时按引用计数释放文件
+"""
+import os
+import shutil
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from ..models import MediaAsset
+from .playlist_cache import invalidate_playlists
+from .subtitles import remove_subtitle_files
+
+logger = logging.getLogger(__name__)
+
+# 转码完成后记录到资源上、关联视频直接复用的字段
+SHARED_VIDEO_FIELDS = (
+    'duration', 'resolution', 'width', 'height', 'aspect_ratio',
+    'video_codec', 'audio_codec', 'bitrate', 'video_bitrate', 'audio_bitrate',
+    'frame_rate', 'file_size', 'hls_segment_format', 'preview_vtt',
+    'encoding_ladder', 'thumbnail_candidates', 'probe_data',
+)
+
+
+def source_exists(asset):
+    """共享资源的源文件是否还在磁盘上"""
+    return os.path.exists(os.path.join(settings.MEDIA_ROOT, asset.video_file))
+
+
+def find_asset(file_md5, file_size):
+    """按 MD5 + 文件大小查找源文件仍存在的共享资源"""
+    try:
+        asset = MediaAsset.objects.filter(file_md5=file_md5.lower(), file_size=int(file_size)).first()
+    except (TypeError, ValueError):
+        return None
+    if asset and source_exists(asset):
+        return asset
+    return None
+
+
+def find_instant_asset(file_md5, file_size):
+    """
+    查找可以秒传的共享资源
+
+    客户端只提供了 MD5，无法证明持有文件内容，所以只对已公开发布过的内容秒传；
+    私密内容仍需上传分片，由服务端校验哈希后在合并时复用转码结果
+    """
+    asset = find_asset(file_md5, file_size)
+    if asset is None or asset.status != 'ready' or not asset.hls_file:
+        return None
+    if not os.path.exists(os.path.join(settings.MEDIA_ROOT, asset.hls_file)):
+        return None
+
+    is_public = asset.videos.filter(
+        view_permission='public',
+        status='approved',
+        is_published=True,
+        deleted_at__isnull=True,
+    ).exists()
+    return asset if is_public else None
+
+
+def register_asset(file_md5, file_size, sha256, video_file):
+    """
+    登记新上传的源文件，引用计数从 1 开始（调用方随后创建关联视频）
+
+    同一内容的旧记录源文件已丢失时，改为指向新文件并重新转码
+    """
+    asset, created = MediaAsset.objects.get_or_create(
+        file_md5=file_md5.lower(),
+        file_size=int(file_size),
+        defaults={'sha256': sha256, 'video_file': video_file, 'ref_count': 1},
+    )
+    if not created:
+        MediaAsset.objects.filter(id=asset.id).update(
+            sha256=sha256,
+            video_file=video_file,
+            hls_file=None,
+            thumbnail='',
+            media_info={},
+            status='uploaded',
+            transcoding_video=None,
+            ref_count=F('ref_count') + 1,
+        )
+        asset.refresh_from_db()
+    return asset
+
+
+def retain_asset(asset):
+    """
+    新视频关联到共享资源，引用计数加一（在调用方创建视频的事务中调用）
+
+    加锁重新读取资源，与 release_asset 互斥：查找之后资源可能已被最后一个视频释放、文件正在删除
+
+    Returns:
+        MediaAsset | None: 加锁读取的资源，已被删除时返回 None，调用方按没有共享资源处理
+    """
+    locked = MediaAsset.objects.select_for_update().filter(id=asset.id).first()
+    if locked is None:
+        return None
+    locked.ref_count = F('ref_count') + 1
+    locked.save(update_fields=['ref_count'])
+    locked.refresh_from_db(fields=['ref_count'])
+    return locked
+
+
+def release_asset(asset_id):
+    """
+    视频不再使用共享资源，引用计数减一
+
+    Returns:
+        tuple: (asset, released)，released 为 True 表示已没有引用、记录已删除，调用方负责删除文件
+    """
+    with transaction.atomic():
+        asset = MediaAsset.objects.select_for_update().filter(id=asset_id).first()
+        if asset is None:
+            return None, True
+        if asset.ref_count > 1:
+            asset.ref_count -= 1
+            asset.save(update_fields=['ref_count'])
+            return asset, False
+        asset.delete()
+        return asset, True
+
+
+def claim_asset_transcode(asset, video):
+    """
+    由当前视频负责共享资源的转码
+
+    资源已由其他视频转码中时返回 False，当前视频等待其完成后直接复用结果
+    """
+    return MediaAsset.objects.filter(id=asset.id).filter(
+        Q(status='uploaded') |
+        Q(status='processing', transcoding_video_id=video.id) |
+        Q(status='processing', transcoding_video__isnull=True)
+    ).update(status='processing', transcoding_video=video) > 0
+
+
+def abandon_asset_transcode(video_id):
+    """
+    负责转码的视频最终失败，资源回到已上传状态
+
+    Returns:
+        list: 等待该资源的视频 ID，调用方重新分发处理任务
+    """
+    asset = MediaAsset.objects.filter(transcoding_video_id=video_id, status='processing').first()
+    if asset is None:
+        return []
+    MediaAsset.objects.filter(id=asset.id, transcoding_video_id=video_id).update(
+        status='uploaded', transcoding_video=None
+    )
+    return list(
+        asset.videos.filter(status='processing', hls_file__isnull=True)
+        .exclude(id=video_id)
+        .values_list('id', flat=True)
+    )
+
+
+def apply_asset_to_video(video, asset):
+    """把共享资源的转码结果写到视频上，视频进入待审核状态"""
+    video.hls_file = asset.hls_file
+    for name in SHARED_VIDEO_FIELDS:
+        if name in asset.media_info:
+            setattr(video, name, asset.media_info[name])
+
+    update_fields = ['hls_file', 'status', *[name for name in SHARED_VIDEO_FIELDS if name in asset.media_info]]
+    has_user_thumbnail = video.thumbnail and os.path.exists(os.path.join(settings.MEDIA_ROOT, video.thumbnail.name))
+    if not has_user_thumbnail and asset.thumbnail:
+        video.thumbnail = asset.thumbnail
+        update_fields.append('thumbnail')
+
+    video.status = 'pending'
+    video.save(update_fields=update_fields)
+    return video
+
+
+def publish_asset(video, thumbnail):
+    """
+    负责转码的视频完成后，把转码结果记录到共享资源
+
+    Args:
+        video: 已保存转码结果的视频
+        thumbnail: 自动生成的封面（相对 MEDIA_ROOT 的路径）
+
+    Returns:
+        list: 等待该资源、已同步转码结果的其他视频
+    """
+    asset = video.media_asset
+    asset.hls_file = video.hls_file
+    asset.thumbnail = thumbnail
+    asset.media_info = {name: getattr(video, name) for name in SHARED_VIDEO_FIELDS}
+    asset.status = 'ready'
+    asset.transcoding_video = None
+    asset.save(update_fields=['hls_file', 'thumbnail', 'media_info', 'status', 'transcoding_video', 'updated_at'])
+
+    waiting = asset.videos.filter(status='processing', hls_file__isnull=True).exclude(id=video.id)
+    return [apply_asset_to_video(other, asset) for other in waiting]
+
+
+def _remove_file(relative_path, label):
+    path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    if os.path.exists(path):
+        try:
+            os.remove(path)
+            logger.info(f"已删除{label}: {path}")
+        except Exception as e:
+            logger.error(f"删除{label}失败: {str(e)}")
+
+
+def _remove_hls_dir(hls_file):
+    hls_path_parts = hls_file.split('/')
+    if len(hls_path_parts) >= 3:
+        hls_dir = os.path.join(settings.MEDIA_ROOT, 'videos', 'hls', hls_path_parts[2])
+        if os.path.exists(hls_dir):
+            try:
+                shutil.rmtree(hls_dir)
+                invalidate_playlists(hls_dir)
+                logger.info(f"已删除 HLS 目录: {hls_dir}")
+            except Exception as e:
+                logger.error(f"删除 HLS 目录失败: {str(e)}")
+
+
+def delete_video_files(video):
+    """
+    永久删除视频前删除其文件：原始视频、HLS 目录、封面、字幕文件
+
+    关联了共享资源的视频先释放引用，资源仍被其他视频使用时只删除该视频自己上传的封面
+    """
+    shared_thumbnail = ''
+    hls_file = video.hls_file
+    remove_subtitle_files(video.id)
+
+    if video.media_asset_id:
+        asset, released = release_asset(video.media_asset_id)
+        if asset is not None:
+            shared_thumbnail = asset.thumbnail
+            hls_file = hls_file or asset.hls_file
+        if not released:
+            if video.thumbnail and video.thumbnail.name != shared_thumbnail:
+                _remove_file(video.thumbnail.name, '缩略图')
+            logger.info(f"视频 {video.id} 的源文件和转码结果仍被其他视频使用，保留共享文件")
+            return
+
+    if video.video_file:
+        _remove_file(video.video_file.name, '视频文件')
+    if hls_file:
+        _remove_hls_dir(hls_file)
+    if video.thumbnail:
+        _remove_file(video.thumbnail.name, '缩略图')
+    if shared_thumbnail and (not video.thumbnail or video.thumbnail.name != shared_thumbnail):
+        _remove_file(shared_thumbnail, '缩略图')
@@ -0,0 +1,82 @@
+"""
+HLS 播放列表缓存
+进程内 LRU 缓存播放列表内容和 ETag，按文件的 inode、大小和修改时间校验，
+重新转码改写文件后自动失效；删除和重新转码时也会主动清除对应目录的缓存
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 进程内缓存的播放列表总字节数上限
+PLAYLIST_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+_entries = OrderedDict()
+_total_bytes = 0
+_lock = threading.Lock()
+
+
+def _file_signature(stat):
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _load(path, signature):
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return {
+        'signature': signature,
+        'content': content,
+        'etag': hashlib.sha1(content.encode('utf-8')).hexdigest(),
+        # 点播播放列表（带结束标记的子播放列表或 master.m3u8）写好后不再变化
+        'vod': '#EXT-X-ENDLIST' in content or '#EXT-X-STREAM-INF' in content,
+    }
+
+
+def _evict(path):
+    global _total_bytes
+    entry = _entries.pop(path, None)
+    if entry is not None:
+        _total_bytes -= len(entry['content'])
+
+
+def read_playlist(path):
+    """
+    读取播放列表
+
+    Returns:
+        dict | None: {'content', 'etag', 'vod'}，文件不存在时返回 None
+    """
+    global _total_bytes
+    try:
+        signature = _file_signature(os.stat(path))
+    except OSError:
+        with _lock:
+            _evict(path)
+        return None
+
+    with _lock:
+        entry = _entries.get(path)
+        if entry is not None and entry['signature'] == signature:
+            _entries.move_to_end(path)
+            return entry
+
+    try:
+        entry = _load(path, signature)
+    except OSError:
+        return None
+
+    with _lock:
+        _evict(path)
+        _entries[path] = entry
+        _total_bytes += len(entry['content'])
+        while _total_bytes > PLAYLIST_CACHE_MAX_BYTES and len(_entries) > 1:
+            _evict(next(iter(_entries)))
+    return entry
+
+
+def invalidate_playlists(directory):
+    """清除目录下所有播放列表的缓存"""
+    prefix = os.path.join(directory, '')
+    with _lock:
+        for path in [path for path in _entries if path.startswith(prefix)]:
+            _evict(path)
@@ -0,0 +1,249 @@
+"""
+统一的 FFprobe 探测
+一次 ffprobe 获取所有流、格式和开头一段的关键帧信息，按 (路径, 大小, 修改时间) 缓存到 Redis 和 Video 记录
+"""
+import os
+import json
+import hashlib
+import subprocess
+import logging
+from dataclasses import dataclass, field, asdict, fields
+from math import gcd
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+PROBE_CACHE_PREFIX = 'video_probe'
+PROBE_CACHE_TIMEOUT = 7 * 24 * 3600
+
+# 统计关键帧间隔时读取的时长（秒）
+KEYFRAME_SAMPLE_SECONDS = 120
+
+PROBE_ENTRIES = (
+    'stream=index,codec_name,codec_type,profile,pix_fmt,level,width,height,'
+    'bit_rate,r_frame_rate,sample_rate,channels,duration:'
+    'stream_tags=language:'
+    'format=format_name,duration,size,bit_rate:'
+    'packet=stream_index,pts_time,flags'
+)
+
+COMMON_ASPECT_RATIOS = {
+    (16, 9): '16:9', (9, 16): '9:16',
+    (4, 3): '4:3', (3, 4): '3:4',
+    (21, 9): '21:9', (9, 21): '9:21',
+    (1, 1): '1:1',
+    (3, 2): '3:2', (2, 3): '2:3',
+}
+
+
+@dataclass
+class ProbeResult:
+    """ffprobe 探测结果"""
+    file_key: str = ''
+    format_name: str = ''
+    duration: float = 0.0
+    file_size: int = 0
+    bitrate: int = 0  # kbps
+
+    has_video: bool = False
+    width: int = 0
+    height: int = 0
+    video_codec: str = ''
+    profile: str = ''
+    pix_fmt: str = ''
+    level: int = 0
+    video_bitrate: int = 0  # kbps
+    frame_rate: float = 0.0
+
+    has_audio: bool = False
+    audio_codec: str = ''
+    audio_bitrate: int = 0  # kbps
+    sample_rate: int = 0
+    channels: int = 0
+
+    # 软字幕轨道 [{'index', 'codec', 'language'}]
+    subtitle_tracks: list = field(default_factory=list)
+
+    # 开头 KEYFRAME_SAMPLE_SECONDS 秒内的关键帧数量和最大间隔
+    keyframe_count: int = 0
+    max_keyframe_interval: float = 0.0
+
+    @property
+    def aspect_ratio(self):
+        """宽高比，如 16:9"""
+        if self.width <= 0 or self.height <= 0:
+            return ''
+        divisor = gcd(self.width, self.height)
+        ratio = (self.width // divisor, self.height // divisor)
+        return COMMON_ASPECT_RATIOS.get(ratio, f'{ratio[0]}:{ratio[1]}')
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        known = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in known})
+
+
+def get_file_key(video_file_path):
+    """文件标识：路径 + 大小 + 修改时间，文件被替换后自动失效"""
+    stat = os.stat(video_file_path)
+    raw = f'{os.path.abspath(video_file_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def _to_int(value, divisor=1):
+    try:
+        return int(int(value) / divisor)
+    except (ValueError, TypeError):
+        return 0
+
+
+def _parse_frame_rate(value):
+    """解析帧率 (格式如 "30/1" 或 "30000/1001")"""
+    try:
+        if '/' in value:
+            num, den = value.split('/')
+            return round(float(num) / float(den), 2) if float(den) != 0 else 0
+        return float(value)
+    except (ValueError, TypeError, ZeroDivisionError):
+        return 0
+
+
+def parse_probe_output(data, file_key=''):
+    """把 ffprobe 的 JSON 输出解析为 ProbeResult"""
+    result = ProbeResult(file_key=file_key)
+
+    format_info = data.get('format', {})
+    result.format_name = format_info.get('format_name', '')
+    result.file_size = _to_int(format_info.get('size'))
+    result.bitrate = _to_int(format_info.get('bit_rate'), 1000)
+    try:
+        result.duration = float(format_info.get('duration', 0))
+    except (ValueError, TypeError):
+        result.duration = 0.0
+
+    video_index = None
+    for stream in data.get('streams', []):
+        codec_type = stream.get('codec_type', '')
+
+        if codec_type == 'video' and not result.has_video:
+            result.has_video = True
+            video_index = stream.get('index')
+            result.width = _to_int(stream.get('width'))
+            result.height = _to_int(stream.get('height'))
+            result.video_codec = stream.get('codec_name', '')
+            result.profile = stream.get('profile', '')
+            result.pix_fmt = stream.get('pix_fmt', '')
+            result.level = _to_int(stream.get('level'))
+            result.video_bitrate = _to_int(stream.get('bit_rate'), 1000)
+            result.frame_rate = _parse_frame_rate(stream.get('r_frame_rate', '0/1'))
+
+        elif codec_type == 'audio' and not result.has_audio:
+            result.has_audio = True
+            result.audio_codec = stream.get('codec_name', '')
+            result.audio_bitrate = _to_int(stream.get('bit_rate'), 1000)
+            result.sample_rate = _to_int(stream.get('sample_rate'))
+            result.channels = _to_int(stream.get('channels'))
+
+        elif codec_type == 'subtitle':
+            result.subtitle_tracks.append({
+                'index': stream.get('index'),
+                'codec': stream.get('codec_name'),
+                'language': stream.get('tags', {}).get('language', 'unknown'),
+            })
+
+    # format 中没有时长时，使用流的时长
+    if not result.duration:
+        for stream in data.get('streams', []):
+            try:
+                result.duration = float(stream['duration'])
+                break
+            except (KeyError, ValueError, TypeError):
+                continue
+
+    keyframes = []
+    for packet in data.get('packets', []):
+        if packet.get('stream_index') != video_index or 'K' not in packet.get('flags', ''):
+            continue
+        try:
+            keyframes.append(float(packet['pts_time']))
+        except (KeyError, ValueError, TypeError):
+            continue
+    keyframes.sort()
+    result.keyframe_count = len(keyframes)
+
+    if keyframes:
+        intervals = [b - a for a, b in zip(keyframes, keyframes[1:])]
+        # 最后一个关键帧到采样结束（或视频结尾）也算一个间隔
+        if result.duration:
+            intervals.append(min(result.duration, KEYFRAME_SAMPLE_SECONDS) - keyframes[-1])
+        result.max_keyframe_interval = max(intervals) if intervals else 0.0
+
+    return result
+
+
+def run_ffprobe(video_file_path):
+    """执行一次 ffprobe，返回原始 JSON"""
+    probe_cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', PROBE_ENTRIES,
+        '-read_intervals', f'%+{KEYFRAME_SAMPLE_SECONDS}',
+        '-of', 'json',
+        video_file_path
+    ]
+
+    probe_process = subprocess.run(
+        probe_cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+
+    if probe_process.returncode != 0:
+        raise Exception(f"获取视频信息失败: {probe_process.stderr}")
+
+    return json.loads(probe_process.stdout)
+
+
+def probe_video(video_file_path, use_cache=True):
+    """
+    探测视频文件，优先读取 Redis 缓存
+
+    Returns:
+        ProbeResult
+    """
+    file_key = get_file_key(video_file_path)
+    cache_key = f'{PROBE_CACHE_PREFIX}:{file_key}'
+
+    if use_cache:
+        cached = cache.get(cache_key)
+        if cached:
+            return ProbeResult.from_dict(cached)
+
+    result = parse_probe_output(run_ffprobe(video_file_path), file_key)
+    cache.set(cache_key, result.to_dict(), PROBE_CACHE_TIMEOUT)
+    logger.info(f"ffprobe 完成: {video_file_path}, {result.width}x{result.height}, {result.duration:.2f}秒")
+    return result
+
+
+def probe_video_for(video, video_file_path=None):
+    """
+    探测 Video 记录对应的源文件
+
+    依次读取 Video.probe_data、Redis 缓存，都未命中时执行 ffprobe 并写回两处
+    """
+    if video_file_path is None:
+        video_file_path = video.video_file.path
+
+    file_key = get_file_key(video_file_path)
+    if video.probe_data and video.probe_data.get('file_key') == file_key:
+        return ProbeResult.from_dict(video.probe_data)
+
+    result = probe_video(video_file_path)
+    video.probe_data = result.to_dict()
+    type(video).objects.filter(id=video.id).update(probe_data=video.probe_data)
+    return result
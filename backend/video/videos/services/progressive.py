@@ -0,0 +1,260 @@
+"""
+边上传边处理（渐进式上传）
+文件开头连续到达的数据足够时，先判断是否为 faststart MP4（moov 在 mdat 之前），再用已到达的部分探测、选封面、检测字幕，
+并通过只读取已到达数据的管道开始转码，结果暂存在上传目录中；上传完成后视频处理任务直接接管暂存的转码结果
+"""
+import os
+import json
+import time
+import shutil
+import struct
+import logging
+
+from django.conf import settings
+
+from .uploads import get_redis, upload_file_path, contiguous_bytes
+from .thumbnails import CANDIDATE_DIR_NAME
+
+logger = logging.getLogger(__name__)
+
+STAGING_SUFFIX = '.progressive'
+# 轮询已到达数据的间隔（秒）
+READER_POLL_INTERVAL = 1.0
+# 上传停滞超过该时间（秒）放弃转码；转码心跳超过该时间未更新视为转码进程已退出
+READER_STALL_TIMEOUT = 600
+HEARTBEAT_INTERVAL = 10
+# 按平均码率估算已到达数据覆盖的时长，留出余量避免读到还没到达的部分
+COVERAGE_SAFETY_RATIO = 0.9
+
+# adopt_progressive_output 的返回值：暂存转码仍在进行
+PROGRESSIVE_RUNNING = 'running'
+RUNNING_STATUSES = ('analyzing', 'analyzed', 'transcoding')
+
+# MP4 / MOV 文件开头可能出现的顶层 box
+_MP4_LEADING_BOXES = {b'ftyp', b'moov', b'wide', b'free', b'skip'}
+
+_BINARY = getattr(os, 'O_BINARY', 0)
+
+
+class UploadStalled(Exception):
+    """上传被取消或长时间没有新数据"""
+    pass
+
+
+def find_moov_position(path, limit):
+    """
+    遍历 MP4 顶层 box，判断 moov 是否位于 mdat 之前
+
+    Args:
+        limit: 只检查文件开头已到达的字节数
+
+    Returns:
+        str | None: 'faststart'（moov 在前）、'tail'（mdat 在前），不是 MP4 或开头数据不足以判断时返回 None
+    """
+    position = 0
+    with open(path, 'rb') as f:
+        while position + 8 <= limit:
+            f.seek(position)
+            header = f.read(16)
+            if len(header) < 8:
+                return None
+            size, box_type = struct.unpack('>I4s', header[:8])
+            if position == 0 and box_type not in _MP4_LEADING_BOXES:
+                return None
+            if box_type == b'moov':
+                return 'faststart'
+            if box_type == b'mdat':
+                return 'tail'
+
+            if size == 1 and len(header) == 16:
+                size = struct.unpack('>Q', header[8:16])[0]
+            if size < 8:
+                # size 为 0 表示延伸到文件末尾
+                return None
+            position += size
+    return None
+
+
+def covered_duration(duration, available, file_size):
+    """按平均码率估算已到达数据覆盖的时长（秒）"""
+    if not duration or not file_size:
+        return 0.0
+    return duration * min(1.0, available / file_size) * COVERAGE_SAFETY_RATIO
+
+
+def staging_dir(user_id, upload_id):
+    """暂存目录，结构与 videos/hls/<标识>/ 相同，接管时整体重命名"""
+    return os.path.join(os.path.dirname(upload_file_path(user_id, upload_id)), f"{upload_id}{STAGING_SUFFIX}")
+
+
+def _state_key(user_id, upload_id):
+    return f"upload:{user_id}:{upload_id}:progressive"
+
+
+def _video_link_key(video_id):
+    return f"upload:progressive_video:{video_id}"
+
+
+def claim_progressive(user_id, upload_id):
+    """每个上传只启动一次渐进式处理"""
+    client = get_redis()
+    key = _state_key(user_id, upload_id)
+    if not client.hsetnx(key, 'status', json.dumps('analyzing')):
+        return False
+    update_progressive_state(user_id, upload_id, heartbeat=time.time())
+    return True
+
+
+def get_progressive_state(user_id, upload_id):
+    raw = get_redis().hgetall(_state_key(user_id, upload_id))
+    return {key.decode(): json.loads(value) for key, value in raw.items()}
+
+
+def update_progressive_state(user_id, upload_id, **fields):
+    client = get_redis()
+    key = _state_key(user_id, upload_id)
+    client.hset(key, mapping={name: json.dumps(value) for name, value in fields.items()})
+    client.expire(key, settings.UPLOAD_SESSION_TTL)
+
+
+def mark_upload_completed(user_id, upload_id):
+    """上传已全部到达，读取暂存转码输入的管道可以直接读到文件结尾"""
+    client = get_redis()
+    key = _state_key(user_id, upload_id)
+    if client.exists(key):
+        client.hset(key, 'completed', json.dumps(True))
+
+
+def link_progressive_video(user_id, upload_id, video_id):
+    """记录视频对应的上传，视频处理和字幕检测时据此找到暂存结果"""
+    get_redis().set(_video_link_key(video_id), f"{user_id}:{upload_id}", ex=settings.UPLOAD_SESSION_TTL)
+
+
+def _linked_upload(video_id):
+    link = get_redis().get(_video_link_key(video_id))
+    if not link:
+        return None
+    user_id, _, upload_id = link.decode().partition(':')
+    return user_id, upload_id
+
+
+def discard_progressive(user_id, upload_id):
+    """删除暂存结果和处理状态"""
+    shutil.rmtree(staging_dir(user_id, upload_id), ignore_errors=True)
+    get_redis().delete(_state_key(user_id, upload_id))
+
+
+def get_progressive_subtitle(video_id):
+    """上传过程中基于已到达数据检测的字幕结果，没有时返回 None"""
+    upload = _linked_upload(video_id)
+    if upload is None:
+        return None
+    return get_progressive_state(*upload).get('subtitle')
+
+
+def get_progressive_probe(user_id, upload_id):
+    return get_progressive_state(user_id, upload_id).get('probe')
+
+
+def adopt_progressive_output(video, hls_dir):
+    """
+    接管上传过程中暂存的转码结果
+
+    暂存转码完成且切片格式一致时，把暂存目录重命名为 hls_dir
+
+    Returns:
+        dict | str | None: {'resolutions', 'thumbnail_candidates'}；转码仍在进行时返回 PROGRESSIVE_RUNNING；
+        没有可用结果时返回 None
+    """
+    upload = _linked_upload(video.id)
+    if upload is None:
+        return None
+
+    state = get_progressive_state(*upload)
+    status = state.get('status')
+    if status in RUNNING_STATUSES and time.time() - state.get('heartbeat', 0) < READER_STALL_TIMEOUT:
+        return PROGRESSIVE_RUNNING
+
+    get_redis().delete(_video_link_key(video.id))
+    staging = staging_dir(*upload)
+    try:
+        if status != 'transcoded' or state.get('segment_format') != video.hls_segment_format:
+            return None
+        try:
+            os.replace(staging, hls_dir)
+        except OSError as e:
+            logger.warning(f"接管暂存转码结果失败: {staging} -> {hls_dir}, {e}")
+            return None
+        candidates_dir = os.path.join(hls_dir, CANDIDATE_DIR_NAME)
+        return {
+            'resolutions': state['resolutions'],
+            'thumbnail_candidates': [
+                {**item, 'path': os.path.join(candidates_dir, item['path'])}
+                for item in state.get('thumbnail_candidates', [])
+            ],
+        }
+    finally:
+        discard_progressive(*upload)
+
+
+class GrowingFileReader:
+    """
+    只读取上传中文件已连续到达部分的文件对象，用作转码输入
+
+    读到已到达数据的末尾时等待上传继续，上传完成后读到文件结尾；
+    上传被取消或长时间停滞时抛出 UploadStalled。读取期间定期更新心跳
+    """
+
+    def __init__(self, user_id, upload_id, file_size):
+        self.user_id = user_id
+        self.upload_id = upload_id
+        self.file_size = file_size
+        self.position = 0
+        self.available = 0
+        self.last_heartbeat = 0.0
+        self.fd = os.open(upload_file_path(user_id, upload_id), os.O_RDONLY | _BINARY)
+
+    def _heartbeat(self):
+        now = time.time()
+        if now - self.last_heartbeat >= HEARTBEAT_INTERVAL:
+            self.last_heartbeat = now
+            update_progressive_state(self.user_id, self.upload_id, heartbeat=now)
+
+    def _arrived(self):
+        if get_progressive_state(self.user_id, self.upload_id).get('completed'):
+            return self.file_size
+        progress = contiguous_bytes(self.user_id, self.upload_id)
+        return None if progress is None else progress[0]
+
+    def _wait_for_data(self):
+        waiting_since = time.time()
+        while True:
+            arrived = self._arrived()
+            if arrived is None:
+                raise UploadStalled("上传已取消")
+            if arrived > self.position:
+                self.available = arrived
+                return
+            if time.time() - waiting_since > READER_STALL_TIMEOUT:
+                raise UploadStalled(f"上传超过 {READER_STALL_TIMEOUT} 秒没有新数据")
+            self._heartbeat()
+            time.sleep(READER_POLL_INTERVAL)
+
+    def read(self, size):
+        if self.position >= self.file_size:
+            return b''
+        if self.position >= self.available:
+            self._wait_for_data()
+        self._heartbeat()
+
+        size = min(size, self.available - self.position)
+        if hasattr(os, 'pread'):
+            data = os.pread(self.fd, size, self.position)
+        else:
+            os.lseek(self.fd, self.position, os.SEEK_SET)
+            data = os.read(self.fd, size)
+        self.position += len(data)
+        return data
+
+    def close(self):
+        os.close(self.fd)
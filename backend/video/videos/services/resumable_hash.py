@@ -0,0 +1,117 @@
+"""
+可续算的 MD5 / SHA-256
+hashlib 的哈希对象不能序列化，而分片上传的各个请求可能由不同进程处理，需要接续同一个哈希。
+这里通过 ctypes 调用 OpenSSL 的 MD5_* / SHA256_* 接口，上下文结构体按原始字节保存，下次恢复后继续计算。
+
+上下文的内存布局与 OpenSSL 版本和平台有关，保存时带上 STATE_TAG，恢复时不一致则视为没有中间状态。
+找不到 libcrypto（或自检失败）时 available() 返回 False，调用方退回到整文件计算
+"""
+import ctypes
+import ctypes.util
+import hashlib
+import platform
+import threading
+
+# 名称: (OpenSSL 函数前缀, 上下文结构体字节数, 摘要字节数)
+_ALGORITHMS = {
+    'md5': ('MD5', 92, 16),
+    'sha256': ('SHA256', 112, 32),
+}
+# Linux / macOS 为 crypto，Windows 为随 Python 或 OpenSSL 安装的 DLL
+_LIBRARY_NAMES = ('crypto', 'libcrypto-3-x64', 'libcrypto-3', 'libcrypto-1_1-x64', 'libcrypto-1_1')
+
+_lib = None
+_loaded = False
+_load_lock = threading.Lock()
+STATE_TAG = None
+
+
+def _bind(lib):
+    for prefix, _, _ in _ALGORITHMS.values():
+        init = getattr(lib, f'{prefix}_Init')
+        init.argtypes = [ctypes.c_void_p]
+        update = getattr(lib, f'{prefix}_Update')
+        update.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t]
+        final = getattr(lib, f'{prefix}_Final')
+        final.argtypes = [ctypes.c_char_p, ctypes.c_void_p]
+    lib.OpenSSL_version_num.restype = ctypes.c_ulong
+
+
+def _self_check(lib):
+    data = b'resumable' * 1000
+    for name in _ALGORITHMS:
+        first = ResumableHash(name, lib=lib)
+        first.update(data[:4321])
+        second = ResumableHash(name, first.state(), lib=lib)
+        second.update(data[4321:])
+        if second.hexdigest() != hashlib.new(name, data).hexdigest():
+            return False
+    return True
+
+
+def _load():
+    global _lib, _loaded, STATE_TAG
+    with _load_lock:
+        if _loaded:
+            return _lib
+        _loaded = True
+        for name in _LIBRARY_NAMES:
+            path = ctypes.util.find_library(name)
+            if not path:
+                continue
+            try:
+                lib = ctypes.CDLL(path)
+                _bind(lib)
+            except (OSError, AttributeError):
+                continue
+            # 结构体大小与预期不一致时自检失败，不使用
+            if _self_check(lib):
+                _lib = lib
+                STATE_TAG = f"{platform.machine()}:{lib.OpenSSL_version_num():x}"
+            break
+        return _lib
+
+
+def available():
+    """当前进程能否计算并恢复中间状态"""
+    return _load() is not None
+
+
+class ResumableHash:
+    """
+    与 hashlib 对象用法相同，另外可以导出和恢复中间状态
+
+    Args:
+        name: 'md5' 或 'sha256'
+        state: state() 导出的字节，为空时从头开始
+    """
+
+    def __init__(self, name, state=None, lib=None):
+        lib = lib or _load()
+        if lib is None:
+            raise RuntimeError("libcrypto 不可用")
+        prefix, ctx_size, self.digest_size = _ALGORITHMS[name]
+        self._update = getattr(lib, f'{prefix}_Update')
+        self._final = getattr(lib, f'{prefix}_Final')
+        self._ctx_size = ctx_size
+        if state is None:
+            self._ctx = ctypes.create_string_buffer(ctx_size)
+            getattr(lib, f'{prefix}_Init')(self._ctx)
+        else:
+            if len(state) != ctx_size:
+                raise ValueError("哈希中间状态长度不正确")
+            self._ctx = ctypes.create_string_buffer(bytes(state), ctx_size)
+
+    def update(self, data):
+        data = bytes(data)
+        self._update(self._ctx, data, len(data))
+
+    def state(self):
+        return self._ctx.raw
+
+    def hexdigest(self):
+        # Final 会改写上下文，在副本上计算，原对象可以继续 update
+        ctx = ctypes.create_string_buffer(self._ctx.raw, self._ctx_size)
+        digest = ctypes.create_string_buffer(self.digest_size)
+        self._final(digest, ctx)
+        return digest.raw.hex()
@@ -0,0 +1,80 @@
+"""
+播放地址签名
+详情接口签发短期有效的 HMAC 令牌，绑定视频 ID、HLS 目录、过期时间和观众；
+投递播放列表和切片时只做签名计算，不查询数据库和 Redis。播放列表中的相对地址在发送时加上令牌
+"""
+import re
+import time
+import hmac
+import base64
+
+from django.conf import settings
+from django.utils.crypto import salted_hmac
+
+TOKEN_PARAM = 'token'
+_KEY_SALT = 'videos.playback'
+
+# #EXT-X-MAP、#EXT-X-MEDIA 等标签中的 URI="..." 属性
+_URI_ATTRIBUTE = re.compile(r'URI="([^"]*)"')
+
+
+def hls_key_from_file(hls_file):
+    """hls_file（videos/hls/<标识>/master.m3u8）中的 HLS 目录标识"""
+    hls_path_parts = hls_file.replace('\\', '/').split('/')
+    return hls_path_parts[2] if len(hls_path_parts) >= 4 else None
+
+
+def _signature(video_id, hls_key, expires, viewer):
+    value = f"{video_id}:{hls_key}:{expires}:{viewer}"
+    digest = salted_hmac(_KEY_SALT, value, secret=settings.MEDIA_SIGNING_KEY, algorithm='sha256').digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+
+def mint_playback_token(video_id, hls_key, viewer_id=None, ttl=None):
+    """
+    签发播放令牌
+
+    Args:
+        hls_key: HLS 目录标识，令牌只能访问该目录下的文件
+        viewer_id: 观众 ID，未登录为 None
+
+    Returns:
+        str: <过期时间>.<观众ID>.<签名>，只包含 URL 安全字符
+    """
+    expires = int(time.time()) + (ttl or settings.MEDIA_TOKEN_TTL)
+    viewer = viewer_id or 0
+    return f"{expires}.{viewer}.{_signature(video_id, hls_key, expires, viewer)}"
+
+
+def verify_playback_token(token, video_id, hls_key):
+    """校验令牌签名和有效期，只做 HMAC 计算"""
+    try:
+        expires, viewer, signature = (token or '').split('.')
+        expires = int(expires)
+    except ValueError:
+        return False
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(signature, _signature(video_id, hls_key, expires, viewer))
+
+
+def _with_token(uri, token):
+    # 绝对地址不经过投递接口，保持不变
+    if not uri or uri.startswith('/') or '://' in uri:
+        return uri
+    separator = '&' if '?' in uri else '?'
+    return f"{uri}{separator}{TOKEN_PARAM}={token}"
+
+
+def sign_playlist(content, token):
+    """给播放列表中的相对地址（子播放列表、切片、初始化段）加上令牌"""
+    lines = []
+    for line in content.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            lines.append(line)
+        elif stripped.startswith('#'):
+            lines.append(_URI_ATTRIBUTE.sub(lambda m: f'URI="{_with_token(m.group(1), token)}"', line))
+        else:
+            lines.append(_with_token(stripped, token))
+    return '\n'.join(lines) + '\n'
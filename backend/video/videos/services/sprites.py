@@ -0,0 +1,138 @@
+"""
+进度条预览图
+转码时作为同一个 FFmpeg 命令的额外输出生成雪碧图，并生成 WebVTT 缩略图轨道（#xywh 坐标）
+"""
+import os
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+SPRITE_DIR_NAME = 'thumbnails'
+SPRITE_VTT_FILENAME = 'thumbnails.vtt'
+SPRITE_PREFIX = 'sprite'
+
+# 每张雪碧图 10x10 个缩略图，每个缩略图宽 160 像素
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+SPRITE_TILE_WIDTH = 160
+
+# 截图间隔（秒），长视频自动放大间隔，使缩略图总数不超过 SPRITE_MAX_TILES
+SPRITE_MIN_INTERVAL = 5
+SPRITE_MAX_TILES = 1000
+
+
+def build_sprite_config(hls_dir, width, height, duration):
+    """
+    根据源视频信息确定雪碧图参数
+
+    Returns:
+        dict: {'dir', 'interval', 'tile_width', 'tile_height'}
+    """
+    interval = SPRITE_MIN_INTERVAL
+    if duration > 0:
+        interval = max(SPRITE_MIN_INTERVAL, math.ceil(duration / SPRITE_MAX_TILES))
+
+    tile_height = SPRITE_TILE_WIDTH * 9 // 16
+    if width > 0 and height > 0:
+        tile_height = round(SPRITE_TILE_WIDTH * height / width / 2) * 2
+
+    return {
+        'dir': os.path.join(hls_dir, SPRITE_DIR_NAME),
+        'interval': interval,
+        'tile_width': SPRITE_TILE_WIDTH,
+        'tile_height': max(2, tile_height),
+    }
+
+
+def sprite_prefix(chunk=None):
+    """雪碧图文件名前缀，分段转码时每个分段单独编号"""
+    if chunk is None:
+        return SPRITE_PREFIX
+    return f"{SPRITE_PREFIX}_{chunk['index']:04d}"
+
+
+def build_sprite_output_args(sprite, chunk=None):
+    """
+    构建雪碧图输出参数，追加到转码命令中与 HLS 输出共用一次解码
+
+    fps 每 interval 秒取一帧，缩放后由 tile 滤镜拼成 10x10 的 JPEG
+    """
+    os.makedirs(sprite['dir'], exist_ok=True)
+    video_filter = (
+        f"fps=1/{sprite['interval']},"
+        f"scale={sprite['tile_width']}:{sprite['tile_height']},"
+        f"tile={SPRITE_COLUMNS}x{SPRITE_ROWS}"
+    )
+    return [
+        '-map', '0:v:0',
+        '-an',
+        '-vf', video_filter,
+        '-c:v', 'mjpeg',
+        '-q:v', '5',
+        '-f', 'image2',
+        '-start_number', '0',
+        os.path.join(sprite['dir'], f'{sprite_prefix(chunk)}_%03d.jpg'),
+    ]
+
+
+def format_vtt_timestamp(seconds):
+    """秒数转为 WebVTT 时间戳 HH:MM:SS.mmm"""
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600 * 1000)
+    minutes, millis = divmod(millis, 60 * 1000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+
+def write_thumbnails_vtt(sprite, duration, chunks=None):
+    """
+    生成 thumbnails.vtt
+
+    每个缩略图一个 cue，指向雪碧图中的坐标，如 sprite_000.jpg#xywh=160,0,160,90
+
+    Args:
+        sprite: build_sprite_config 返回的参数
+        duration: 视频总时长（秒）
+        chunks: 分段转码的分段列表，每个分段的雪碧图从分段起点开始计时
+
+    Returns:
+        str | None: thumbnails.vtt 路径，雪碧图不存在时返回 None
+    """
+    spans = [{'prefix': sprite_prefix(), 'start': 0.0, 'end': duration}]
+    if chunks:
+        spans = [
+            {
+                'prefix': sprite_prefix(chunk),
+                'start': chunk['start'],
+                'end': chunk['end'] if chunk['end'] is not None else duration,
+            }
+            for chunk in chunks
+        ]
+
+    interval = sprite['interval']
+    tile_width, tile_height = sprite['tile_width'], sprite['tile_height']
+    tiles_per_sheet = SPRITE_COLUMNS * SPRITE_ROWS
+
+    lines = ['WEBVTT', '']
+    for span in spans:
+        tile_count = max(1, math.ceil((span['end'] - span['start']) / interval))
+        for tile in range(tile_count):
+            sheet_name = f"{span['prefix']}_{tile // tiles_per_sheet:03d}.jpg"
+            if not os.path.exists(os.path.join(sprite['dir'], sheet_name)):
+                logger.warning(f"雪碧图不存在: {sheet_name}")
+                return None
+
+            position = tile % tiles_per_sheet
+            x = (position % SPRITE_COLUMNS) * tile_width
+            y = (position // SPRITE_COLUMNS) * tile_height
+            start = span['start'] + tile * interval
+            end = min(span['start'] + (tile + 1) * interval, span['end'])
+            lines.append(f"{format_vtt_timestamp(start)} --> {format_vtt_timestamp(end)}")
+            lines.append(f"{sheet_name}#xywh={x},{y},{tile_width},{tile_height}")
+            lines.append('')
+
+    vtt_path = os.path.join(sprite['dir'], SPRITE_VTT_FILENAME)
+    with open(vtt_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines))
+    return vtt_path
@@ -0,0 +1,144 @@
+"""
+字幕渲染
+把字幕草稿（subtitles_draft）渲染为 WebVTT / SRT，结果按草稿内容哈希保存为文件。
+保存草稿时预先生成，播放器请求时直接发送文件，并通过 ETag / Last-Modified 支持 304
+"""
+import os
+import json
+import shutil
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .delivery import media_response
+
+SUBTITLE_FORMATS = ('vtt', 'srt')
+# 渲染格式变化时修改版本号，使已生成的文件和 ETag 失效
+RENDERER_VERSION = 1
+
+
+def format_timestamp(seconds, decimal_mark='.'):
+    """秒数转换为 00:00:00.000（SRT 使用逗号分隔毫秒）"""
+    try:
+        seconds = float(seconds)
+    except (TypeError, ValueError):
+        seconds = 0.0
+    total_ms = int(round(max(seconds, 0.0) * 1000))
+    hours, total_ms = divmod(total_ms, 3600 * 1000)
+    minutes, total_ms = divmod(total_ms, 60 * 1000)
+    secs, ms = divmod(total_ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{decimal_mark}{ms:03d}"
+
+
+def iter_cues(subtitles):
+    """遍历有内容的字幕条目：(序号, 开始时间, 结束时间, 文本行)，原文在前、译文在后"""
+    for i, sub in enumerate(subtitles or []):
+        if not isinstance(sub, dict):
+            continue
+        text_lines = [
+            line for line in ((sub.get('text') or '').strip(), (sub.get('translation') or '').strip())
+            if line
+        ]
+        if not text_lines:
+            continue
+        yield i + 1, sub.get('startTime', 0), sub.get('endTime', 0), text_lines
+
+
+def render_vtt(subtitles):
+    lines = ["WEBVTT", ""]
+    for index, start, end, text_lines in iter_cues(subtitles):
+        lines.append(str(index))
+        lines.append(f"{format_timestamp(start)} --> {format_timestamp(end)}")
+        lines.extend(text_lines)
+        lines.append("")
+    return "\n".join(lines)
+
+
+def render_srt(subtitles):
+    lines = []
+    for number, (_, start, end, text_lines) in enumerate(iter_cues(subtitles), start=1):
+        lines.append(str(number))
+        lines.append(f"{format_timestamp(start, ',')} --> {format_timestamp(end, ',')}")
+        lines.extend(text_lines)
+        lines.append("")
+    return "\n".join(lines)
+
+
+RENDERERS = {
+    'vtt': render_vtt,
+    'srt': render_srt,
+}
+
+
+def subtitles_digest(subtitles):
+    """字幕草稿的内容哈希，用作文件名和 ETag"""
+    payload = json.dumps(subtitles or [], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(f"{RENDERER_VERSION}:{payload}".encode('utf-8')).hexdigest()
+
+
+def subtitle_dir(video_id):
+    return os.path.join(settings.MEDIA_ROOT, 'videos', 'subtitles', str(video_id))
+
+
+def compile_subtitles(video, keep_empty=False):
+    """
+    生成当前草稿对应的 VTT / SRT 文件，并删除旧版本
+
+    Args:
+        keep_empty: 草稿为空时也生成文件（播放器请求时使用）；否则只清理旧版本
+
+    Returns:
+        str | None: 内容哈希，没有生成文件时返回 None
+    """
+    output_dir = subtitle_dir(video.id)
+    if not video.subtitles_draft and not keep_empty:
+        if os.path.isdir(output_dir):
+            shutil.rmtree(output_dir, ignore_errors=True)
+        return None
+
+    digest = subtitles_digest(video.subtitles_draft)
+    os.makedirs(output_dir, exist_ok=True)
+    for fmt in SUBTITLE_FORMATS:
+        path = os.path.join(output_dir, f"{digest}.{fmt}")
+        if os.path.exists(path):
+            continue
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(RENDERERS[fmt](video.subtitles_draft))
+        os.replace(temp_path, path)
+
+    for name in os.listdir(output_dir):
+        if not name.startswith(f"{digest}."):
+            try:
+                os.remove(os.path.join(output_dir, name))
+            except OSError:
+                pass
+    return digest
+
+
+def remove_subtitle_files(video_id):
+    shutil.rmtree(subtitle_dir(video_id), ignore_errors=True)
+
+
+def subtitle_response(request, video, fmt):
+    """
+    发送字幕文件，文件不存在时（旧数据或草稿未经过保存流程修改）先生成
+
+    草稿改变后内容哈希随之改变，客户端每次重新验证，未改变时返回 304
+    """
+    digest = subtitles_digest(video.subtitles_draft)
+    path = os.path.join(subtitle_dir(video.id), f"{digest}.{fmt}")
+    if not os.path.exists(path):
+        compile_subtitles(video, keep_empty=True)
+
+    etag = quote_etag(digest)
+    last_modified = int(os.path.getmtime(path))
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = media_response(request, path, 'private, no-cache')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
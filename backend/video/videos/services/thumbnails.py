@@ -0,0 +1,151 @@
+"""
+自动封面选择
+一次 FFmpeg 调用抽取若干候选帧，用 NumPy 按清晰度、亮度、信息熵打分，选出最佳封面
+"""
+import os
+import glob
+import subprocess
+import logging
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+CANDIDATE_DIR_NAME = 'covers'
+CANDIDATE_PREFIX = 'candidate'
+CANDIDATE_COUNT = 8
+CANDIDATE_WIDTH = 480
+
+# 跳过片头片尾（按时长比例）
+EDGE_RATIO = 0.05
+
+# 平均亮度低于/高于该值视为黑屏/白屏，信息熵低于该值视为纯色画面
+MIN_BRIGHTNESS = 16
+MAX_BRIGHTNESS = 240
+MIN_ENTROPY = 2.0
+
+# 打分权重
+SHARPNESS_WEIGHT = 0.5
+ENTROPY_WEIGHT = 0.3
+BRIGHTNESS_WEIGHT = 0.2
+
+
+def extract_candidate_frames(video_file_path, duration, output_dir, count=CANDIDATE_COUNT):
+    """
+    一次解码抽取候选帧
+
+    只解码关键帧（-skip_frame nokey），select 滤镜按固定间隔挑选，避免为每一帧单独启动 FFmpeg
+
+    Returns:
+        list: 候选帧图片路径，按时间顺序
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    for old_file in glob.glob(os.path.join(output_dir, f'{CANDIDATE_PREFIX}_*.jpg')):
+        os.remove(old_file)
+
+    start = duration * EDGE_RATIO if duration > 0 else 0
+    usable = duration * (1 - 2 * EDGE_RATIO) if duration > 0 else 0
+    step = usable / count if usable > 0 else 1
+
+    command = [
+        'ffmpeg', '-y',
+        '-skip_frame', 'nokey',
+        '-ss', f'{start:.3f}',
+        '-i', video_file_path,
+        '-map', '0:v:0',
+        '-an',
+        '-vf', f"select='isnan(prev_selected_t)+gte(t-prev_selected_t,{step:.3f})',scale={CANDIDATE_WIDTH}:-2",
+        '-vsync', 'vfr',
+        '-frames:v', str(count),
+        '-q:v', '2',
+        '-start_number', '0',
+        os.path.join(output_dir, f'{CANDIDATE_PREFIX}_%02d.jpg'),
+    ]
+    subprocess.run(command, check=True, capture_output=True)
+    return sorted(glob.glob(os.path.join(output_dir, f'{CANDIDATE_PREFIX}_*.jpg')))
+
+
+def score_frames(frames):
+    """
+    批量计算候选帧得分
+
+    Args:
+        frames: 灰度图数组 (K, H, W)，取值 0-255
+
+    Returns:
+        dict: {'score', 'sharpness', 'brightness', 'entropy'}，每项为长度 K 的数组
+    """
+    frames = frames.astype(np.float32)
+
+    # 清晰度：拉普拉斯算子响应的方差
+    laplacian = (
+        frames[:, :-2, 1:-1] + frames[:, 2:, 1:-1] +
+        frames[:, 1:-1, :-2] + frames[:, 1:-1, 2:] -
+        4 * frames[:, 1:-1, 1:-1]
+    )
+    sharpness = laplacian.reshape(len(frames), -1).var(axis=1)
+
+    # 亮度：平均灰度
+    brightness = frames.reshape(len(frames), -1).mean(axis=1)
+
+    # 信息熵：灰度直方图的香农熵（0-8）
+    pixels = frames.reshape(len(frames), -1).astype(np.int64)
+    histograms = np.zeros((len(frames), 256), dtype=np.float64)
+    np.add.at(histograms, (np.arange(len(frames))[:, None], pixels), 1)
+    probabilities = histograms / histograms.sum(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entropy = -np.nansum(probabilities * np.log2(probabilities), axis=1)
+
+    log_sharpness = np.log1p(sharpness)
+    sharpness_score = log_sharpness / log_sharpness.max() if log_sharpness.max() > 0 else np.zeros_like(log_sharpness)
+    brightness_score = 1 - np.abs(brightness - 128) / 128
+    entropy_score = entropy / 8
+
+    score = (
+        SHARPNESS_WEIGHT * sharpness_score +
+        ENTROPY_WEIGHT * entropy_score +
+        BRIGHTNESS_WEIGHT * brightness_score
+    )
+    # 黑屏、白屏、纯色过渡帧直接淘汰
+    rejected = (brightness < MIN_BRIGHTNESS) | (brightness > MAX_BRIGHTNESS) | (entropy < MIN_ENTROPY)
+    score = np.where(rejected, 0.0, score)
+
+    return {
+        'score': score,
+        'sharpness': sharpness,
+        'brightness': brightness,
+        'entropy': entropy,
+    }
+
+
+def rank_candidate_frames(image_paths):
+    """
+    按得分从高到低排列候选帧
+
+    Returns:
+        list: [{'path', 'score', 'sharpness', 'brightness', 'entropy'}, ...]
+    """
+    if not image_paths:
+        return []
+
+    images = [Image.open(path).convert('L') for path in image_paths]
+    size = images[0].size
+    frames = np.stack([
+        np.asarray(image if image.size == size else image.resize(size))
+        for image in images
+    ])
+
+    metrics = score_frames(frames)
+    ranked = [
+        {
+            'path': path,
+            'score': round(float(metrics['score'][i]), 4),
+            'sharpness': round(float(metrics['sharpness'][i]), 2),
+            'brightness': round(float(metrics['brightness'][i]), 2),
+            'entropy': round(float(metrics['entropy'][i]), 3),
+        }
+        for i, path in enumerate(image_paths)
+    ]
+    ranked.sort(key=lambda item: item['score'], reverse=True)
+    return ranked
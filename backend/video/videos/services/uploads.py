@@ -0,0 +1,757 @@
+"""
+分片上传
+收到第一个分片时按文件大小预分配临时文件，每个分片直接按 chunk_index * chunk_size 定位写入；
+已收到的分片记录在 Redis 位图中，续传查询和完成检查不需要列目录，完成上传时只校验哈希并重命名，没有合并步骤。
+每个分片写入时顺带计算 MD5 与客户端提供的值比较，损坏的分片立即拒绝，不再等到转码时才失败。
+从文件开头起连续到达的数据随上传增量计算整个文件的 MD5 / SHA-256，中间状态保存在 Redis 中，
+完成上传时只需计算尚未覆盖的部分（乱序到达留下的空洞，或运行环境不支持续算时整个文件）。
+
+tus 上传（按字节偏移续传）使用相同的临时文件和预分配方式，偏移记录在上传会话中。
+
+每个用户的临时数据不能超过 UPLOAD_USER_TEMP_QUOTA；放弃的上传由定时任务按最后修改时间清理
+"""
+import os
+import re
+import time
+import uuid
+import errno
+import shutil
+import hashlib
+import logging
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import resumable_hash
+from .resumable_hash import ResumableHash
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR_NAME = os.path.join('temp', 'uploads')
+# 旧版本按分片文件保存的目录 temp/chunks/<md5>，只做清理
+LEGACY_CHUNK_DIR_NAME = os.path.join('temp', 'chunks')
+# 临时数据清理的累计统计
+UPLOAD_GC_STATS_KEY = 'upload_gc_stats'
+PARTIAL_SUFFIX = '.part'
+HASH_READ_SIZE = 1024 * 1024
+# 单个分片的最大大小，防止客户端声明过大的分片
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+# 进度回调的最小间隔（秒）
+HASH_PROGRESS_INTERVAL = 1.0
+STREAM_READ_SIZE = 1024 * 1024
+# 字节流写入期间持有的锁，写入过程中定期续期，进程退出后自动过期
+STREAM_LOCK_TIMEOUT = 60
+# 增量哈希每次最多补算的字节数（乱序到达的大量分片留给后续请求或完成上传时计算）
+HASH_ADVANCE_MAX_BYTES = 256 * 1024 * 1024
+HASH_LOCK_TIMEOUT = 60
+
+# 这些错误说明文件系统不支持预分配，退回 ftruncate（稀疏文件）
+_FALLOCATE_UNSUPPORTED = {errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+# 上传 ID：分片上传为客户端计算的文件 MD5，tus 上传为服务端生成的 UUID（hex），都是 32 位十六进制
+_UPLOAD_ID_RE = re.compile(r'^[0-9a-fA-F]{32}$')
+
+# Windows 下需要以二进制模式打开，避免换行符转换
+_BINARY = getattr(os, 'O_BINARY', 0)
+
+_redis_client = None
+
+
+class UploadError(Exception):
+    """上传参数无效或与已有上传不一致"""
+    pass
+
+
+class UploadConflict(UploadError):
+    """偏移与服务端记录不一致，或同一上传正在写入"""
+    pass
+
+
+class ChecksumMismatch(UploadError):
+    """请求体与客户端提供的校验值不一致"""
+    pass
+
+
+class UploadQuotaExceeded(UploadError):
+    """用户未完成上传的临时数据超过配额"""
+    pass
+
+
+def get_redis():
+    """上传位图、播放计数等需要原生客户端的 Redis 操作使用的连接"""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(settings.UPLOAD_REDIS_URL)
+    return _redis_client
+
+
+def _session_key(user_id, upload_id, name):
+    return f"upload:{user_id}:{upload_id}:{name}"
+
+
+def user_upload_dir(user_id):
+    return os.path.join(settings.MEDIA_ROOT, UPLOAD_DIR_NAME, str(user_id))
+
+
+def is_valid_upload_id(upload_id):
+    return isinstance(upload_id, str) and bool(_UPLOAD_ID_RE.match(upload_id))
+
+
+def upload_file_path(user_id, upload_id):
+    """
+    上传中的临时文件路径，按用户隔离
+
+    Raises:
+        UploadError: 上传 ID 不是 32 位十六进制（上传 ID 来自客户端，不能带路径分隔符或 ..）
+    """
+    if not is_valid_upload_id(upload_id):
+        raise UploadError("上传 ID 无效")
+    return os.path.join(user_upload_dir(user_id), f"{upload_id}{PARTIAL_SUFFIX}")
+
+
+def _entry_usage(path):
+    """
+    临时文件或目录占用的字节数和最后修改时间（目录取其中最新的文件）
+
+    Returns:
+        tuple: (字节数, 最后修改时间)，条目已被删除时返回 (0, 0)
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return 0, 0
+    if not os.path.isdir(path):
+        return stat.st_size, stat.st_mtime
+
+    size, mtime = 0, stat.st_mtime
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                file_stat = os.stat(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                continue
+            size += file_stat.st_size
+            mtime = max(mtime, file_stat.st_mtime)
+    return size, mtime
+
+
+def user_temp_usage(user_id):
+    """用户临时数据占用的字节数，临时文件按预分配的完整大小计算"""
+    directory = user_upload_dir(user_id)
+    if not os.path.isdir(directory):
+        return 0
+    return sum(_entry_usage(entry.path)[0] for entry in os.scandir(directory))
+
+
+def check_temp_quota(user_id, file_size):
+    """
+    新建上传前检查用户的临时数据配额（UPLOAD_USER_TEMP_QUOTA 为 0 时不限制）
+
+    Raises:
+        UploadQuotaExceeded: 加上新文件后超过配额
+    """
+    quota = getattr(settings, 'UPLOAD_USER_TEMP_QUOTA', 0)
+    if not quota:
+        return
+    usage = user_temp_usage(user_id)
+    if usage + file_size > quota:
+        logger.warning(f"上传临时空间超出配额: user_id={user_id}, 已用 {usage} 字节, 新文件 {file_size} 字节, 配额 {quota} 字节")
+        raise UploadQuotaExceeded(
+            f"未完成的上传占用空间超出限制（{quota // (1024 ** 2)} MB），请完成或取消其他上传后重试"
+        )
+
+
+def chunk_count(file_size, chunk_size):
+    return -(-file_size // chunk_size)
+
+
+def decode_bitmap(data, chunks_total):
+    """Redis 位图转为已收到的分片索引（位 0 是第一个字节的最高位）"""
+    return [
+        index for index in range(min(len(data) * 8, chunks_total))
+        if data[index >> 3] & (0x80 >> (index & 7))
+    ]
+
+
+def get_upload_session(user_id, upload_id):
+    """
+    获取上传会话
+
+    Returns:
+        dict: {'file_size', 'chunk_size', 'chunks_total'}，不存在时返回 None
+    """
+    meta = get_redis().hgetall(_session_key(user_id, upload_id, 'meta'))
+    if not meta or b'file_size' not in meta or b'chunk_size' not in meta:
+        return None
+    file_size = int(meta[b'file_size'])
+    chunk_size = int(meta[b'chunk_size'])
+    return {'file_size': file_size, 'chunk_size': chunk_size, 'chunks_total': chunk_count(file_size, chunk_size)}
+
+
+def _create_upload_file(path, file_size):
+    """创建并预分配临时文件，文件已存在（并发创建）时返回 False"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | _BINARY, 0o644)
+    except FileExistsError:
+        return False
+    try:
+        _preallocate(fd, file_size)
+    except BaseException:
+        os.close(fd)
+        os.remove(path)
+        raise
+    os.close(fd)
+    return True
+
+
+def _refresh_session(client, user_id, upload_id):
+    ttl = settings.UPLOAD_SESSION_TTL
+    client.expire(_session_key(user_id, upload_id, 'meta'), ttl)
+    client.expire(_session_key(user_id, upload_id, 'bitmap'), ttl)
+    client.expire(_session_key(user_id, upload_id, 'hash'), ttl)
+
+
+def _preallocate(fd, size):
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as e:
+            if e.errno not in _FALLOCATE_UNSUPPORTED:
+                raise
+    os.ftruncate(fd, size)
+
+
+def open_upload_session(user_id, upload_id, file_size, chunk_size):
+    """
+    创建或复用上传会话，临时文件不存在时按文件大小预分配
+
+    磁盘空间不足会在第一个分片时就报错，而不是上传到一半才失败
+
+    Raises:
+        UploadError: 参数无效，或与未完成的上传使用了不同的文件大小、分片大小
+    """
+    if file_size <= 0 or chunk_size <= 0 or chunk_size > MAX_CHUNK_SIZE:
+        raise UploadError("文件大小或分片大小无效")
+
+    path = upload_file_path(user_id, upload_id)
+    if not os.path.exists(path):
+        check_temp_quota(user_id, file_size)
+
+    client = get_redis()
+    meta_key = _session_key(user_id, upload_id, 'meta')
+    client.hsetnx(meta_key, 'file_size', file_size)
+    client.hsetnx(meta_key, 'chunk_size', chunk_size)
+
+    session = get_upload_session(user_id, upload_id)
+    if session is None or session['file_size'] != file_size or session['chunk_size'] != chunk_size:
+        raise UploadError("文件大小或分片大小与未完成的上传不一致")
+
+    if not os.path.exists(path):
+        # 临时文件已被清理，之前记录的分片和增量哈希作废
+        client.delete(_session_key(user_id, upload_id, 'bitmap'), _session_key(user_id, upload_id, 'hash'))
+        _create_upload_file(path, file_size)
+
+    _refresh_session(client, user_id, upload_id)
+    return session
+
+
+def _pwrite_all(fd, data, offset):
+    view = memoryview(data)
+    while view:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, view, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        offset += written
+        view = view[written:]
+    return offset
+
+
+def write_chunk(user_id, upload_id, session, chunk_index, stream, length, chunk_md5):
+    """
+    把分片写到临时文件中的对应位置，校验通过后在位图中标记
+
+    分片从 stream 分块读取，一边写入一边计算 MD5，不需要重新读文件；请求体直接传入时数据只落盘一次。
+    校验失败的分片不标记，位置上的数据会被重传的分片覆盖。
+    已标记的分片不再写入；同一分片同时只允许一个请求写入，避免并发重传的分片覆盖已校验的数据
+
+    Args:
+        session: open_upload_session 返回的会话
+        stream: 分片数据，带 read(size) 方法（UploadedFile 或请求流）
+        length: 分片字节数
+        chunk_md5: 客户端计算的分片 MD5
+
+    Raises:
+        UploadConflict: 同一分片正在被另一个请求写入
+        UploadError: 分片索引、大小或校验值不正确，请求体不完整，或临时文件已被清理
+    """
+    if not 0 <= chunk_index < session['chunks_total']:
+        raise UploadError(f"分片索引无效: {chunk_index}")
+
+    offset = chunk_index * session['chunk_size']
+    expected = min(session['chunk_size'], session['file_size'] - offset)
+    if length != expected:
+        raise UploadError(f"分片 {chunk_index} 大小应为 {expected} 字节，实际 {length} 字节")
+
+    # 已校验通过的分片不再覆盖，已到达的连续数据可以被边上传边处理的任务安全读取
+    client = get_redis()
+    bitmap_key = _session_key(user_id, upload_id, 'bitmap')
+    if client.getbit(bitmap_key, chunk_index):
+        return
+
+    lock_key = _session_key(user_id, upload_id, f'chunk_lock:{chunk_index}')
+    if not client.set(lock_key, 1, nx=True, ex=STREAM_LOCK_TIMEOUT):
+        raise UploadConflict(f"分片 {chunk_index} 正在上传")
+    try:
+        # 加锁前另一个请求可能刚写完同一分片
+        if client.getbit(bitmap_key, chunk_index):
+            return
+
+        try:
+            fd = os.open(upload_file_path(user_id, upload_id), os.O_WRONLY | _BINARY)
+        except FileNotFoundError:
+            raise UploadError("上传已过期，请重新上传")
+        hasher = hashlib.md5()
+        remaining = length
+        last_refresh = time.time()
+        try:
+            while remaining:
+                data = stream.read(min(STREAM_READ_SIZE, remaining))
+                if not data:
+                    raise UploadError(f"分片 {chunk_index} 不完整，请重新上传")
+                hasher.update(data)
+                offset = _pwrite_all(fd, data, offset)
+                remaining -= len(data)
+
+                if time.time() - last_refresh >= STREAM_LOCK_TIMEOUT / 3:
+                    last_refresh = time.time()
+                    client.expire(lock_key, STREAM_LOCK_TIMEOUT)
+        finally:
+            os.close(fd)
+
+        if hasher.hexdigest() != chunk_md5.lower():
+            raise UploadError(f"分片 {chunk_index} 校验失败，请重新上传")
+
+        client.setbit(bitmap_key, chunk_index, 1)
+        _refresh_session(client, user_id, upload_id)
+    finally:
+        client.delete(lock_key)
+
+    advance_upload_hash(user_id, upload_id)
+
+
+def received_chunks(user_id, upload_id, session):
+    """已收到的分片索引"""
+    data = get_redis().get(_session_key(user_id, upload_id, 'bitmap')) or b''
+    return decode_bitmap(data, session['chunks_total'])
+
+
+def received_chunk_count(user_id, upload_id):
+    return get_redis().bitcount(_session_key(user_id, upload_id, 'bitmap'))
+
+
+def contiguous_bytes(user_id, upload_id):
+    """
+    从文件开头起已连续到达的字节数
+
+    tus 上传即当前偏移；分片上传为位图中第一个未收到的分片之前的部分。会话不存在时返回 None
+
+    Returns:
+        tuple: (连续字节数, 文件大小)
+    """
+    client = get_redis()
+    meta = client.hgetall(_session_key(user_id, upload_id, 'meta'))
+    if not meta or b'file_size' not in meta:
+        return None
+    file_size = int(meta[b'file_size'])
+    if b'offset' in meta:
+        return int(meta[b'offset']), file_size
+
+    chunk_size = int(meta[b'chunk_size'])
+    chunks_total = chunk_count(file_size, chunk_size)
+    first_missing = client.bitpos(_session_key(user_id, upload_id, 'bitmap'), 0)
+    if first_missing < 0 or first_missing >= chunks_total:
+        return file_size, file_size
+    return first_missing * chunk_size, file_size
+
+
+def create_stream_upload(user_id, file_size, file_name, segment_format, declared_md5=''):
+    """
+    创建按字节偏移续传的上传（tus creation）
+
+    Returns:
+        str: 上传 ID
+    """
+    if file_size <= 0:
+        raise UploadError("文件大小无效")
+    check_temp_quota(user_id, file_size)
+
+    upload_id = uuid.uuid4().hex
+    _create_upload_file(upload_file_path(user_id, upload_id), file_size)
+
+    client = get_redis()
+    client.hset(_session_key(user_id, upload_id, 'meta'), mapping={
+        'file_size': file_size,
+        'offset': 0,
+        'file_name': file_name,
+        'segment_format': segment_format,
+        'declared_md5': declared_md5,
+    })
+    _refresh_session(client, user_id, upload_id)
+    return upload_id
+
+
+def get_stream_upload(user_id, upload_id):
+    """
+    获取字节流上传会话
+
+    Returns:
+        dict: {'file_size', 'offset', 'file_name', 'segment_format', 'declared_md5'}，不存在时返回 None
+    """
+    meta = get_redis().hgetall(_session_key(user_id, upload_id, 'meta'))
+    if not meta or b'offset' not in meta:
+        return None
+    if not os.path.exists(upload_file_path(user_id, upload_id)):
+        return None
+    return {
+        'file_size': int(meta[b'file_size']),
+        'offset': int(meta[b'offset']),
+        'file_name': meta.get(b'file_name', b'').decode(),
+        'segment_format': meta.get(b'segment_format', b'').decode(),
+        'declared_md5': meta.get(b'declared_md5', b'').decode(),
+    }
+
+
+def _sync_data(fd):
+    if hasattr(os, 'fdatasync'):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+
+
+def append_stream(user_id, upload_id, upload, offset, stream, length, checksum=None):
+    """
+    从 offset 开始把请求体写入临时文件（tus PATCH）
+
+    连接中途断开时已写入的字节也计入偏移，客户端从断点继续，不用重传整段；
+    带校验值时只有整段收齐且校验通过才推进偏移
+
+    Args:
+        upload: get_stream_upload 返回的会话
+        offset: 客户端声明的偏移，必须与服务端记录一致
+        stream: 请求体
+        length: 请求体长度
+        checksum: (算法, 摘要字节)，可选
+
+    Returns:
+        int: 新的偏移
+
+    Raises:
+        UploadConflict: 偏移不一致或同一上传正在写入
+        ChecksumMismatch: 校验失败，偏移不变
+        UploadError: 写入后超出文件大小
+    """
+    if offset != upload['offset']:
+        raise UploadConflict(f"偏移不一致，服务端偏移为 {upload['offset']}")
+    if length < 0 or offset + length > upload['file_size']:
+        raise UploadError("请求体超出文件大小")
+
+    client = get_redis()
+    lock_key = _session_key(user_id, upload_id, 'lock')
+    if not client.set(lock_key, 1, nx=True, ex=STREAM_LOCK_TIMEOUT):
+        raise UploadConflict("该上传正在写入")
+
+    hasher = hashlib.new(checksum[0]) if checksum else None
+    received = 0
+    last_refresh = time.time()
+    try:
+        fd = os.open(upload_file_path(user_id, upload_id), os.O_WRONLY | _BINARY)
+        try:
+            while received < length:
+                data = stream.read(min(STREAM_READ_SIZE, length - received))
+                if not data:
+                    break
+                if hasher:
+                    hasher.update(data)
+                _pwrite_all(fd, data, offset + received)
+                received += len(data)
+
+                if time.time() - last_refresh >= STREAM_LOCK_TIMEOUT / 3:
+                    last_refresh = time.time()
+                    client.expire(lock_key, STREAM_LOCK_TIMEOUT)
+        finally:
+            accepted = received > 0 and (
+                hasher is None or (received == length and hasher.digest() == checksum[1])
+            )
+            if accepted:
+                # 偏移对外可见前先落盘，掉电后不会出现偏移已推进但数据丢失
+                _sync_data(fd)
+                client.hset(_session_key(user_id, upload_id, 'meta'), 'offset', offset + received)
+                _refresh_session(client, user_id, upload_id)
+            os.close(fd)
+    finally:
+        client.delete(lock_key)
+
+    if hasher and received and not accepted:
+        raise ChecksumMismatch("请求体校验失败")
+    if accepted:
+        advance_upload_hash(user_id, upload_id)
+    return offset + received if accepted else offset
+
+
+def _hash_range(fd, start, end, hashers, on_progress=None):
+    """
+    读取 [start, end) 并更新各个哈希对象
+
+    Returns:
+        int: 实际读到的位置（文件提前结束时小于 end）
+    """
+    position = start
+    last_report = 0.0
+    while position < end:
+        size = min(HASH_READ_SIZE, end - position)
+        if hasattr(os, 'pread'):
+            data = os.pread(fd, size, position)
+        else:
+            os.lseek(fd, position, os.SEEK_SET)
+            data = os.read(fd, size)
+        if not data:
+            break
+        for hasher in hashers:
+            hasher.update(data)
+        position += len(data)
+
+        now = time.time()
+        if on_progress and (now - last_report >= HASH_PROGRESS_INTERVAL or position == end):
+            last_report = now
+            on_progress(position, end)
+    return position
+
+
+def hash_file(path, on_progress=None):
+    """
+    计算文件的 MD5 和 SHA256
+
+    Returns:
+        tuple: (md5, sha256, size)
+    """
+    md5 = hashlib.md5()
+    sha256 = hashlib.sha256()
+    fd = os.open(path, os.O_RDONLY | _BINARY)
+    try:
+        size = _hash_range(fd, 0, os.fstat(fd).st_size, (md5, sha256), on_progress)
+    finally:
+        os.close(fd)
+    return md5.hexdigest(), sha256.hexdigest(), size
+
+
+def _load_hash_state(client, user_id, upload_id):
+    """
+    增量哈希已覆盖的字节数和 MD5 / SHA-256 中间状态
+
+    没有中间状态，或中间状态由不兼容的 OpenSSL 生成时从头开始
+    """
+    state = client.hgetall(_session_key(user_id, upload_id, 'hash'))
+    if state and state.get(b'tag', b'').decode() == resumable_hash.STATE_TAG:
+        try:
+            return (
+                int(state[b'offset']),
+                ResumableHash('md5', state[b'md5']),
+                ResumableHash('sha256', state[b'sha256']),
+            )
+        except (KeyError, ValueError):
+            pass
+    return 0, ResumableHash('md5'), ResumableHash('sha256')
+
+
+def advance_upload_hash(user_id, upload_id):
+    """
+    把从文件开头起连续到达、尚未计算的数据加入增量哈希
+
+    刚写入的数据还在页缓存中，这里读取基本不产生磁盘 I/O。另一个请求正在计算时直接返回，
+    它解锁后会重新检查并接着处理这里新到达的数据。失败时只记录日志，完成上传时补算
+    """
+    if not resumable_hash.available():
+        return
+    client = get_redis()
+    hash_key = _session_key(user_id, upload_id, 'hash')
+    lock_key = _session_key(user_id, upload_id, 'hash_lock')
+    try:
+        while client.set(lock_key, 1, nx=True, ex=HASH_LOCK_TIMEOUT):
+            try:
+                progress = contiguous_bytes(user_id, upload_id)
+                offset, md5, sha256 = _load_hash_state(client, user_id, upload_id)
+                if progress is None or progress[0] <= offset:
+                    return
+                target = min(progress[0], offset + HASH_ADVANCE_MAX_BYTES)
+
+                fd = os.open(upload_file_path(user_id, upload_id), os.O_RDONLY | _BINARY)
+                try:
+                    offset = _hash_range(fd, offset, target, (md5, sha256))
+                finally:
+                    os.close(fd)
+                client.hset(hash_key, mapping={
+                    'offset': offset,
+                    'md5': md5.state(),
+                    'sha256': sha256.state(),
+                    'tag': resumable_hash.STATE_TAG,
+                })
+                client.expire(hash_key, settings.UPLOAD_SESSION_TTL)
+            finally:
+                client.delete(lock_key)
+
+            if offset < progress[0]:
+                # 达到单次上限
+                return
+            # 加锁期间到达的数据：对应请求加锁失败后直接返回，由这里继续
+            progress = contiguous_bytes(user_id, upload_id)
+            if progress is None or progress[0] <= offset:
+                return
+    except (OSError, redis.RedisError) as e:
+        logger.warning(f"增量计算上传哈希失败: user_id={user_id}, upload_id={upload_id}, 错误: {e}")
+
+
+def verify_upload(user_id, upload_id, on_progress=None):
+    """
+    所有数据到达后，把临时文件刷到磁盘并得到整个文件的哈希
+
+    从增量哈希的中间状态继续，只读取尚未计算的部分；运行环境不支持续算时读取整个文件
+
+    Returns:
+        tuple: (md5, sha256, size)
+    """
+    path = upload_file_path(user_id, upload_id)
+    fd = os.open(path, os.O_RDONLY | _BINARY)
+    try:
+        os.fsync(fd)
+        if resumable_hash.available():
+            offset, md5, sha256 = _load_hash_state(get_redis(), user_id, upload_id)
+            size = os.fstat(fd).st_size
+            if offset > size:
+                offset, md5, sha256 = 0, ResumableHash('md5'), ResumableHash('sha256')
+            if offset < size:
+                logger.info(f"完成上传时补算哈希: upload_id={upload_id}, 已计算 {offset} 字节, 文件 {size} 字节")
+            size = _hash_range(fd, offset, size, (md5, sha256), on_progress)
+            return md5.hexdigest(), sha256.hexdigest(), size
+    finally:
+        os.close(fd)
+    return hash_file(path, on_progress)
+
+
+def commit_upload(user_id, upload_id, target_path):
+    """临时文件重命名为最终文件（同一文件系统内，不拷贝数据）"""
+    os.replace(upload_file_path(user_id, upload_id), target_path)
+    _fsync_dir(os.path.dirname(target_path))
+
+
+def rollback_upload(user_id, upload_id, target_path):
+    """创建视频失败时把文件移回临时位置，用户可以重新完成上传"""
+    os.replace(target_path, upload_file_path(user_id, upload_id))
+
+
+def clear_upload_session(user_id, upload_id):
+    get_redis().delete(
+        _session_key(user_id, upload_id, 'meta'),
+        _session_key(user_id, upload_id, 'bitmap'),
+        _session_key(user_id, upload_id, 'hash'),
+    )
+
+
+def discard_upload(user_id, upload_id):
+    """删除临时文件和上传会话"""
+    path = upload_file_path(user_id, upload_id)
+    if os.path.exists(path):
+        os.remove(path)
+    clear_upload_session(user_id, upload_id)
+
+
+def _remove_entry(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def sweep_stale_uploads(max_age):
+    """
+    清理放弃的上传
+
+    最后修改时间早于 max_age 秒、且 Redis 中已没有上传会话的临时文件和边上传边处理的暂存目录会被删除；
+    旧版本的分片目录只按修改时间清理
+
+    Returns:
+        dict: {'files': 删除的条目数, 'bytes': 回收的字节数, 'remaining_bytes': 剩余临时数据的字节数}
+    """
+    cutoff = time.time() - max_age
+    result = {'files': 0, 'bytes': 0, 'remaining_bytes': 0}
+
+    def sweep(path, has_session=None):
+        size, mtime = _entry_usage(path)
+        if mtime >= cutoff or (has_session is not None and has_session()):
+            result['remaining_bytes'] += size
+            return
+        _remove_entry(path)
+        result['files'] += 1
+        result['bytes'] += size
+        logger.info(f"清理放弃的上传: {path}，{size} 字节")
+
+    upload_root = os.path.join(settings.MEDIA_ROOT, UPLOAD_DIR_NAME)
+    if os.path.isdir(upload_root):
+        client = get_redis()
+        for user_entry in os.scandir(upload_root):
+            if not user_entry.is_dir():
+                continue
+            for entry in os.scandir(user_entry.path):
+                # <上传 ID>.part 或 <上传 ID>.progressive
+                upload_id = entry.name.split('.', 1)[0]
+                meta_key = _session_key(user_entry.name, upload_id, 'meta')
+                sweep(entry.path, lambda: client.exists(meta_key))
+
+    legacy_root = os.path.join(settings.MEDIA_ROOT, LEGACY_CHUNK_DIR_NAME)
+    if os.path.isdir(legacy_root):
+        for entry in os.scandir(legacy_root):
+            sweep(entry.path)
+
+    return result
+
+
+def record_sweep_stats(result):
+    """累计清理统计，供系统信息页展示"""
+    stats = cache.get(UPLOAD_GC_STATS_KEY) or {'runs': 0, 'reclaimed_files': 0, 'reclaimed_bytes': 0}
+    stats['runs'] += 1
+    stats['reclaimed_files'] += result['files']
+    stats['reclaimed_bytes'] += result['bytes']
+    stats.update({
+        'last_run': timezone.now().isoformat(),
+        'last_reclaimed_files': result['files'],
+        'last_reclaimed_bytes': result['bytes'],
+        'temp_bytes': result['remaining_bytes'],
+    })
+    cache.set(UPLOAD_GC_STATS_KEY, stats, None)
+    return stats
+
+
+def get_sweep_stats():
+    return cache.get(UPLOAD_GC_STATS_KEY)
+
+
+def _fsync_dir(path):
+    """重命名后同步目录项，保证掉电后文件名也已落盘（Windows 不支持，忽略）"""
+    try:
+        dir_fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
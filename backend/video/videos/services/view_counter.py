@@ -0,0 +1,63 @@
+"""
+播放次数计数
+每次播放只在 Redis 哈希中累加增量，由定时任务把所有视频的增量合并为一条 UPDATE 写入数据库，
+避免热门视频的行锁竞争和 views_count 索引的频繁更新；接口返回数据库中的值加上未写入的增量
+"""
+import redis
+from django.db.models import Case, F, IntegerField, Value, When
+
+from ..models import Video
+from .uploads import get_redis
+
+PENDING_VIEWS_KEY = 'video_views:pending'
+# 写入数据库期间的增量，写入成功后删除；写入失败时下次继续写入
+FLUSHING_VIEWS_KEY = 'video_views:flushing'
+FLUSH_LOCK_KEY = 'video_views:flush_lock'
+FLUSH_LOCK_TIMEOUT = 60
+
+
+def record_view(video_id):
+    """累加一次播放"""
+    get_redis().hincrby(PENDING_VIEWS_KEY, video_id, 1)
+
+
+def pending_views(video_id):
+    """尚未写入数据库的播放次数"""
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.hget(PENDING_VIEWS_KEY, video_id)
+    pipe.hget(FLUSHING_VIEWS_KEY, video_id)
+    return sum(int(count or 0) for count in pipe.execute())
+
+
+def flush_view_counts():
+    """
+    把累计的播放次数写入数据库
+
+    Returns:
+        int: 更新的视频数
+    """
+    client = get_redis()
+    # 同一时间只允许一个写入任务，避免重复累加
+    if not client.set(FLUSH_LOCK_KEY, 1, nx=True, ex=FLUSH_LOCK_TIMEOUT):
+        return 0
+    try:
+        if not client.exists(FLUSHING_VIEWS_KEY):
+            try:
+                # 重命名是原子操作，之后的播放累加到新的哈希中
+                client.rename(PENDING_VIEWS_KEY, FLUSHING_VIEWS_KEY)
+            except redis.ResponseError:
+                # 没有新的播放
+                return 0
+
+        deltas = {int(video_id): int(count) for video_id, count in client.hgetall(FLUSHING_VIEWS_KEY).items()}
+        deltas = {video_id: count for video_id, count in deltas.items() if count > 0}
+        if deltas:
+            Video.objects.filter(id__in=deltas).update(views_count=F('views_count') + Case(
+                *[When(id=video_id, then=Value(count)) for video_id, count in deltas.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            ))
+        client.delete(FLUSHING_VIEWS_KEY)
+        return len(deltas)
+    finally:
+        client.delete(FLUSH_LOCK_KEY)
@@ -0,0 +1,147 @@
+"""
+观看记录批量写入
+观看接口只做去重判断并把观看事件放入 Redis 队列，由定时任务批量写入 VideoView：
+未登录观众的记录批量创建，登录用户每个视频保留一条记录，批量更新或创建。
+队列先整体改名为处理中列表，每批写入数据库成功后才从中删除，写入失败的事件下次继续写入。
+同一观众（登录用户按用户，未登录按 IP + User-Agent 哈希）在去重窗口内重复观看只计一次播放，未登录观众也不重复记录
+"""
+import json
+import time
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+
+import redis
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from ..models import Video, VideoView
+from .uploads import get_redis
+
+VIEW_EVENTS_KEY = 'video_views:events'
+# 正在写入数据库的事件，每批写入成功后删除；写入失败时下次继续写入
+PROCESSING_EVENTS_KEY = 'video_views:events:processing'
+INGEST_LOCK_KEY = 'video_views:ingest_lock'
+INGEST_LOCK_TIMEOUT = 300
+# 每批写入的事件数，每次任务最多处理的批数
+VIEW_EVENT_BATCH_SIZE = 1000
+VIEW_EVENT_MAX_BATCHES = 20
+
+USER_AGENT_MAX_LENGTH = 255
+
+
+def _dedup_key(video_id, user_id, ip_address, user_agent):
+    if user_id:
+        return f"vv:{video_id}:u{user_id}"
+    user_agent_hash = hashlib.blake2b((user_agent or '').encode('utf-8'), digest_size=6).hexdigest()
+    return f"vv:{video_id}:{ip_address or '-'}:{user_agent_hash}"
+
+
+def claim_view(video_id, user_id, ip_address, user_agent):
+    """
+    观众在去重窗口内第一次观看时返回 True（计入播放次数）
+
+    去重标记只保存在 Redis 中，窗口结束后自动过期
+    """
+    key = _dedup_key(video_id, user_id, ip_address, user_agent)
+    return bool(get_redis().set(key, 1, nx=True, ex=settings.VIDEO_VIEW_DEDUP_WINDOW))
+
+
+def enqueue_view_event(video_id, user_id, ip_address, user_agent, watched_duration):
+    try:
+        watched_duration = float(watched_duration or 0)
+    except (TypeError, ValueError):
+        watched_duration = 0.0
+    get_redis().rpush(VIEW_EVENTS_KEY, json.dumps({
+        'video_id': video_id,
+        'user_id': user_id,
+        'ip_address': ip_address,
+        'user_agent': (user_agent or '')[:USER_AGENT_MAX_LENGTH],
+        'watched_duration': watched_duration,
+        'viewed_at': time.time(),
+    }))
+
+
+def _write_events(events):
+    """写入一批事件：忽略已删除的视频和用户，登录用户同一视频只保留最后一次观看"""
+    video_ids = set(Video.objects.filter(id__in={e['video_id'] for e in events}).values_list('id', flat=True))
+    user_ids = set(get_user_model().objects.filter(
+        id__in={e['user_id'] for e in events if e['user_id']}
+    ).values_list('id', flat=True))
+
+    anonymous = []
+    latest = {}
+    for event in events:
+        if event['video_id'] not in video_ids:
+            continue
+        if not event['user_id']:
+            anonymous.append(event)
+        elif event['user_id'] in user_ids:
+            latest[(event['user_id'], event['video_id'])] = event
+
+    def fill(view, event):
+        view.view_date = datetime.fromtimestamp(event['viewed_at'], tz=dt_timezone.utc)
+        view.ip_address = event['ip_address']
+        view.user_agent = event['user_agent']
+        view.watched_duration = event['watched_duration']
+        return view
+
+    new_views = [fill(VideoView(video_id=e['video_id'], user=None), e) for e in anonymous]
+
+    if latest:
+        existing = {}
+        for view in VideoView.objects.filter(
+            user_id__in={user_id for user_id, _ in latest},
+            video_id__in={video_id for _, video_id in latest},
+        ).order_by('view_date'):
+            existing[(view.user_id, view.video_id)] = view
+
+        updated = []
+        for pair, event in latest.items():
+            view = existing.get(pair)
+            if view is None:
+                new_views.append(fill(VideoView(user_id=pair[0], video_id=pair[1]), event))
+            else:
+                updated.append(fill(view, event))
+        if updated:
+            VideoView.objects.bulk_update(
+                updated, ['view_date', 'ip_address', 'user_agent', 'watched_duration'],
+                batch_size=VIEW_EVENT_BATCH_SIZE,
+            )
+
+    if new_views:
+        VideoView.objects.bulk_create(new_views, batch_size=VIEW_EVENT_BATCH_SIZE)
+
+
+def ingest_view_events():
+    """
+    批量写入队列中的观看事件
+
+    Returns:
+        int: 处理的事件数
+    """
+    client = get_redis()
+    # 同一时间只允许一个写入任务，避免同一批事件重复写入
+    if not client.set(INGEST_LOCK_KEY, 1, nx=True, ex=INGEST_LOCK_TIMEOUT):
+        return 0
+    try:
+        total = 0
+        for _ in range(VIEW_EVENT_MAX_BATCHES):
+            if not client.exists(PROCESSING_EVENTS_KEY):
+                try:
+                    # 重命名是原子操作，之后的观看事件进入新的队列
+                    client.rename(VIEW_EVENTS_KEY, PROCESSING_EVENTS_KEY)
+                except redis.ResponseError:
+                    # 没有新的观看事件
+                    break
+
+            raw_events = client.lrange(PROCESSING_EVENTS_KEY, 0, VIEW_EVENT_BATCH_SIZE - 1)
+            if raw_events:
+                with transaction.atomic():
+                    _write_events([json.loads(raw) for raw in raw_events])
+            # 列表清空后 Redis 自动删除该 key
+            client.ltrim(PROCESSING_EVENTS_KEY, len(raw_events), -1)
+            total += len(raw_events)
+        return total
+    finally:
+        client.delete(INGEST_LOCK_KEY)
@@ -4,13 +4,91 @@ import subprocess
 import shutil
 from datetime import datetime
 from pathlib import Path
-from celery import shared_task
+from celery import shared_task, chord
 from django.conf import settings
 from django.utils import timezone
 from django.core.cache import cache
 import logging
 import hashlib
 
+from .services.hls import (
+    select_resolutions,
+    rendition_name,
+    build_video_encode_args,
+    build_audio_encode_args,
+    build_hls_output_args,
+    build_rendition_command,
+    build_audio_command,
+    write_master_playlist,
+    is_rendition_complete,
+    check_hls_integrity,
+    find_passthrough_rung,
+    AUDIO_RENDITION_NAME,
+    SEGMENT_FORMAT_TS,
+    SEGMENT_FORMAT_FMP4,
+    SEGMENT_FORMAT_FMP4_SINGLE,
+    PASSTHROUGH_MAX_KEYFRAME_INTERVAL,
+)
+from .services.chunking import (
+    probe_keyframe_times,
+    plan_chunks,
+    chunk_dir_for,
+    build_chunk_command,
+    is_chunk_complete,
+    mark_chunk_complete,
+    assemble_chunked_rendition,
+)
+from .services.ffmpeg_runner import run_ffmpeg, FFmpegError
+from .services.playlist_cache import invalidate_playlists
+from .services.view_counter import flush_view_counts
+from .services.view_events import ingest_view_events
+from .services.ladder import probe_complexity, build_content_aware_ladder
+from .services.sprites import build_sprite_config, build_sprite_output_args, write_thumbnails_vtt
+from .services.thumbnails import extract_candidate_frames, rank_candidate_frames, CANDIDATE_DIR_NAME
+from .services.probe import probe_video, probe_video_for, get_file_key
+from .services.fingerprint import (
+    extract_fingerprint_frames,
+    phash_frames,
+    unpack_hashes,
+    save_fingerprint,
+    find_near_duplicates,
+)
+from .services.uploads import (
+    ChecksumMismatch,
+    verify_upload,
+    commit_upload,
+    rollback_upload,
+    discard_upload,
+    contiguous_bytes,
+    upload_file_path,
+    sweep_stale_uploads,
+    record_sweep_stats,
+)
+from .services.progressive import (
+    PROGRESSIVE_RUNNING,
+    GrowingFileReader,
+    find_moov_position,
+    covered_duration,
+    staging_dir,
+    claim_progressive,
+    get_progressive_state,
+    update_progressive_state,
+    mark_upload_completed,
+    link_progressive_video,
+    discard_progressive,
+    adopt_progressive_output,
+)
+from .services.media_assets import (
+    find_asset,
+    register_asset,
+    retain_asset,
+    apply_asset_to_video,
+    claim_asset_transcode,
+    abandon_asset_transcode,
+    publish_asset,
+    delete_video_files,
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -86,6 +164,297 @@ def is_video_locked(video_id):
     return cache.get(lock_key) is not None
 
 
+def format_duration(seconds):
+    """格式化时长为 HH:MM:SS 或 MM:SS"""
+    if seconds <= 0:
+        return "00:00"
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    if hours > 0:
+        return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
+
+
+def make_transcode_progress_reporter(task, video_id, user_id=None, label=None):
+    """
+    构建转码进度回调
+
+    通过 update_state 发布 PROGRESS 状态；传入 user_id 时同时通过 WebSocket 推送百分比和剩余时间
+    """
+    def report_progress(snapshot):
+        meta = {'video_id': video_id, **snapshot}
+        if label:
+            meta['rendition'] = label
+        task.update_state(state='PROGRESS', meta=meta)
+
+        if user_id is None:
+            return
+        try:
+            from core.websocket import send_video_status_update
+            send_video_status_update(
+                user_id=user_id,
+                video_data={
+                    'id': video_id,
+                    'status': 'processing',
+                    'progress': snapshot['percent'],
+                    'eta': snapshot['eta'],
+                    'speed': snapshot['speed'],
+                }
+            )
+        except Exception as e:
+            logger.warning(f"[Task {task.request.id}] 推送转码进度失败: {e}")
+
+    return report_progress
+
+
+def write_preview_track(task_id, media_info, chunks=None):
+    """
+    根据转码时生成的雪碧图写入 thumbnails.vtt
+
+    Returns:
+        str | None: 相对 MEDIA_ROOT 的 VTT 路径
+    """
+    sprite = media_info.get('sprite')
+    if not sprite:
+        return None
+    try:
+        vtt_path = write_thumbnails_vtt(sprite, media_info['duration'], chunks)
+    except Exception as e:
+        logger.warning(f"[Task {task_id}] 生成预览缩略图轨道失败: {e}")
+        return None
+    if not vtt_path:
+        return None
+    return os.path.relpath(vtt_path, settings.MEDIA_ROOT).replace('\\', '/')
+
+
+def on_video_processed(task_id, video):
+    """视频转码完成（或复用共享转码结果）后：通知用户、推送状态更新、计算视频指纹"""
+    try:
+        send_video_notification(
+            user=video.user,
+            video=video,
+            notification_type='processing_complete',
+            title='视频处理完成',
+            content=f'您的视频《{video.title}》已处理完成，正在等待审核。'
+        )
+        logger.info(f"[Task {task_id}] 已发送转码完成通知给用户 {video.user_id}")
+    except Exception as e:
+        logger.warning(f"[Task {task_id}] 发送通知失败: {e}")
+    
+    # 发送视频状态和元数据更新（包含时长等信息）
+    try:
+        from core.websocket import send_video_status_update
+        
+        send_video_status_update(
+            user_id=video.user_id,
+            video_data={
+                'id': video.id,
+                'status': video.status,
+                'title': video.title,
+                'duration': format_duration(video.duration),
+                'resolution': video.resolution,
+                'thumbnail': video.thumbnail.url if video.thumbnail else None,
+            }
+        )
+        logger.info(f"[Task {task_id}] 已发送视频状态更新给用户 {video.user_id}")
+    except Exception as e:
+        logger.warning(f"[Task {task_id}] 发送视频状态更新失败: {e}")
+    
+    # 近似重复检测，结果供审核员参考
+    try:
+        fingerprint_video.delay(video.id)
+    except Exception as e:
+        logger.warning(f"[Task {task_id}] 提交视频指纹任务失败: {e}")
+
+
+def complete_video_processing(task_id, video_id, hls_dir, file_identifier, resolutions, media_info, thumbnail_file,
+                              chunks=None):
+    """
+    转码完成后的收尾工作：最终验证 HLS 文件、生成预览缩略图轨道、保存技术参数和封面、通知用户
+
+    单命令转码和分布式转码的汇总任务共用此逻辑
+    """
+    from .models import Video
+
+    relative_hls_path = f'videos/hls/{file_identifier}/master.m3u8'
+    relative_thumbnail_path = os.path.relpath(thumbnail_file, settings.MEDIA_ROOT).replace('\\', '/')
+    
+    final_check_passed = False
+    try:
+        final_check_passed, missing = check_hls_integrity(hls_dir)
+        if final_check_passed:
+            logger.info(f"[Task {task_id}] 最终验证通过：HLS 文件完整")
+        else:
+            logger.error(f"[Task {task_id}] 不完整的子播放列表: {missing}")
+    except Exception as e:
+        logger.error(f"[Task {task_id}] 最终验证失败: {e}")
+    
+    if not final_check_passed:
+        logger.error(f"[Task {task_id}] 最终验证失败：HLS 文件不完整或不存在")
+        # 清理失败的文件
+        if os.path.exists(hls_dir):
+            shutil.rmtree(hls_dir)
+        raise Exception("转码完成但文件验证失败，HLS 文件不完整")
+    
+    video = Video.objects.get(id=video_id)
+    
+    video.hls_file = relative_hls_path
+    video.duration = media_info['duration']
+    video.resolution = max(rung['height'] for rung in resolutions)  # 保存最高分辨率
+    
+    # 保存视频技术参数
+    video.width = media_info['width']
+    video.height = media_info['height']
+    video.aspect_ratio = media_info['aspect_ratio']
+    video.video_codec = media_info['video_codec']
+    video.audio_codec = media_info['audio_codec']
+    video.bitrate = media_info['bitrate']
+    video.video_bitrate = media_info['video_bitrate']
+    video.audio_bitrate = media_info['audio_bitrate']
+    video.frame_rate = media_info['frame_rate']
+    video.file_size = media_info['file_size']
+    video.hls_segment_format = media_info.get('segment_format', SEGMENT_FORMAT_TS)
+    video.preview_vtt = write_preview_track(task_id, media_info, chunks)
+    video.thumbnail_candidates = media_info.get('thumbnail_candidates', [])
+    video.encoding_ladder = {
+        'complexity': media_info.get('complexity'),
+        'rungs': resolutions,
+    }
+    
+    has_user_thumbnail = False
+    if video.thumbnail:
+        thumbnail_path = os.path.join(settings.MEDIA_ROOT, video.thumbnail.name)
+        if os.path.exists(thumbnail_path):
+            has_user_thumbnail = True
+            logger.info(f"[Task {task_id}] 保留用户上传的封面: {video.thumbnail.name}")
+    
+    if not has_user_thumbnail and os.path.exists(thumbnail_file):
+        video.thumbnail = relative_thumbnail_path
+        logger.info(f"[Task {task_id}] 使用自动生成的封面: {relative_thumbnail_path}")
+    
+    video.status = 'pending'
+    video.save(update_fields=[
+        'hls_file', 'duration', 'resolution', 'status', 'thumbnail',
+        'width', 'height', 'aspect_ratio', 'video_codec', 'audio_codec',
+        'bitrate', 'video_bitrate', 'audio_bitrate', 'frame_rate', 'file_size',
+        'encoding_ladder', 'hls_segment_format', 'preview_vtt', 'thumbnail_candidates'
+    ])
+    
+    on_video_processed(task_id, video)
+    
+    # 内容去重：记录共享资源的转码结果，并同步给等待该资源的其他视频
+    if video.media_asset_id:
+        auto_thumbnail = relative_thumbnail_path if os.path.exists(thumbnail_file) else ''
+        for shared_video in publish_asset(video, auto_thumbnail):
+            logger.info(f"[Task {task_id}] 视频 {shared_video.id} 复用共享转码结果")
+            on_video_processed(task_id, shared_video)
+    
+    logger.info(f"[Task {task_id}] {'='*60}")
+    logger.info(f"[Task {task_id}] 视频 {video_id} 处理完成！")
+    logger.info(f"[Task {task_id}] 生成了 {len(resolutions)} 个分辨率")
+    logger.info(f"[Task {task_id}] HLS 文件: {relative_hls_path}")
+    logger.info(f"[Task {task_id}] {'='*60}")
+    return {"status": "success", "video_id": video_id, "resolutions": len(resolutions)}
+
+
+def plan_resolutions(task_id, probe, width, height, video_file_path=None, content_aware=False):
+    """
+    确定转码阶梯：按源分辨率选择档位，可选按画面复杂度调整，并标记可以直接复制视频流的档位
+
+    Returns:
+        tuple: (resolutions, complexity)
+    """
+    resolutions = select_resolutions(width, height)
+
+    # 按画面复杂度调整码率、CRF，并跳过对画质没有明显提升的档位
+    complexity = None
+    if content_aware:
+        try:
+            complexity = probe_complexity(video_file_path, probe.duration)
+            resolutions = build_content_aware_ladder(resolutions, complexity)
+        except Exception as e:
+            logger.warning(f"[Task {task_id}] 复杂度检测失败，使用默认转码阶梯: {e}")
+            complexity = None
+
+    logger.info(f"[Task {task_id}] 将生成分辨率: {[(r['width'], r['height'], r['bitrate'], r['crf']) for r in resolutions]}")
+
+    # 源视频已经是 HLS 兼容的 H.264 时，对应分辨率直接复制视频流，只对更低分辨率重新编码
+    passthrough_rung = find_passthrough_rung(resolutions, {
+        'video_codec': probe.video_codec,
+        'profile': probe.profile,
+        'pix_fmt': probe.pix_fmt,
+        'level': probe.level,
+        'width': width,
+        'height': height,
+        'video_bitrate': probe.video_bitrate,
+    })
+    if passthrough_rung:
+        # 关键帧间隔来自探测时采样的开头一段
+        gop = probe.max_keyframe_interval if probe.keyframe_count else float('inf')
+
+        if gop <= PASSTHROUGH_MAX_KEYFRAME_INTERVAL:
+            passthrough_rung['passthrough'] = True
+            if probe.video_bitrate:
+                passthrough_rung['bitrate'] = probe.video_bitrate
+            logger.info(f"[Task {task_id}] {rendition_name(passthrough_rung)} 直接复制源视频流（关键帧间隔 {gop:.2f} 秒）")
+        else:
+            logger.info(f"[Task {task_id}] 关键帧间隔 {gop:.2f} 秒过大，{rendition_name(passthrough_rung)} 仍需重新编码")
+
+    return resolutions, complexity
+
+
+def build_multi_output_command(task_id, input_path, hls_dir, resolutions, video_codec, has_audio,
+                               segment_format, sprite):
+    """
+    单命令多输出：一次读取源文件，同时输出所有分辨率、共享音轨和预览雪碧图，已存在的输出跳过
+
+    Returns:
+        list | None: FFmpeg 命令，所有输出都已存在时返回 None
+    """
+    hls_cmd = [
+        'ffmpeg',
+        '-i', input_path,
+    ]
+    
+    # 为每个分辨率添加输出流
+    for rung in resolutions:
+        res_dir = os.path.join(hls_dir, rendition_name(rung))
+        res_m3u8 = os.path.join(res_dir, 'index.m3u8')
+        
+        # 跳过已存在的分辨率
+        if os.path.exists(res_m3u8):
+            logger.info(f"[Task {task_id}] {rendition_name(rung)} 已存在，跳过")
+            continue
+        
+        # 视频流映射
+        hls_cmd.extend(['-map', '0:v:0'])
+        
+        # 视频编码设置（音频由共享音轨提供）
+        hls_cmd.extend(build_video_encode_args(rung, video_codec))
+        hls_cmd.extend(['-an'])
+        
+        # HLS 设置
+        hls_cmd.extend(build_hls_output_args(res_dir, segment_format))
+    
+    # 共享音轨作为同一命令的一个额外输出
+    audio_dir = os.path.join(hls_dir, AUDIO_RENDITION_NAME)
+    if has_audio and not os.path.exists(os.path.join(audio_dir, 'index.m3u8')):
+        hls_cmd.extend([
+            '-map', '0:a:0',
+            '-vn',
+            *build_audio_encode_args(),
+            *build_hls_output_args(audio_dir, segment_format),
+        ])
+    
+    if len(hls_cmd) <= 3:
+        return None
+    
+    # 预览雪碧图复用同一次解码
+    hls_cmd.extend(build_sprite_output_args(sprite))
+    return hls_cmd
+
+
 @shared_task(bind=True, max_retries=3, default_retry_delay=60)
 def process_video(self, video_id):
     """
@@ -109,6 +478,9 @@ def process_video(self, video_id):
         logger.warning(f"[Task {task_id}] 视频 {video_id} 正在被其他任务处理（Redis锁），跳过")
         return {"status": "skipped", "reason": "already_processing"}
     
+    # 分布式转码时锁由汇总任务释放
+    lock_handed_off = False
+    
     try:
         # 第二层防护：数据库状态检查 + 原子更新
         # 只处理 uploading、processing 或 transcoding 状态的视频
@@ -142,6 +514,23 @@ def process_video(self, video_id):
         if not os.path.exists(video_file_path):
             raise FileNotFoundError(f"视频文件不存在: {video_file_path}")
         
+        # 内容去重：共享资源已有转码结果时直接复用，正在由其他视频转码时等待其完成
+        asset = video.media_asset
+        if asset is not None:
+            if asset.status == 'ready' and asset.hls_file:
+                asset_hls_dir = os.path.dirname(os.path.join(settings.MEDIA_ROOT, asset.hls_file))
+                if check_hls_integrity(asset_hls_dir)[0]:
+                    apply_asset_to_video(video, asset)
+                    on_video_processed(task_id, video)
+                    logger.info(f"[Task {task_id}] 视频 {video_id} 复用共享资源 {asset.id} 的转码结果")
+                    return {"status": "success", "reason": "shared_asset"}
+                logger.warning(f"[Task {task_id}] 共享资源 {asset.id} 的 HLS 文件不完整，将重新转码")
+                type(asset).objects.filter(id=asset.id, status='ready').update(status='uploaded')
+            
+            if not claim_asset_transcode(asset, video):
+                logger.info(f"[Task {task_id}] 共享资源 {asset.id} 正在由其他视频转码，完成后自动同步")
+                return {"status": "waiting", "reason": "shared_asset_processing"}
+        
         # 提取文件标识符
         file_path, file_name = os.path.split(video_file_path)
         file_base_name, file_ext = os.path.splitext(file_name)
@@ -158,53 +547,45 @@ def process_video(self, video_id):
         master_m3u8_path = os.path.join(hls_dir, 'master.m3u8')
         if os.path.exists(master_m3u8_path):
             logger.info(f"[Task {task_id}] HLS 文件已存在，检查完整性...")
-            
-            # 读取 master.m3u8 获取所有分辨率
+
+            # 检查 master.m3u8 引用的每个子播放列表是否存在且有切片
             try:
-                with open(master_m3u8_path, 'r') as f:
-                    content = f.read()
-                    # 提取所有分辨率的 m3u8 文件路径
-                    import re
-                    resolution_files = re.findall(r'(\d+p)/index\.m3u8', content)
-                    
-                    # 检查每个分辨率的 index.m3u8 是否存在且有内容
-                    all_complete = True
-                    for res in resolution_files:
-                        res_m3u8 = os.path.join(hls_dir, res, 'index.m3u8')
-                        if not os.path.exists(res_m3u8):
-                            logger.warning(f"[Task {task_id}] {res}/index.m3u8 不存在")
-                            all_complete = False
-                            break
-                        
-                        # 检查 m3u8 文件是否有内容（至少有一个 .ts 文件）
-                        with open(res_m3u8, 'r') as rf:
-                            m3u8_content = rf.read()
-                            if '.ts' not in m3u8_content:
-                                logger.warning(f"[Task {task_id}] {res}/index.m3u8 没有 ts 文件引用")
-                                all_complete = False
-                                break
-                    
-                    if all_complete:
-                        # 所有分辨率都完整，直接更新状态
-                        relative_hls_path = f'videos/hls/{file_identifier}/master.m3u8'
-                        video.hls_file = relative_hls_path
-                        video.status = 'pending'
-                        video.save(update_fields=['hls_file', 'status'])
-                        logger.info(f"[Task {task_id}] 视频 {video_id} HLS文件完整，直接更新状态")
-                        return {"status": "success", "reason": "already_exists"}
-                    else:
-                        logger.warning(f"[Task {task_id}] HLS 文件不完整，将重新转码")
-                        # 删除不完整的文件
-                        if os.path.exists(hls_dir):
-                            shutil.rmtree(hls_dir)
-                            logger.info(f"[Task {task_id}] 已删除不完整的 HLS 目录")
-                        
+                all_complete, missing = check_hls_integrity(hls_dir)
+
+                if all_complete:
+                    # 所有分辨率都完整，直接更新状态
+                    relative_hls_path = f'videos/hls/{file_identifier}/master.m3u8'
+                    video.hls_file = relative_hls_path
+                    video.status = 'pending'
+                    video.save(update_fields=['hls_file', 'status'])
+                    logger.info(f"[Task {task_id}] 视频 {video_id} HLS文件完整，直接更新状态")
+                    return {"status": "success", "reason": "already_exists"}
+                else:
+                    logger.warning(f"[Task {task_id}] HLS 文件不完整（{missing}），将重新转码")
+                    # 删除不完整的文件
+                    if os.path.exists(hls_dir):
+                        shutil.rmtree(hls_dir)
+                        logger.info(f"[Task {task_id}] 已删除不完整的 HLS 目录")
+
             except Exception as e:
                 logger.warning(f"[Task {task_id}] 检查 HLS 完整性失败: {e}，将重新转码")
                 # 删除可能损坏的文件
                 if os.path.exists(hls_dir):
                     shutil.rmtree(hls_dir)
         
+        # 边上传边处理：接管上传过程中暂存的转码结果，转码仍在进行时稍后再处理
+        adopted = None
+        if getattr(settings, 'VIDEO_PROGRESSIVE_UPLOAD', False) and not os.path.exists(master_m3u8_path):
+            adopted = adopt_progressive_output(video, hls_dir)
+            if adopted == PROGRESSIVE_RUNNING:
+                logger.info(f"[Task {task_id}] 上传过程中的转码仍在进行，{PROGRESSIVE_RETRY_COUNTDOWN} 秒后再处理")
+                self.apply_async((video_id,), countdown=PROGRESSIVE_RETRY_COUNTDOWN)
+                return {"status": "deferred", "reason": "progressive_transcoding"}
+            if adopted:
+                logger.info(f"[Task {task_id}] 已接管上传过程中的转码结果")
+        
+        # 重新转码会改写播放列表，清除本进程缓存的旧内容
+        invalidate_playlists(hls_dir)
         os.makedirs(hls_dir, exist_ok=True)
         
         # 创建缩略图输出目录
@@ -216,194 +597,172 @@ def process_video(self, video_id):
         )
         os.makedirs(thumbnails_dir, exist_ok=True)
         
-        # 获取视频信息
-        probe_cmd = [
-            'ffprobe',
-            '-v', 'error',
-            '-show_entries', 'stream=width,height,codec_name,codec_type,bit_rate,r_frame_rate,sample_rate,channels:format=duration,size,bit_rate',
-            '-of', 'json',
-            video_file_path
-        ]
-        
-        probe_process = subprocess.run(
-            probe_cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True
-        )
-        
-        if probe_process.returncode != 0:
-            logger.error(f"[Task {task_id}] 获取视频信息失败: {probe_process.stderr}")
-            raise Exception(f"获取视频信息失败: {probe_process.stderr}")
-        
-        import json
-        video_info = json.loads(probe_process.stdout)
-        logger.info(f"[Task {task_id}] FFprobe 输出: {json.dumps(video_info, indent=2)}")
-        
-        # 获取视频时长
-        duration = 0
-        if 'format' in video_info and 'duration' in video_info['format']:
-            try:
-                duration = float(video_info['format']['duration'])
-                logger.info(f"[Task {task_id}] 从 format.duration 获取时长: {duration}秒")
-            except (ValueError, TypeError) as e:
-                logger.warning(f"[Task {task_id}] 解析 format.duration 失败: {e}")
-        
-        if duration == 0:
-            for stream in video_info.get('streams', []):
-                if 'duration' in stream:
-                    try:
-                        duration = float(stream['duration'])
-                        logger.info(f"[Task {task_id}] 从 stream.duration 获取时长: {duration}秒")
-                        break
-                    except (ValueError, TypeError):
-                        pass
+        # 获取视频信息（一次 ffprobe，结果缓存在 Redis 和 Video.probe_data）
+        probe = probe_video_for(video, video_file_path)
         
+        duration = probe.duration
         if duration == 0:
             logger.warning(f"[Task {task_id}] 无法获取视频时长，使用默认值 0")
         
-        # 获取视频分辨率
-        width, height = 0, 0
-        video_codec = ''
-        audio_codec = ''
-        video_bitrate = 0
-        audio_bitrate = 0
-        frame_rate = 0
-        has_audio = False  # 标记是否有音频流
-        
-        for stream in video_info.get('streams', []):
-            codec_type = stream.get('codec_type', '')
-            
-            if codec_type == 'video' or ('width' in stream and not video_codec):
-                width = int(stream.get('width', 0))
-                height = int(stream.get('height', 0))
-                video_codec = stream.get('codec_name', '')
-                
-                # 解析码率
-                if stream.get('bit_rate'):
-                    try:
-                        video_bitrate = int(int(stream['bit_rate']) / 1000)  # 转为 kbps
-                    except (ValueError, TypeError):
-                        pass
-                
-                # 解析帧率 (格式如 "30/1" 或 "30000/1001")
-                r_frame_rate = stream.get('r_frame_rate', '0/1')
-                try:
-                    if '/' in r_frame_rate:
-                        num, den = r_frame_rate.split('/')
-                        frame_rate = round(float(num) / float(den), 2) if float(den) != 0 else 0
-                    else:
-                        frame_rate = float(r_frame_rate)
-                except (ValueError, TypeError, ZeroDivisionError):
-                    frame_rate = 0
-                
-                logger.info(f"[Task {task_id}] 检测到视频: {width}x{height}, 编码={video_codec}, 码率={video_bitrate}kbps, 帧率={frame_rate}fps")
-            
-            elif codec_type == 'audio':
-                has_audio = True
-                audio_codec = stream.get('codec_name', '')
-                if stream.get('bit_rate'):
-                    try:
-                        audio_bitrate = int(int(stream['bit_rate']) / 1000)
-                    except (ValueError, TypeError):
-                        pass
-                logger.info(f"[Task {task_id}] 检测到音频: 编码={audio_codec}, 码率={audio_bitrate}kbps")
+        width, height = probe.width, probe.height
+        video_codec = probe.video_codec
+        audio_codec = probe.audio_codec
+        video_bitrate = probe.video_bitrate
+        audio_bitrate = probe.audio_bitrate
+        frame_rate = probe.frame_rate
+        has_audio = probe.has_audio  # 标记是否有音频流
+        file_size = probe.file_size
+        total_bitrate = probe.bitrate
+        aspect_ratio = probe.aspect_ratio
         
-        if not has_audio:
+        logger.info(f"[Task {task_id}] 检测到视频: {width}x{height}, 编码={video_codec}, 码率={video_bitrate}kbps, 帧率={frame_rate}fps, 时长={duration}秒")
+        if has_audio:
+            logger.info(f"[Task {task_id}] 检测到音频: 编码={audio_codec}, 码率={audio_bitrate}kbps")
+        else:
             logger.warning(f"[Task {task_id}] 视频没有音频流")
         
-        # 获取文件大小和总码率
-        file_size = 0
-        total_bitrate = 0
-        if 'format' in video_info:
-            try:
-                file_size = int(video_info['format'].get('size', 0))
-            except (ValueError, TypeError):
-                pass
-            try:
-                total_bitrate = int(int(video_info['format'].get('bit_rate', 0)) / 1000)
-            except (ValueError, TypeError):
-                pass
-        
-        # 计算宽高比
-        aspect_ratio = ''
-        if width > 0 and height > 0:
-            from math import gcd
-            divisor = gcd(width, height)
-            ratio_w = width // divisor
-            ratio_h = height // divisor
-            # 常见比例映射
-            common_ratios = {
-                (16, 9): '16:9', (9, 16): '9:16',
-                (4, 3): '4:3', (3, 4): '3:4',
-                (21, 9): '21:9', (9, 21): '9:21',
-                (1, 1): '1:1',
-                (3, 2): '3:2', (2, 3): '2:3',
-            }
-            aspect_ratio = common_ratios.get((ratio_w, ratio_h), f'{ratio_w}:{ratio_h}')
-        
         if width == 0 or height == 0:
             logger.warning(f"[Task {task_id}] 无法获取视频分辨率，使用默认值 1920x1080")
             width, height = 1920, 1080
         
-        # 生成缩略图
-        middle_time = max(1, int(duration / 2)) if duration > 0 else 1
+        # 生成缩略图：一次解码抽取候选帧，按清晰度/亮度/信息熵选出最佳帧
         thumbnail_file = os.path.join(thumbnails_dir, f"{file_identifier}.jpg")
-        
-        thumbnail_cmd = [
-            'ffmpeg',
-            '-ss', str(middle_time),
-            '-i', video_file_path,
-            '-vframes', '1',
-            '-vf', 'scale=480:-1',
-            '-y',
-            thumbnail_file
-        ]
+        thumbnail_candidates = []
         
         try:
-            subprocess.run(thumbnail_cmd, check=True, capture_output=True)
-            logger.info(f"[Task {task_id}] 缩略图生成成功")
-        except subprocess.CalledProcessError as e:
-            logger.warning(f"[Task {task_id}] 缩略图生成失败: {e.stderr}")
-            
-        
-        # 转码分辨率 (宽, 高, 预估带宽用于m3u8, CRF值)
-        # CRF 值越小质量越高：18-23 是视觉无损范围
-        standard_resolutions = [
-            (3840, 2160, 15000, 22),  
-            (2560, 1440, 8000, 22),   
-            (1920, 1080, 5000, 23),   
-            (1280, 720, 2800, 23),    
-            (854, 480, 1400, 24),     
-            (640, 360, 800, 25),      
-        ]
-        
-        src_short_side = min(width, height)
-        resolutions = [(w, h, b, crf) for w, h, b, crf in standard_resolutions if min(w, h) <= src_short_side]
-        
-        if not resolutions:
-            bitrate = max(800, int(height * width / 1000))
-            resolutions = [(width, height, bitrate, 23)]
-            logger.info(f"[Task {task_id}] 使用原始分辨率: {width}x{height}")
-        
-        logger.info(f"[Task {task_id}] 将生成分辨率: {[(w, h) for w, h, _, _ in resolutions]}")
-        
-        for res_width, res_height, bitrate, crf in resolutions:
-            res_dir = os.path.join(hls_dir, f"{res_height}p")
-            os.makedirs(res_dir, exist_ok=True)
+            if adopted:
+                # 候选帧已在上传过程中抽取
+                ranked = adopted['thumbnail_candidates']
+            else:
+                candidate_paths = extract_candidate_frames(
+                    video_file_path,
+                    duration,
+                    os.path.join(hls_dir, CANDIDATE_DIR_NAME)
+                )
+                ranked = rank_candidate_frames(candidate_paths)
+            if ranked and ranked[0]['score'] > 0:
+                shutil.copyfile(ranked[0]['path'], thumbnail_file)
+                thumbnail_candidates = [
+                    {**item, 'path': os.path.relpath(item['path'], settings.MEDIA_ROOT).replace('\\', '/')}
+                    for item in ranked
+                ]
+                logger.info(f"[Task {task_id}] 从 {len(ranked)} 个候选帧中选出封面，得分 {ranked[0]['score']}")
+        except Exception as e:
+            logger.warning(f"[Task {task_id}] 候选帧封面生成失败: {e}")
         
-        with open(master_m3u8_path, 'w') as f:
-            f.write('#EXTM3U\n')
-            f.write('#EXT-X-VERSION:3\n')
-            for res_width, res_height, bitrate, crf in resolutions:
-                f.write(f'#EXT-X-STREAM-INF:BANDWIDTH={bitrate}000,RESOLUTION={res_width}x{res_height}\n')
-                f.write(f'{res_height}p/index.m3u8\n')
+        if not thumbnail_candidates:
+            # 回退：截取视频中间一帧
+            middle_time = max(1, int(duration / 2)) if duration > 0 else 1
+            thumbnail_cmd = [
+                'ffmpeg',
+                '-ss', str(middle_time),
+                '-i', video_file_path,
+                '-vframes', '1',
+                '-vf', 'scale=480:-1',
+                '-y',
+                thumbnail_file
+            ]
+            
+            try:
+                subprocess.run(thumbnail_cmd, check=True, capture_output=True)
+                logger.info(f"[Task {task_id}] 缩略图生成成功")
+            except subprocess.CalledProcessError as e:
+                logger.warning(f"[Task {task_id}] 缩略图生成失败: {e.stderr}")
+            
         
-       
-        all_exist = all(
-            os.path.exists(os.path.join(hls_dir, f"{h}p", 'index.m3u8'))
-            for _, h, _, _ in resolutions
+        if adopted:
+            resolutions, complexity = adopted['resolutions'], None
+            logger.info(f"[Task {task_id}] 使用上传过程中转码的分辨率: {[rendition_name(r) for r in resolutions]}")
+        else:
+            resolutions, complexity = plan_resolutions(
+                task_id, probe, width, height,
+                video_file_path=video_file_path,
+                content_aware=getattr(settings, 'VIDEO_CONTENT_AWARE_LADDER', False) and duration > 0,
+            )
+
+        media_info = {
+            'duration': duration,
+            'width': width,
+            'height': height,
+            'aspect_ratio': aspect_ratio,
+            'video_codec': video_codec,
+            'audio_codec': audio_codec,
+            'bitrate': total_bitrate,
+            'video_bitrate': video_bitrate,
+            'audio_bitrate': audio_bitrate,
+            'frame_rate': frame_rate,
+            'file_size': file_size,
+            'complexity': complexity,
+            # 进度条预览雪碧图，随转码命令一起生成
+            'sprite': build_sprite_config(hls_dir, width, height, duration),
+            'thumbnail_candidates': thumbnail_candidates,
+        }
+
+        transcode_mode = getattr(settings, 'VIDEO_TRANSCODE_MODE', 'single')
+        if adopted:
+            # 各分辨率已经转码完成，单命令流程检查到输出都存在后直接收尾
+            transcode_mode = 'single'
+        elif transcode_mode == 'fanout' and duration >= getattr(settings, 'VIDEO_CHUNKED_MIN_DURATION', 3600):
+            transcode_mode = 'chunked'
+            logger.info(f"[Task {task_id}] 视频时长 {duration:.0f} 秒，改用分段并行转码")
+
+        # 长视频按关键帧切分为多个时间段，每个分辨率的每个分段都是独立子任务
+        chunks = None
+        if transcode_mode == 'chunked':
+            keyframes = probe_keyframe_times(video_file_path)
+            chunks = plan_chunks(
+                keyframes,
+                duration,
+                getattr(settings, 'VIDEO_CHUNK_DURATION', 300)
+            )
+            logger.info(f"[Task {task_id}] 共 {len(keyframes)} 个关键帧，切分为 {len(chunks)} 个分段")
+
+        # 切片格式按视频记录，旧视频保持 TS
+        segment_format = video.hls_segment_format or SEGMENT_FORMAT_TS
+        if chunks and segment_format == SEGMENT_FORMAT_FMP4_SINGLE:
+            # 分段转码的产物需要拼接，无法输出单文件
+            segment_format = SEGMENT_FORMAT_FMP4
+            logger.info(f"[Task {task_id}] 分段转码不支持 fMP4 单文件，改用 fMP4 切片")
+        media_info['segment_format'] = segment_format
+        logger.info(f"[Task {task_id}] 切片格式: {segment_format}")
+
+        # 分布式转码：每个分辨率和共享音轨拆分为独立子任务，由多个 worker 并行处理
+        if transcode_mode in ('fanout', 'chunked'):
+            dispatch_fanout_transcode(
+                video_id=video_id,
+                video_file_path=video_file_path,
+                hls_dir=hls_dir,
+                file_identifier=file_identifier,
+                resolutions=resolutions,
+                has_audio=has_audio,
+                media_info=media_info,
+                thumbnail_file=thumbnail_file,
+                chunks=chunks,
+            )
+            # 处理锁交给 finalize_transcode（或失败的子任务）释放
+            lock_handed_off = True
+            logger.info(f"[Task {task_id}] 已分发 {len(resolutions)} 个分辨率子任务，等待汇总")
+            return {"status": "dispatched", "video_id": video_id, "resolutions": len(resolutions)}
+
+        for rung in resolutions:
+            os.makedirs(os.path.join(hls_dir, rendition_name(rung)), exist_ok=True)
+
+        # 音频只编码一次，作为独立的共享音轨（#EXT-X-MEDIA:TYPE=AUDIO）被所有分辨率引用
+        audio_dir = os.path.join(hls_dir, AUDIO_RENDITION_NAME)
+        if has_audio:
+            os.makedirs(audio_dir, exist_ok=True)
+
+        write_master_playlist(
+            master_m3u8_path,
+            resolutions,
+            has_shared_audio=has_audio,
+            segment_format=segment_format
         )
+
+        all_exist = all(
+            os.path.exists(os.path.join(hls_dir, rendition_name(rung), 'index.m3u8'))
+            for rung in resolutions
+        ) and (not has_audio or os.path.exists(os.path.join(audio_dir, 'index.m3u8')))
         
         if all_exist:
             logger.info(f"[Task {task_id}] 所有分辨率已存在，跳过转码")
@@ -411,75 +770,12 @@ def process_video(self, video_id):
             # 单命令多输出：一次读取源文件，同时输出所有分辨率
             logger.info(f"[Task {task_id}] 开始单命令多输出转码...")
             
-            hls_cmd = [
-                'ffmpeg',
-                '-i', video_file_path,
-            ]
-            
-            # 为每个分辨率添加输出流
-            for idx, (res_width, res_height, bitrate, crf) in enumerate(resolutions):
-                res_dir = os.path.join(hls_dir, f"{res_height}p")
-                res_m3u8 = os.path.join(res_dir, 'index.m3u8')
-                
-                # 跳过已存在的分辨率
-                if os.path.exists(res_m3u8):
-                    logger.info(f"[Task {task_id}] {res_height}p 已存在，跳过")
-                    continue
-                
-                # 视频流映射
-                hls_cmd.extend(['-map', '0:v:0'])
-                
-                # 音频流映射（只在有音频时添加）
-                if has_audio:
-                    hls_cmd.extend(['-map', '0:a:0'])
-                
-                # 视频编码设置
-                # 检测源视频色深，决定使用 H.264 还是 H.265
-                if video_codec == 'vp9':
-                    # VP9 视频可能是 10-bit，使用 H.265 保留色深
-                    hls_cmd.extend([
-                        '-c:v', 'libx265',
-                        '-preset', 'fast',
-                        '-crf', str(crf),
-                        '-maxrate', f'{bitrate}k',
-                        '-bufsize', f'{bitrate * 2}k',
-                        '-vf', f'scale={res_width}:{res_height}:force_original_aspect_ratio=decrease,pad={res_width}:{res_height}:(ow-iw)/2:(oh-ih)/2',
-                        '-tag:v', 'hvc1',  
-                    ])
-                else:
-                    hls_cmd.extend([
-                        '-c:v', 'libx264',
-                        '-preset', 'fast',
-                        '-crf', str(crf),
-                        '-maxrate', f'{bitrate}k',
-                        '-bufsize', f'{bitrate * 2}k',
-                        '-pix_fmt', 'yuv420p',
-                        '-vf', f'scale={res_width}:{res_height}:force_original_aspect_ratio=decrease,pad={res_width}:{res_height}:(ow-iw)/2:(oh-ih)/2',
-                        '-profile:v', 'high',
-                        '-level', '4.0',
-                    ])
-                
-                
-                if has_audio:
-                    hls_cmd.extend([
-                        '-c:a', 'aac',
-                        '-b:a', '128k',
-                    ])
-                else:
-                    
-                    hls_cmd.extend(['-an'])
-                
-                # HLS 设置
-                hls_cmd.extend([
-                    '-start_number', '0',
-                    '-hls_time', '6',
-                    '-hls_list_size', '0',
-                    '-hls_playlist_type', 'vod',
-                    '-hls_segment_filename', os.path.join(res_dir, 'segment_%03d.ts'),
-                    res_m3u8
-                ])
+            hls_cmd = build_multi_output_command(
+                task_id, video_file_path, hls_dir, resolutions, video_codec, has_audio,
+                segment_format, media_info['sprite'],
+            )
             
-            if len(hls_cmd) > 3:
+            if hls_cmd:
                 logger.info(f"[Task {task_id}] {'='*60}")
                 logger.info(f"[Task {task_id}] 开始执行 FFmpeg 转码")
                 logger.info(f"[Task {task_id}] 命令长度: {len(hls_cmd)} 个参数")
@@ -487,36 +783,26 @@ def process_video(self, video_id):
                 logger.info(f"[Task {task_id}] {'='*60}")
                 
                 try:
-                    import time
-                    start_time = time.time()
-                    
-                    result = subprocess.run(
+                    result = run_ffmpeg(
                         hls_cmd,
-                        check=True,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        universal_newlines=True
+                        duration=duration,
+                        on_progress=make_transcode_progress_reporter(self, video_id, user_id=video.user_id),
                     )
                     
-                    elapsed_time = time.time() - start_time
                     logger.info(f"[Task {task_id}] {'='*60}")
                     logger.info(f"[Task {task_id}] 多输出转码完成")
-                    logger.info(f"[Task {task_id}] 耗时: {elapsed_time:.2f} 秒")
+                    logger.info(f"[Task {task_id}] 耗时: {result['elapsed']:.2f} 秒")
                     logger.info(f"[Task {task_id}] {'='*60}")
                     
-                    if result.stdout:
-                        logger.debug(f"[Task {task_id}] FFmpeg stdout:\n{result.stdout}")
-                    
-                    if result.stderr:
-                        stderr_lines = result.stderr.strip().split('\n')
-                        logger.debug(f"[Task {task_id}] FFmpeg stderr (最后10行):\n" + '\n'.join(stderr_lines[-10:]))
+                    if result['stderr_tail']:
+                        logger.debug(f"[Task {task_id}] FFmpeg stderr (最后10行):\n" + '\n'.join(result['stderr_tail'][-10:]))
                         
-                except subprocess.CalledProcessError as e:
+                except FFmpegError as e:
                     logger.error(f"[Task {task_id}] {'='*60}")
                     logger.error(f"[Task {task_id}] 转码失败！")
                     logger.error(f"[Task {task_id}] 返回码: {e.returncode}")
                     logger.error(f"[Task {task_id}] {'='*60}")
-                    logger.error(f"[Task {task_id}] 完整错误输出:\n{e.stderr}")
+                    logger.error(f"[Task {task_id}] 错误输出（最后 {len(e.stderr_tail)} 行）:\n" + '\n'.join(e.stderr_tail))
                     logger.error(f"[Task {task_id}] {'='*60}")
                     
                     logger.warning(f"[Task {task_id}] 清理失败的转码文件...")
@@ -527,128 +813,17 @@ def process_video(self, video_id):
                     except Exception as cleanup_error:
                         logger.error(f"[Task {task_id}] 清理失败: {cleanup_error}")
                     
-                    stderr_lines = e.stderr.strip().split('\n')
-                    error_summary = '\n'.join(stderr_lines[-20:])
-                    raise Exception(f"转码失败: {error_summary}")
-        
-
-        relative_hls_path = f'videos/hls/{file_identifier}/master.m3u8'
-        relative_thumbnail_path = os.path.relpath(thumbnail_file, settings.MEDIA_ROOT).replace('\\', '/')
-        
-        final_check_passed = False
-        try:
-            if os.path.exists(master_m3u8_path):
-                with open(master_m3u8_path, 'r') as f:
-                    content = f.read()
-                    # 检查是否有分辨率引用
-                    if 'index.m3u8' in content:
-                        # 随机检查一个分辨率的文件
-                        import re
-                        resolution_files = re.findall(r'(\d+p)/index\.m3u8', content)
-                        if resolution_files:
-                            # 检查第一个分辨率
-                            first_res = resolution_files[0]
-                            first_res_m3u8 = os.path.join(hls_dir, first_res, 'index.m3u8')
-                            if os.path.exists(first_res_m3u8):
-                                with open(first_res_m3u8, 'r') as rf:
-                                    if '.ts' in rf.read():
-                                        final_check_passed = True
-                                        logger.info(f"[Task {task_id}] 最终验证通过：HLS 文件完整")
-        except Exception as e:
-            logger.error(f"[Task {task_id}] 最终验证失败: {e}")
-        
-        if not final_check_passed:
-            logger.error(f"[Task {task_id}] 最终验证失败：HLS 文件不完整或不存在")
-            # 清理失败的文件
-            if os.path.exists(hls_dir):
-                shutil.rmtree(hls_dir)
-            raise Exception("转码完成但文件验证失败，HLS 文件不完整")
+                    raise Exception(f"转码失败: {e.error_summary()}")
         
-        video.refresh_from_db()
-        
-        video.hls_file = relative_hls_path
-        video.duration = duration
-        video.resolution = max(h for _, h, _, _ in resolutions)  # 保存最高分辨率
-        
-        # 保存视频技术参数
-        video.width = width
-        video.height = height
-        video.aspect_ratio = aspect_ratio
-        video.video_codec = video_codec
-        video.audio_codec = audio_codec
-        video.bitrate = total_bitrate
-        video.video_bitrate = video_bitrate
-        video.audio_bitrate = audio_bitrate
-        video.frame_rate = frame_rate
-        video.file_size = file_size
-        
-        has_user_thumbnail = False
-        if video.thumbnail:
-            thumbnail_path = os.path.join(settings.MEDIA_ROOT, video.thumbnail.name)
-            if os.path.exists(thumbnail_path):
-                has_user_thumbnail = True
-                logger.info(f"[Task {task_id}] 保留用户上传的封面: {video.thumbnail.name}")
-        
-        if not has_user_thumbnail and os.path.exists(thumbnail_file):
-            video.thumbnail = relative_thumbnail_path
-            logger.info(f"[Task {task_id}] 使用自动生成的封面: {relative_thumbnail_path}")
-        
-        video.status = 'pending'
-        video.save(update_fields=[
-            'hls_file', 'duration', 'resolution', 'status', 'thumbnail',
-            'width', 'height', 'aspect_ratio', 'video_codec', 'audio_codec',
-            'bitrate', 'video_bitrate', 'audio_bitrate', 'frame_rate', 'file_size'
-        ])
-        
-        # 发送转码完成通知
-        try:
-            send_video_notification(
-                user=video.user,
-                video=video,
-                notification_type='processing_complete',
-                title='视频处理完成',
-                content=f'您的视频《{video.title}》已处理完成，正在等待审核。'
-            )
-            logger.info(f"[Task {task_id}] 已发送转码完成通知给用户 {video.user_id}")
-        except Exception as e:
-            logger.warning(f"[Task {task_id}] 发送通知失败: {e}")
-        
-        # 发送视频状态和元数据更新（包含时长等信息）
-        try:
-            from core.websocket import send_video_status_update
-            
-            # 格式化时长为 HH:MM:SS 或 MM:SS
-            def format_duration(seconds):
-                if seconds <= 0:
-                    return "00:00"
-                hours = int(seconds // 3600)
-                minutes = int((seconds % 3600) // 60)
-                secs = int(seconds % 60)
-                if hours > 0:
-                    return f"{hours:02d}:{minutes:02d}:{secs:02d}"
-                return f"{minutes:02d}:{secs:02d}"
-            
-            send_video_status_update(
-                user_id=video.user_id,
-                video_data={
-                    'id': video.id,
-                    'status': video.status,
-                    'title': video.title,
-                    'duration': format_duration(duration),
-                    'resolution': video.resolution,
-                    'thumbnail': video.thumbnail.url if video.thumbnail else None,
-                }
-            )
-            logger.info(f"[Task {task_id}] 已发送视频状态更新给用户 {video.user_id}")
-        except Exception as e:
-            logger.warning(f"[Task {task_id}] 发送视频状态更新失败: {e}")
-        
-        logger.info(f"[Task {task_id}] {'='*60}")
-        logger.info(f"[Task {task_id}] 视频 {video_id} 处理完成！")
-        logger.info(f"[Task {task_id}] 生成了 {len(resolutions)} 个分辨率")
-        logger.info(f"[Task {task_id}] HLS 文件: {relative_hls_path}")
-        logger.info(f"[Task {task_id}] {'='*60}")
-        return {"status": "success", "video_id": video_id, "resolutions": len(resolutions)}
+        return complete_video_processing(
+            task_id=task_id,
+            video_id=video_id,
+            hls_dir=hls_dir,
+            file_identifier=file_identifier,
+            resolutions=resolutions,
+            media_info=media_info,
+            thumbnail_file=thumbnail_file,
+        )
         
     except Video.DoesNotExist:
         logger.error(f"[Task {task_id}] {'='*60}")
@@ -664,6 +839,7 @@ def process_video(self, video_id):
             Video.objects.filter(id=video_id).update(status='failed')
         except Exception:
             pass
+        release_shared_asset_transcode(video_id)
         return {"status": "error", "reason": "file_not_found"}
     
     except Exception as e:
@@ -674,6 +850,7 @@ def process_video(self, video_id):
             Video.objects.filter(id=video_id).update(status='failed')
         except Exception:
             pass
+        release_shared_asset_transcode(video_id)
         
         # 如果还有重试次数，抛出异常让 Celery 重试
         if self.request.retries < self.max_retries:
@@ -684,12 +861,593 @@ def process_video(self, video_id):
         return {"status": "error", "reason": str(e)}
     
     finally:
-        # 无论成功失败，都释放锁
-        release_video_lock(video_id)
-        logger.info(f"[Task {task_id}] 释放视频 {video_id} 的处理锁")
+        # 无论成功失败，都释放锁（已移交给分布式子任务的除外）
+        if not lock_handed_off:
+            release_video_lock(video_id)
+            logger.info(f"[Task {task_id}] 释放视频 {video_id} 的处理锁")
         logger.info(f"[Task {task_id}] 任务结束\n")
 
 
+def mark_transcode_failed(video_id, task_id, reason):
+    """分布式转码失败：标记视频为失败状态并释放处理锁"""
+    from .models import Video
+    
+    logger.error(f"[Task {task_id}] 视频 {video_id} 分布式转码失败: {reason}")
+    try:
+        Video.objects.filter(id=video_id).update(status='failed')
+    except Exception:
+        pass
+    release_video_lock(video_id)
+    release_shared_asset_transcode(video_id)
+
+
+def release_shared_asset_transcode(video_id):
+    """负责共享资源转码的视频失败后，重新分发等待该资源的视频"""
+    try:
+        for waiting_id in abandon_asset_transcode(video_id):
+            logger.info(f"视频 {video_id} 转码失败，重新处理等待共享资源的视频 {waiting_id}")
+            process_video.delay(waiting_id)
+    except Exception as e:
+        logger.warning(f"释放视频 {video_id} 的共享资源失败: {e}")
+
+
+def dispatch_fanout_transcode(video_id, video_file_path, hls_dir, file_identifier, resolutions,
+                              has_audio, media_info, thumbnail_file, chunks=None):
+    """
+    分发分布式转码任务
+    
+    每个分辨率和共享音轨都是独立的 Celery 子任务，可以被任意空闲 worker 执行；
+    传入 chunks 时每个分辨率再按分段拆分为 transcode_chunk 子任务。
+    预览雪碧图由最低分辨率的子任务顺带生成。
+    所有子任务完成后由 finalize_transcode 汇总生成 master.m3u8
+    """
+    if chunks:
+        header = [
+            transcode_chunk.s(
+                video_id,
+                video_file_path,
+                os.path.join(hls_dir, rendition_name(rung)),
+                rung,
+                media_info['video_codec'],
+                chunk,
+                duration=media_info['duration'],
+                segment_format=media_info['segment_format'],
+                sprite=media_info.get('sprite') if rung is resolutions[-1] else None,
+            )
+            for rung in resolutions
+            for chunk in chunks
+        ]
+    else:
+        header = [
+            transcode_rendition.s(
+                video_id,
+                video_file_path,
+                os.path.join(hls_dir, rendition_name(rung)),
+                rung,
+                media_info['video_codec'],
+                duration=media_info['duration'],
+                segment_format=media_info['segment_format'],
+                sprite=media_info.get('sprite') if rung is resolutions[-1] else None,
+            )
+            for rung in resolutions
+        ]
+    if has_audio:
+        header.append(
+            transcode_audio_rendition.s(
+                video_id,
+                video_file_path,
+                os.path.join(hls_dir, AUDIO_RENDITION_NAME),
+                duration=media_info['duration'],
+                segment_format=media_info['segment_format'],
+            )
+        )
+    
+    callback = finalize_transcode.s(
+        video_id=video_id,
+        hls_dir=hls_dir,
+        file_identifier=file_identifier,
+        resolutions=resolutions,
+        has_audio=has_audio,
+        media_info=media_info,
+        thumbnail_file=thumbnail_file,
+        chunks=chunks,
+    )
+    return chord(header)(callback)
+
+
+def run_rendition_subtask(task, video_id, command, output_dir, label,
+                          is_complete=is_rendition_complete, on_success=None, duration=None):
+    """
+    执行单个分布式转码子任务
+    
+    失败时只清理并重试当前输出目录（分辨率或分段），重试次数用完后标记整个视频失败
+    """
+    task_id = task.request.id or 'unknown'
+    
+    start_time = time.time()
+    error_summary = None
+    try:
+        if is_complete(output_dir):
+            logger.info(f"[Task {task_id}] 视频 {video_id} 的 {label} 已存在，跳过")
+            return {"status": "skipped", "rendition": label}
+        
+        os.makedirs(output_dir, exist_ok=True)
+        logger.info(f"[Task {task_id}] 开始转码视频 {video_id} 的 {label}")
+        logger.info(f"[Task {task_id}] FFmpeg 命令: {' '.join(command)}")
+        
+        run_ffmpeg(
+            command,
+            duration=duration,
+            on_progress=make_transcode_progress_reporter(task, video_id, label=label),
+        )
+        if not is_rendition_complete(output_dir):
+            error_summary = "index.m3u8 不存在或没有切片"
+        elif on_success is not None:
+            on_success()
+    except FFmpegError as e:
+        error_summary = e.error_summary()
+    except Exception as e:
+        # 其他异常（文件系统、Redis 等）同样会让 chord 失败、汇总任务不再执行，
+        # 必须走同样的重试和失败标记流程，否则视频一直停在处理中
+        logger.exception(f"[Task {task_id}] {label} 转码子任务异常: {e}")
+        error_summary = f"{type(e).__name__}: {e}"
+    
+    if error_summary is not None:
+        logger.error(f"[Task {task_id}] {label} 转码失败:\n{error_summary}")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        
+        if task.request.retries < task.max_retries:
+            logger.warning(f"[Task {task_id}] {label} 将重试 (第 {task.request.retries + 1}/{task.max_retries} 次)")
+            raise task.retry(exc=Exception(f"{label} 转码失败: {error_summary}"))
+        
+        mark_transcode_failed(video_id, task_id, f"{label} 转码失败")
+        raise Exception(f"{label} 转码失败: {error_summary}")
+    
+    elapsed_time = time.time() - start_time
+    logger.info(f"[Task {task_id}] 视频 {video_id} 的 {label} 转码完成，耗时: {elapsed_time:.2f} 秒")
+    return {"status": "success", "rendition": label, "elapsed": round(elapsed_time, 2)}
+
+
+@shared_task(bind=True, max_retries=2, default_retry_delay=30)
+def transcode_rendition(self, video_id, video_file_path, output_dir, rung, video_codec, duration=None,
+                        segment_format=SEGMENT_FORMAT_TS, sprite=None):
+    """分布式转码子任务：转码单个分辨率（仅视频流），传入 sprite 时同时生成预览雪碧图"""
+    command = build_rendition_command(video_file_path, output_dir, rung, video_codec, segment_format)
+    if sprite:
+        command.extend(build_sprite_output_args(sprite))
+    return run_rendition_subtask(
+        self, video_id, command, output_dir, rendition_name(rung), duration=duration
+    )
+
+
+@shared_task(bind=True, max_retries=2, default_retry_delay=30)
+def transcode_chunk(self, video_id, video_file_path, rendition_dir, rung, video_codec, chunk, duration=None,
+                    segment_format=SEGMENT_FORMAT_TS, sprite=None):
+    """
+    分段转码子任务：转码单个分辨率的一个时间段
+
+    完成后写入完成标记，重试或重新分发时已完成的分段直接跳过
+    """
+    output_dir = chunk_dir_for(rendition_dir, chunk)
+    if is_rendition_complete(rendition_dir):
+        return {"status": "skipped", "rendition": rendition_name(rung), "chunk": chunk['index']}
+    command = build_chunk_command(video_file_path, output_dir, rung, video_codec, chunk, segment_format)
+    if sprite:
+        command.extend(build_sprite_output_args(sprite, chunk))
+    chunk_end = chunk['end'] if chunk['end'] is not None else duration
+    return run_rendition_subtask(
+        self, video_id, command, output_dir,
+        f"{rendition_name(rung)} 分段 {chunk['index']}",
+        is_complete=is_chunk_complete,
+        on_success=lambda: mark_chunk_complete(output_dir, chunk),
+        duration=chunk_end - chunk['start'] if chunk_end else None,
+    )
+
+
+@shared_task(bind=True, max_retries=2, default_retry_delay=30)
+def transcode_audio_rendition(self, video_id, video_file_path, output_dir, duration=None,
+                              segment_format=SEGMENT_FORMAT_TS):
+    """分布式转码子任务：转码共享音频轨道"""
+    command = build_audio_command(video_file_path, output_dir, segment_format)
+    return run_rendition_subtask(
+        self, video_id, command, output_dir, AUDIO_RENDITION_NAME, duration=duration
+    )
+
+
+@shared_task(bind=True)
+def finalize_transcode(self, results, video_id, hls_dir, file_identifier, resolutions,
+                       has_audio, media_info, thumbnail_file, chunks=None):
+    """
+    分布式转码汇总任务
+    
+    分段转码时先把各分段拼接为每个分辨率的 index.m3u8；
+    所有子任务完成且通过完整性检查后才生成 master.m3u8，并完成视频状态更新
+    """
+    task_id = self.request.id or 'unknown'
+    logger.info(f"[Task {task_id}] 汇总视频 {video_id} 的分布式转码结果: {results}")
+    
+    try:
+        if chunks:
+            for rung in resolutions:
+                rendition_dir = os.path.join(hls_dir, rendition_name(rung))
+                if not is_rendition_complete(rendition_dir):
+                    assemble_chunked_rendition(
+                        rendition_dir,
+                        chunks,
+                        media_info.get('segment_format', SEGMENT_FORMAT_TS)
+                    )
+        
+        missing = [
+            rendition_name(rung) for rung in resolutions
+            if not is_rendition_complete(os.path.join(hls_dir, rendition_name(rung)))
+        ]
+        if has_audio and not is_rendition_complete(os.path.join(hls_dir, AUDIO_RENDITION_NAME)):
+            missing.append(AUDIO_RENDITION_NAME)
+        if missing:
+            raise Exception(f"子任务输出不完整: {missing}")
+        
+        write_master_playlist(
+            os.path.join(hls_dir, 'master.m3u8'),
+            resolutions,
+            has_shared_audio=has_audio,
+            segment_format=media_info.get('segment_format', SEGMENT_FORMAT_TS)
+        )
+        
+        result = complete_video_processing(
+            task_id=task_id,
+            video_id=video_id,
+            hls_dir=hls_dir,
+            file_identifier=file_identifier,
+            resolutions=resolutions,
+            media_info=media_info,
+            thumbnail_file=thumbnail_file,
+            chunks=chunks,
+        )
+        release_video_lock(video_id)
+        return result
+    
+    except Exception as e:
+        logger.exception(f"[Task {task_id}] 汇总视频 {video_id} 失败: {str(e)}")
+        mark_transcode_failed(video_id, task_id, str(e))
+        return {"status": "error", "reason": str(e)}
+
+
+# 完成上传任务 ID 的缓存时间（秒），与任务结果的过期时间一致
+MERGE_TASK_KEY_TIMEOUT = 3600
+
+
+def get_merge_task_key(user_id, upload_id):
+    """同一上传的完成任务 ID 缓存 key，重复请求完成上传时返回已提交的任务"""
+    return f"upload_merge_task:{user_id}:{upload_id}"
+
+
+def get_merge_task_owner_key(task_id):
+    """完成任务所属用户的缓存 key，任务失败时结果中没有用户信息，查询状态时据此校验"""
+    return f"upload_merge_owner:{task_id}"
+
+
+def is_merge_task_owner(task_id, user_id):
+    return cache.get(get_merge_task_owner_key(task_id)) == user_id
+
+
+def queue_upload_completion(user_id, file_name, upload_id, file_size, segment_format, declared_md5=None):
+    """
+    提交完成上传任务，同一上传重复提交时返回已有的任务 ID
+    
+    Returns:
+        str: 任务 ID，通过 upload/merge/<task_id>/ 查询进度
+    """
+    task_key = get_merge_task_key(user_id, upload_id)
+    task_id = cache.get(task_key)
+    if not task_id:
+        task_id = merge_upload_chunks.delay(
+            user_id, file_name, upload_id, file_size, segment_format, declared_md5
+        ).id
+        cache.set(task_key, task_id, MERGE_TASK_KEY_TIMEOUT)
+        cache.set(get_merge_task_owner_key(task_id), user_id, MERGE_TASK_KEY_TIMEOUT)
+        logger.info(f"已提交完成上传任务: task_id={task_id}, user_id={user_id}, upload_id={upload_id}")
+    return task_id
+
+
+@shared_task(bind=True)
+def merge_upload_chunks(self, user_id, file_name, upload_id, file_size, segment_format, declared_md5=None):
+    """
+    后台完成上传并创建视频记录
+    
+    数据已写在预分配的临时文件中（分片上传或 tus 上传），这里只需 fsync、校验哈希并重命名为最终文件，
+    之后才在一个很短的事务中登记共享资源、创建 Video。进度通过任务状态（PROGRESS）查询
+    
+    Args:
+        upload_id: 分片上传时为客户端计算的文件 MD5，tus 上传时为上传 ID
+        declared_md5: 客户端声明的文件 MD5，与实际内容不一致时上传失败并清理临时文件
+    """
+    from django.db import transaction
+    from .models import Video
+    
+    task_id = self.request.id or 'unknown'
+    
+    now = timezone.now()
+    relative_dir = os.path.join('videos', 'uploads', f"{now.year}", f"{now.month:02d}", f"{now.day:02d}")
+    upload_dir = os.path.join(settings.MEDIA_ROOT, relative_dir)
+    os.makedirs(upload_dir, exist_ok=True)
+    
+    # 确定文件扩展名，默认使用 mp4
+    file_ext = os.path.splitext(file_name)[1] or '.mp4'
+    merged_file_path = None
+    merged_file_written = False
+    
+    def report_progress(done, total):
+        self.update_state(state='PROGRESS', meta={
+            'user_id': user_id,
+            'stage': 'verifying',
+            'progress': round(done / total * 100, 1) if total else 100.0,
+            'done': done,
+            'total': total,
+        })
+    
+    logger.info(f"[Task {task_id}] 开始完成上传: user_id={user_id}, upload_id={upload_id}")
+    start_time = time.time()
+    
+    progressive = None
+    if getattr(settings, 'VIDEO_PROGRESSIVE_UPLOAD', False):
+        # 数据已全部到达，上传过程中的转码可以读到文件结尾
+        mark_upload_completed(user_id, upload_id)
+        progressive = get_progressive_state(user_id, upload_id)
+    
+    try:
+        actual_md5, sha256, actual_size = verify_upload(user_id, upload_id, on_progress=report_progress)
+        if declared_md5 and declared_md5.lower() != actual_md5:
+            raise ChecksumMismatch(f"文件 MD5 与声明不一致: 声明 {declared_md5}，实际 {actual_md5}，请重新上传")
+        if str(actual_size) != str(file_size):
+            raise ValueError(f"文件大小不一致: 预期 {file_size} 字节，实际 {actual_size} 字节")
+        
+        # 最终文件以服务端计算的 MD5 命名
+        merged_filename = f"{actual_md5}{file_ext}"
+        merged_file_path = os.path.join(upload_dir, merged_filename)
+        video_file_path = os.path.join(relative_dir, merged_filename)
+        
+        # 相同内容已有共享资源时直接复用，不保留新上传的文件
+        asset = find_asset(actual_md5, actual_size)
+        if asset is None:
+            commit_upload(user_id, upload_id, merged_file_path)
+            merged_file_written = True
+        
+        # 文件已落盘，事务只包含数据库操作
+        with transaction.atomic():
+            if asset:
+                # 加锁重新读取并增加引用；资源刚被最后一个视频释放时按新上传处理
+                asset = retain_asset(asset)
+                if asset is None:
+                    logger.info(f"[Task {task_id}] 共享资源已被释放，保留新上传的文件")
+                    commit_upload(user_id, upload_id, merged_file_path)
+                    merged_file_written = True
+            if asset:
+                video_file_path = asset.video_file
+                logger.info(f"[Task {task_id}] 上传内容与共享资源 {asset.id} 相同，复用源文件和转码结果")
+            else:
+                # 全局索引只使用服务端计算的哈希，客户端声明的 MD5 不会污染索引
+                asset = register_asset(actual_md5, actual_size, sha256, video_file_path)
+            
+            video = Video.objects.create(
+                title=os.path.splitext(file_name)[0],  # 使用文件名作为标题
+                user_id=user_id,
+                video_file=video_file_path,
+                media_asset=asset,
+                hls_segment_format=segment_format
+            )
+        
+        if progressive and merged_file_written:
+            # 上传过程中的探测结果和暂存转码由 process_video 接管
+            link_progressive_video(user_id, upload_id, video.id)
+            if progressive.get('probe'):
+                video.probe_data = {**progressive['probe'], 'file_key': get_file_key(merged_file_path)}
+                Video.objects.filter(id=video.id).update(probe_data=video.probe_data)
+        elif progressive:
+            # 复用共享资源时不需要上传过程中的处理结果
+            discard_progressive(user_id, upload_id)
+        
+        # 清理上传会话（只有在数据库记录创建成功后才清理）
+        discard_upload(user_id, upload_id)
+        
+        logger.info(f"[Task {task_id}] 上传完成，新创建视频ID: {video.id}，大小 {actual_size} 字节，耗时 {time.time() - start_time:.2f} 秒")
+        return {"status": "success", "user_id": user_id, "video_id": video.id}
+    
+    except ChecksumMismatch as e:
+        # 文件已损坏或被替换；分片上传的上传 ID 就是声明的 MD5，续传和秒传都依赖它，不能保留
+        logger.error(f"[Task {task_id}] 完成上传失败: {e}")
+        discard_upload(user_id, upload_id)
+        if progressive:
+            discard_progressive(user_id, upload_id)
+        raise
+    
+    except Exception as e:
+        logger.exception(f"[Task {task_id}] 完成上传失败: {e}")
+        
+        # 文件移回临时位置，保留上传会话以便用户重试
+        if merged_file_written and os.path.exists(merged_file_path):
+            try:
+                rollback_upload(user_id, upload_id, merged_file_path)
+                logger.info(f"[Task {task_id}] 已将文件移回临时位置: {merged_file_path}")
+            except Exception as cleanup_error:
+                logger.error(f"[Task {task_id}] 移回临时文件失败: {cleanup_error}")
+        raise
+    
+    finally:
+        cache.delete(get_merge_task_key(user_id, upload_id))
+
+
+# 上传过程中的转码仍在进行时，process_video 推迟的时间（秒）
+PROGRESSIVE_RETRY_COUNTDOWN = 30
+
+
+def start_progressive_processing(user_id, upload_id, segment_format):
+    """
+    边上传边处理：开头连续到达的数据达到 VIDEO_PROGRESSIVE_PREFIX_BYTES 后启动（每个上传只启动一次）
+
+    数据已经全部到达的上传走常规流程
+    """
+    if not getattr(settings, 'VIDEO_PROGRESSIVE_UPLOAD', False):
+        return
+    progress = contiguous_bytes(user_id, upload_id)
+    if progress is None:
+        return
+    available, file_size = progress
+    if available >= file_size or available < settings.VIDEO_PROGRESSIVE_PREFIX_BYTES:
+        return
+    if not claim_progressive(user_id, upload_id):
+        return
+    analyze_upload_prefix.delay(user_id, upload_id, segment_format)
+    logger.info(f"已启动边上传边处理: user_id={user_id}, upload_id={upload_id}, 已到达 {available}/{file_size} 字节")
+
+
+@shared_task(bind=True)
+def analyze_upload_prefix(self, user_id, upload_id, segment_format):
+    """
+    边上传边处理：基于开头已到达的数据探测、选封面、检测字幕，并开始转码
+
+    只处理 moov 位于开头的 MP4（faststart），这样探测就能拿到完整的时长和流信息，FFmpeg 也能顺序读取；
+    其他文件等上传完成后按常规流程处理。转码输入是只读取已到达数据的管道，读到尚未到达的位置时等待上传继续，
+    输出写入暂存目录，上传完成后由 process_video 接管。这里使用默认转码阶梯（复杂度检测需要完整文件）
+    """
+    task_id = self.request.id or 'unknown'
+    
+    progress = contiguous_bytes(user_id, upload_id)
+    if progress is None:
+        return {"status": "skipped", "reason": "upload_gone"}
+    available, file_size = progress
+    part_path = upload_file_path(user_id, upload_id)
+    
+    if find_moov_position(part_path, available) != 'faststart':
+        update_progressive_state(user_id, upload_id, status='skipped')
+        logger.info(f"[Task {task_id}] 不是 faststart MP4，上传完成后再处理: upload_id={upload_id}")
+        return {"status": "skipped", "reason": "not_faststart"}
+    
+    staging = staging_dir(user_id, upload_id)
+    try:
+        # 临时文件一直在写入，不使用探测缓存
+        probe = probe_video(part_path, use_cache=False)
+        if not probe.has_video or probe.duration <= 0:
+            update_progressive_state(user_id, upload_id, status='skipped')
+            return {"status": "skipped", "reason": "no_video"}
+        covered = covered_duration(probe.duration, available, file_size)
+        width, height = probe.width or 1920, probe.height or 1080
+        os.makedirs(staging, exist_ok=True)
+        
+        # 封面候选帧只从已到达的部分抽取
+        thumbnail_candidates = []
+        try:
+            ranked = rank_candidate_frames(extract_candidate_frames(
+                part_path, covered, os.path.join(staging, CANDIDATE_DIR_NAME)
+            ))
+            thumbnail_candidates = [{**item, 'path': os.path.basename(item['path'])} for item in ranked]
+        except Exception as e:
+            logger.warning(f"[Task {task_id}] 上传中文件候选帧抽取失败: {e}")
+        
+        update_progressive_state(
+            user_id, upload_id,
+            status='analyzed',
+            heartbeat=time.time(),
+            probe=probe.to_dict(),
+            thumbnail_candidates=thumbnail_candidates,
+        )
+        logger.info(f"[Task {task_id}] 上传中文件探测完成: {width}x{height}, 时长 {probe.duration:.1f} 秒，已到达约 {covered:.1f} 秒")
+        
+        try:
+            from ai_service.tasks import detect_upload_prefix_subtitle
+            detect_upload_prefix_subtitle.delay(user_id, upload_id, covered)
+        except Exception as e:
+            logger.warning(f"[Task {task_id}] 提交上传中文件字幕检测失败: {e}")
+        
+        resolutions, _ = plan_resolutions(task_id, probe, width, height)
+        for rung in resolutions:
+            os.makedirs(os.path.join(staging, rendition_name(rung)), exist_ok=True)
+        if probe.has_audio:
+            os.makedirs(os.path.join(staging, AUDIO_RENDITION_NAME), exist_ok=True)
+        
+        hls_cmd = build_multi_output_command(
+            task_id, 'pipe:0', staging, resolutions, probe.video_codec, probe.has_audio,
+            segment_format, build_sprite_config(staging, width, height, probe.duration),
+        )
+        update_progressive_state(
+            user_id, upload_id,
+            status='transcoding',
+            heartbeat=time.time(),
+            resolutions=resolutions,
+            segment_format=segment_format,
+        )
+        
+        reader = GrowingFileReader(user_id, upload_id, file_size)
+        try:
+            result = run_ffmpeg(hls_cmd, duration=probe.duration, stdin_source=reader)
+        finally:
+            reader.close()
+        
+        update_progressive_state(user_id, upload_id, status='transcoded')
+        logger.info(f"[Task {task_id}] 上传过程中转码完成: upload_id={upload_id}, 耗时 {result['elapsed']:.2f} 秒")
+        return {"status": "success", "upload_id": upload_id, "resolutions": len(resolutions)}
+    
+    except Exception as e:
+        if isinstance(e, FFmpegError):
+            logger.warning(f"[Task {task_id}] 上传过程中转码失败: {e.error_summary()}")
+        else:
+            logger.warning(f"[Task {task_id}] 边上传边处理失败，上传完成后按常规流程处理: {e}")
+        shutil.rmtree(staging, ignore_errors=True)
+        if get_progressive_state(user_id, upload_id):
+            update_progressive_state(user_id, upload_id, status='failed')
+        return {"status": "error", "reason": str(e)}
+
+
+@shared_task(bind=True, max_retries=1, default_retry_delay=60)
+def fingerprint_video(self, video_id):
+    """
+    计算视频指纹并查找近似重复的视频
+
+    重新编码、轻微裁剪、加水印后重新上传的视频 MD5 不同，但感知哈希相近
+    """
+    from .models import Video, VideoFingerprint
+    
+    task_id = self.request.id or 'unknown'
+    
+    try:
+        video = Video.objects.get(id=video_id)
+        
+        # 共享源文件的视频直接复用已有指纹
+        existing = None
+        if video.media_asset_id:
+            existing = VideoFingerprint.objects.filter(
+                video__media_asset_id=video.media_asset_id
+            ).exclude(video_id=video_id).first()
+        
+        if existing:
+            hashes = unpack_hashes(existing.hashes)
+        else:
+            video_file_path = os.path.join(settings.MEDIA_ROOT, video.video_file.name)
+            probe = probe_video_for(video, video_file_path)
+            hashes = phash_frames(extract_fingerprint_frames(video_file_path, probe.duration))
+        
+        if not len(hashes):
+            logger.warning(f"[Task {task_id}] 视频 {video_id} 没有抽取到指纹帧")
+            return {"status": "skipped", "reason": "no_frames"}
+        
+        fingerprint = save_fingerprint(video, hashes)
+        fingerprint.matches = find_near_duplicates(fingerprint, hashes)
+        fingerprint.save(update_fields=['matches', 'updated_at'])
+        
+        if fingerprint.matches:
+            logger.info(f"[Task {task_id}] 视频 {video_id} 发现 {len(fingerprint.matches)} 个近似重复: {fingerprint.matches[:5]}")
+        return {"status": "success", "video_id": video_id, "matches": len(fingerprint.matches)}
+    
+    except Video.DoesNotExist:
+        logger.error(f"[Task {task_id}] 视频 {video_id} 不存在")
+        return {"status": "error", "reason": "video_not_found"}
+    
+    except Exception as e:
+        logger.exception(f"[Task {task_id}] 计算视频 {video_id} 指纹失败: {e}")
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e)
+        return {"status": "error", "reason": str(e)}
+
+
 @shared_task
 def extract_video_metadata(video_id):
     """
@@ -708,97 +1466,27 @@ def extract_video_metadata(video_id):
             logger.error(f"视频文件不存在: {video_file_path}")
             return {"status": "error", "reason": "file_not_found"}
         
-        # 用 ffprobe 提取信息
-        probe_cmd = [
-            'ffprobe',
-            '-v', 'error',
-            '-show_entries', 'stream=width,height,codec_name,codec_type,bit_rate,r_frame_rate:format=duration,size,bit_rate',
-            '-of', 'json',
-            video_file_path
-        ]
-        
-        import json
-        probe_process = subprocess.run(probe_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-        
-        if probe_process.returncode != 0:
-            logger.error(f"ffprobe 失败: {probe_process.stderr}")
+        # 读取统一的探测结果（命中缓存时不会再次执行 ffprobe）
+        try:
+            probe = probe_video_for(video, video_file_path)
+        except Exception as e:
+            logger.error(f"ffprobe 失败: {e}")
             return {"status": "error", "reason": "ffprobe_failed"}
         
-        video_info = json.loads(probe_process.stdout)
-        
-        # 解析参数
-        width, height = 0, 0
-        video_codec, audio_codec = '', ''
-        video_bitrate, audio_bitrate = 0, 0
-        frame_rate = 0
-        
-        for stream in video_info.get('streams', []):
-            codec_type = stream.get('codec_type', '')
-            
-            if codec_type == 'video' or ('width' in stream and not video_codec):
-                width = int(stream.get('width', 0))
-                height = int(stream.get('height', 0))
-                video_codec = stream.get('codec_name', '')
-                
-                if stream.get('bit_rate'):
-                    try:
-                        video_bitrate = int(int(stream['bit_rate']) / 1000)
-                    except:
-                        pass
-                
-                r_frame_rate = stream.get('r_frame_rate', '0/1')
-                try:
-                    if '/' in r_frame_rate:
-                        num, den = r_frame_rate.split('/')
-                        frame_rate = round(float(num) / float(den), 2) if float(den) != 0 else 0
-                    else:
-                        frame_rate = float(r_frame_rate)
-                except:
-                    frame_rate = 0
-            
-            elif codec_type == 'audio':
-                audio_codec = stream.get('codec_name', '')
-                if stream.get('bit_rate'):
-                    try:
-                        audio_bitrate = int(int(stream['bit_rate']) / 1000)
-                    except:
-                        pass
-        
-        # 文件大小和总码率
-        file_size = 0
-        total_bitrate = 0
-        duration = 0
-        if 'format' in video_info:
-            try:
-                file_size = int(video_info['format'].get('size', 0))
-                total_bitrate = int(int(video_info['format'].get('bit_rate', 0)) / 1000)
-                duration = float(video_info['format'].get('duration', 0))
-            except:
-                pass
-        
-        # 计算宽高比
-        aspect_ratio = ''
-        if width > 0 and height > 0:
-            from math import gcd
-            divisor = gcd(width, height)
-            ratio_w, ratio_h = width // divisor, height // divisor
-            common_ratios = {
-                (16, 9): '16:9', (9, 16): '9:16', (4, 3): '4:3', (3, 4): '3:4',
-                (21, 9): '21:9', (1, 1): '1:1', (3, 2): '3:2', (2, 3): '2:3',
-            }
-            aspect_ratio = common_ratios.get((ratio_w, ratio_h), f'{ratio_w}:{ratio_h}')
+        width, height = probe.width, probe.height
+        duration = probe.duration
         
         # 更新数据库
         video.width = width
         video.height = height
-        video.aspect_ratio = aspect_ratio
-        video.video_codec = video_codec
-        video.audio_codec = audio_codec
-        video.bitrate = total_bitrate
-        video.video_bitrate = video_bitrate
-        video.audio_bitrate = audio_bitrate
-        video.frame_rate = frame_rate
-        video.file_size = file_size
+        video.aspect_ratio = probe.aspect_ratio
+        video.video_codec = probe.video_codec
+        video.audio_codec = probe.audio_codec
+        video.bitrate = probe.bitrate
+        video.video_bitrate = probe.video_bitrate
+        video.audio_bitrate = probe.audio_bitrate
+        video.frame_rate = probe.frame_rate
+        video.file_size = probe.file_size
         if duration > 0 and video.duration == 0:
             video.duration = duration
         if height > 0 and video.resolution == 0:
@@ -810,7 +1498,7 @@ def extract_video_metadata(video_id):
             'duration', 'resolution'
         ])
         
-        logger.info(f"视频 {video_id} 元数据提取完成: {width}x{height}, {video_codec}, {total_bitrate}kbps")
+        logger.info(f"视频 {video_id} 元数据提取完成: {width}x{height}, {probe.video_codec}, {probe.bitrate}kbps")
         return {"status": "success", "video_id": video_id}
         
     except Video.DoesNotExist:
@@ -841,37 +1529,8 @@ def cleanup_deleted_videos():
         try:
             logger.info(f"开始永久删除视频: {video.id} ({video.title})")
             
-            # 删除原始视频文件
-            if video.video_file:
-                video_file_path = os.path.join(settings.MEDIA_ROOT, video.video_file.name)
-                if os.path.exists(video_file_path):
-                    try:
-                        os.remove(video_file_path)
-                        logger.info(f"已删除视频文件: {video_file_path}")
-                    except Exception as e:
-                        logger.error(f"删除视频文件失败: {str(e)}")
-            
-            # 删除 HLS 文件目录
-            if video.hls_file:
-                hls_path_parts = video.hls_file.split('/')
-                if len(hls_path_parts) >= 3:
-                    hls_dir = os.path.join(settings.MEDIA_ROOT, 'videos', 'hls', hls_path_parts[2])
-                    if os.path.exists(hls_dir):
-                        try:
-                            shutil.rmtree(hls_dir)
-                            logger.info(f"已删除 HLS 目录: {hls_dir}")
-                        except Exception as e:
-                            logger.error(f"删除 HLS 目录失败: {str(e)}")
-            
-            # 删除缩略图
-            if video.thumbnail:
-                thumbnail_path = os.path.join(settings.MEDIA_ROOT, video.thumbnail.name)
-                if os.path.exists(thumbnail_path):
-                    try:
-                        os.remove(thumbnail_path)
-                        logger.info(f"已删除缩略图: {thumbnail_path}")
-                    except Exception as e:
-                        logger.error(f"删除缩略图失败: {str(e)}")
+            # 删除文件（共享资源仍被引用时保留）
+            delete_video_files(video)
             
             video_id = video.id
             video_title = video.title
@@ -888,6 +1547,45 @@ def cleanup_deleted_videos():
     return deleted_count
 
 
+@shared_task
+def cleanup_stale_uploads():
+    """
+    定时清理放弃的上传：长时间没有写入且上传会话已过期的临时文件和暂存目录
+    建议每小时执行一次
+    """
+    result = sweep_stale_uploads(settings.UPLOAD_STALE_AGE)
+    stats = record_sweep_stats(result)
+    logger.info(
+        f"上传临时文件清理完成：删除 {result['files']} 个，回收 {result['bytes'] / 1024 ** 2:.1f} MB，"
+        f"剩余 {result['remaining_bytes'] / 1024 ** 2:.1f} MB，累计回收 {stats['reclaimed_bytes'] / 1024 ** 3:.2f} GB"
+    )
+    return result
+
+
+@shared_task(ignore_result=True)
+def flush_video_views():
+    """
+    把 Redis 中累计的播放次数批量写入数据库
+    建议每隔几秒执行一次
+    """
+    updated = flush_view_counts()
+    if updated:
+        logger.debug(f"已写入 {updated} 个视频的播放次数")
+    return updated
+
+
+@shared_task(ignore_result=True)
+def ingest_video_views():
+    """
+    把 Redis 队列中的观看事件批量写入观看记录
+    建议每隔几秒执行一次
+    """
+    processed = ingest_view_events()
+    if processed:
+        logger.debug(f"已写入 {processed} 条观看事件")
+    return processed
+
+
 @shared_task
 def publish_scheduled_videos():
     """
@@ -1,9 +1,36 @@
-from django.test import TestCase
+from django.test import TestCase, SimpleTestCase, override_settings
 from django.contrib.auth import get_user_model
 from unittest.mock import Mock, patch, MagicMock
 from rest_framework.test import APIClient
-from .models import Video
+from .models import Video, VideoView, MediaAsset
+from .services.hls import (
+    select_resolutions, write_master_playlist, check_hls_integrity,
+    find_passthrough_rung, build_video_encode_args,
+    build_hls_output_args, is_rendition_complete,
+)
+from .services.chunking import plan_chunks, chunk_dir_for, mark_chunk_complete, assemble_chunked_rendition
+from .services.ffmpeg_runner import build_progress_snapshot
+from .services.ladder import build_content_aware_ladder
+from .services.sprites import build_sprite_config, write_thumbnails_vtt
+from .services.thumbnails import score_frames
+from .services.probe import parse_probe_output, ProbeResult
+from .services.fingerprint import phash_frames, compare_fingerprints, band_keys
+from .services.uploads import (
+    UploadError, UploadConflict, ChecksumMismatch, open_upload_session, write_chunk, verify_upload, upload_file_path, decode_bitmap,
+    create_stream_upload, append_stream, UploadQuotaExceeded, sweep_stale_uploads,
+)
+from .tus_views import parse_upload_metadata, parse_upload_checksum
+from .services.progressive import find_moov_position
+from .services.delivery import parse_range, resolve_media_path, RangeNotSatisfiable
+from .services.signing import mint_playback_token, verify_playback_token, sign_playlist
+from .services.playlist_cache import read_playlist, invalidate_playlists
+from .services.subtitles import render_vtt, render_srt, compile_subtitles, subtitle_dir
+from .services.media_assets import register_asset, retain_asset, delete_video_files
+from .services.view_counter import flush_view_counts, PENDING_VIEWS_KEY, FLUSHING_VIEWS_KEY
+from .services.view_events import ingest_view_events, VIEW_EVENTS_KEY, PROCESSING_EVENTS_KEY
 import os
+import tempfile
+import numpy as np
 
 User = get_user_model()
 
@@ -112,3 +139,554 @@ class TriggerTranscodeAPITest(TestCase):
         # 验证响应
         self.assertEqual(response.status_code, 404)
         self.assertIn('视频不存在或无权限', response.json()['error'])
+
+
+class MediaAssetTest(TestCase):
+    """共享媒体资源引用计数测试"""
+    
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='assetuser', email='asset@example.com', password='testpass123')
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+    
+    def test_shared_files_deleted_with_last_reference(self):
+        """测试：共享资源仍被引用时保留源文件，最后一个视频删除时才删除，已删除的资源不能再引用"""
+        with override_settings(MEDIA_ROOT=self.media_root.name):
+            source = 'videos/uploads/2026/01/01/abc.mp4'
+            source_path = os.path.join(self.media_root.name, source)
+            os.makedirs(os.path.dirname(source_path))
+            open(source_path, 'wb').close()
+            
+            asset = register_asset('a' * 32, 1024, 'b' * 64, source)
+            first = Video.objects.create(title='first', user=self.user, video_file=source, media_asset=asset)
+            self.assertEqual(retain_asset(asset).ref_count, 2)
+            second = Video.objects.create(title='second', user=self.user, video_file=source, media_asset=asset)
+            
+            delete_video_files(first)
+            first.delete()
+            self.assertTrue(os.path.exists(source_path))
+            self.assertEqual(MediaAsset.objects.get(id=asset.id).ref_count, 1)
+            
+            delete_video_files(second)
+            second.delete()
+            self.assertFalse(os.path.exists(source_path))
+            self.assertFalse(MediaAsset.objects.filter(id=asset.id).exists())
+            # 查找之后资源被释放：不再增加引用，调用方按新上传处理
+            self.assertIsNone(retain_asset(asset))
+
+
+
+class ViewCounterTest(TestCase):
+    """播放次数和观看记录批量写入测试"""
+    
+    def test_flush_view_counts(self):
+        """测试：Redis 中累计的播放次数用一条 UPDATE 写入各个视频"""
+        User = get_user_model()
+        user = User.objects.create_user(username='viewuser', email='view@example.com', password='testpass123')
+        first = Video.objects.create(title='first', user=user, views_count=10)
+        second = Video.objects.create(title='second', user=user)
+        
+        client = MagicMock()
+        client.set.return_value = True
+        client.exists.return_value = False
+        client.hgetall.return_value = {str(first.id).encode(): b'3', str(second.id).encode(): b'1'}
+        with patch('videos.services.view_counter.get_redis', return_value=client):
+            self.assertEqual(flush_view_counts(), 2)
+        
+        client.rename.assert_called_once_with(PENDING_VIEWS_KEY, FLUSHING_VIEWS_KEY)
+        client.delete.assert_any_call(FLUSHING_VIEWS_KEY)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.views_count, second.views_count), (13, 1))
+    
+    def test_ingest_view_events(self):
+        """测试：未登录观看批量创建记录，登录用户每个视频只保留一条记录并更新为最后一次观看，观看时间取事件时间"""
+        import json
+        import redis
+        from datetime import datetime, timezone as dt_timezone
+        from django.db import DatabaseError
+        
+        User = get_user_model()
+        user = User.objects.create_user(username='historyuser', email='history@example.com', password='testpass123')
+        first = Video.objects.create(title='first', user=user)
+        second = Video.objects.create(title='second', user=user)
+        VideoView.objects.create(video=second, user=user, watched_duration=5)
+        
+        def event(video, user_id, duration):
+            return {'video_id': video.id, 'user_id': user_id, 'ip_address': '127.0.0.1', 'user_agent': 'ua',
+                    'watched_duration': duration, 'viewed_at': 1767225600.0}
+        
+        events = [
+            event(first, None, 1), event(first, None, 2),
+            event(first, user.id, 10), event(first, user.id, 20),
+            event(second, user.id, 30),
+            event(Video(id=999999), None, 1),
+        ]
+        client = MagicMock()
+        client.set.return_value = True
+        client.exists.return_value = False
+        client.rename.side_effect = [None, redis.ResponseError('no such key')]
+        client.lrange.return_value = [json.dumps(e).encode() for e in events]
+        with patch('videos.services.view_events.get_redis', return_value=client):
+            self.assertEqual(ingest_view_events(), len(events))
+        
+        client.rename.assert_any_call(VIEW_EVENTS_KEY, PROCESSING_EVENTS_KEY)
+        client.ltrim.assert_called_once_with(PROCESSING_EVENTS_KEY, len(events), -1)
+        viewed_at = datetime.fromtimestamp(1767225600.0, tz=dt_timezone.utc)
+        self.assertEqual(set(VideoView.objects.values_list('view_date', flat=True)), {viewed_at})
+        self.assertEqual(VideoView.objects.filter(video=first, user=None).count(), 2)
+        self.assertEqual(
+            list(VideoView.objects.filter(user=user).order_by('video_id').values_list('watched_duration', flat=True)),
+            [20, 30]
+        )
+        
+        # 写入数据库失败时事件留在处理中列表，下次继续写入
+        client.reset_mock()
+        client.rename.side_effect = None
+        with patch('videos.services.view_events.get_redis', return_value=client), \
+                patch('videos.services.view_events._write_events', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                ingest_view_events()
+        client.ltrim.assert_not_called()
+
+class HLSHelperTest(SimpleTestCase):
+    """HLS 转码公共逻辑测试"""
+    
+    def test_select_resolutions_not_upscale(self):
+        """测试：不会生成高于源视频的分辨率"""
+        resolutions = select_resolutions(1920, 1080)
+        heights = [rung['height'] for rung in resolutions]
+        self.assertEqual(heights, [1080, 720, 480, 360])
+    
+    def test_select_resolutions_small_source(self):
+        """测试：源视频低于最小分辨率时使用原始分辨率"""
+        resolutions = select_resolutions(320, 240)
+        self.assertEqual(len(resolutions), 1)
+        self.assertEqual(resolutions[0]['height'], 240)
+    
+    def test_master_playlist_with_shared_audio(self):
+        """测试：共享音轨的 master.m3u8 能通过完整性检查"""
+        resolutions = select_resolutions(1280, 720)
+        with tempfile.TemporaryDirectory() as hls_dir:
+            write_master_playlist(os.path.join(hls_dir, 'master.m3u8'), resolutions, has_shared_audio=True)
+            
+            with open(os.path.join(hls_dir, 'master.m3u8')) as f:
+                content = f.read()
+            self.assertIn('#EXT-X-MEDIA:TYPE=AUDIO', content)
+            self.assertIn('AUDIO="audio"', content)
+            
+            # 子播放列表尚未生成
+            complete, missing = check_hls_integrity(hls_dir)
+            self.assertFalse(complete)
+            self.assertIn('audio', missing)
+            
+            for name in ['720p', '480p', '360p', 'audio']:
+                os.makedirs(os.path.join(hls_dir, name))
+                with open(os.path.join(hls_dir, name, 'index.m3u8'), 'w') as f:
+                    f.write('#EXTM3U\n#EXTINF:6.0,\nsegment_000.ts\n#EXT-X-ENDLIST\n')
+            
+            complete, missing = check_hls_integrity(hls_dir)
+            self.assertTrue(complete)
+            self.assertEqual(missing, [])
+    
+    def test_plan_chunks_keyframe_aligned(self):
+        """测试：分段起点对齐关键帧，过短的尾段并入前一段"""
+        keyframes = [i * 2.0 for i in range(0, 330)]  # 每 2 秒一个关键帧，共 660 秒
+        chunks = plan_chunks(keyframes, 660, 300)
+        self.assertEqual([c['start'] for c in chunks], [0.0, 300.0])
+        self.assertEqual(chunks[0]['end'], 300.0)
+        self.assertIsNone(chunks[-1]['end'])
+    
+    def test_assemble_chunked_rendition(self):
+        """测试：分段切片拼接为连续编号的 index.m3u8"""
+        chunks = [{'index': 0, 'start': 0.0, 'end': 12.0}, {'index': 1, 'start': 12.0, 'end': None}]
+        with tempfile.TemporaryDirectory() as rendition_dir:
+            for chunk in chunks:
+                chunk_dir = chunk_dir_for(rendition_dir, chunk)
+                os.makedirs(chunk_dir)
+                with open(os.path.join(chunk_dir, 'index.m3u8'), 'w') as f:
+                    f.write('#EXTM3U\n#EXTINF:6.0,\nsegment_000.ts\n#EXTINF:6.0,\nsegment_001.ts\n#EXT-X-ENDLIST\n')
+                for name in ['segment_000.ts', 'segment_001.ts']:
+                    open(os.path.join(chunk_dir, name), 'wb').close()
+                mark_chunk_complete(chunk_dir, chunk)
+            
+            self.assertEqual(assemble_chunked_rendition(rendition_dir, chunks), 4)
+            with open(os.path.join(rendition_dir, 'index.m3u8')) as f:
+                content = f.read()
+            self.assertIn('segment_003.ts', content)
+            self.assertTrue(content.rstrip().endswith('#EXT-X-ENDLIST'))
+            self.assertTrue(os.path.exists(os.path.join(rendition_dir, 'segment_003.ts')))
+            self.assertFalse(os.path.exists(os.path.join(rendition_dir, 'chunks')))
+    
+    def test_progress_snapshot(self):
+        """测试：根据 -progress 输出计算百分比和剩余时间"""
+        snapshot = build_progress_snapshot(
+            {'out_time_us': '30000000', 'speed': '2.0x', 'fps': '48.5'},
+            duration=120,
+            elapsed=15
+        )
+        self.assertEqual(snapshot['percent'], 25.0)
+        self.assertEqual(snapshot['eta'], 45)
+        self.assertEqual(snapshot['speed'], 2.0)
+    
+    def test_passthrough_rung(self):
+        """测试：H.264 High 1080p 源视频的 1080p 分辨率直接复制视频流"""
+        resolutions = select_resolutions(1920, 1080)
+        source = {
+            'video_codec': 'h264', 'profile': 'High', 'pix_fmt': 'yuv420p', 'level': 40,
+            'width': 1920, 'height': 1080, 'video_bitrate': 4500,
+        }
+        rung = find_passthrough_rung(resolutions, source)
+        self.assertEqual(rung['height'], 1080)
+        
+        rung['passthrough'] = True
+        self.assertEqual(build_video_encode_args(rung, 'h264'), ['-c:v', 'copy'])
+        
+        # 10-bit 或非 H.264 的源视频必须重新编码
+        self.assertIsNone(find_passthrough_rung(resolutions, {**source, 'pix_fmt': 'yuv420p10le'}))
+        self.assertIsNone(find_passthrough_rung(resolutions, {**source, 'video_codec': 'hevc'}))
+    
+    def test_content_aware_ladder(self):
+        """测试：简单画面降低码率并跳过中间档位，普通画面保持默认阶梯"""
+        resolutions = select_resolutions(1920, 1080)
+        
+        ladder = build_content_aware_ladder(resolutions, 1.0)
+        self.assertEqual([r['bitrate'] for r in ladder], [r['bitrate'] for r in resolutions])
+        
+        ladder = build_content_aware_ladder(resolutions, 0.6)
+        heights = [r['height'] for r in ladder]
+        self.assertEqual(heights[0], 1080)
+        self.assertEqual(heights[-1], 360)
+        self.assertLess(len(ladder), len(resolutions))
+        self.assertLess(ladder[0]['bitrate'], resolutions[0]['bitrate'])
+    
+    def test_fmp4_single_file_output(self):
+        """测试：fMP4 单文件输出使用字节范围播放列表，并能通过完整性检查"""
+        with tempfile.TemporaryDirectory() as rendition_dir:
+            args = build_hls_output_args(rendition_dir, 'fmp4_single')
+            self.assertIn('single_file', args)
+            self.assertIn(os.path.join(rendition_dir, 'stream.mp4'), args)
+            
+            with open(os.path.join(rendition_dir, 'index.m3u8'), 'w') as f:
+                f.write(
+                    '#EXTM3U\n#EXT-X-VERSION:7\n#EXT-X-MAP:URI="stream.mp4",BYTERANGE="812@0"\n'
+                    '#EXTINF:6.0,\n#EXT-X-BYTERANGE:104857@812\nstream.mp4\n#EXT-X-ENDLIST\n'
+                )
+            self.assertTrue(is_rendition_complete(rendition_dir))
+    
+    def test_thumbnails_vtt(self):
+        """测试：预览缩略图轨道按雪碧图坐标生成 cue"""
+        with tempfile.TemporaryDirectory() as hls_dir:
+            sprite = build_sprite_config(hls_dir, 1920, 1080, 600)
+            self.assertEqual(sprite['tile_height'], 90)
+            
+            # 600 秒、每 5 秒一张，共 120 张，需要两张 10x10 的雪碧图
+            self.assertIsNone(write_thumbnails_vtt(sprite, 600))
+            os.makedirs(sprite['dir'])
+            for name in ['sprite_000.jpg', 'sprite_001.jpg']:
+                open(os.path.join(sprite['dir'], name), 'wb').close()
+            
+            vtt_path = write_thumbnails_vtt(sprite, 600)
+            with open(vtt_path, encoding='utf-8') as f:
+                content = f.read()
+            self.assertTrue(content.startswith('WEBVTT'))
+            self.assertIn('00:00:05.000 --> 00:00:10.000\nsprite_000.jpg#xywh=160,0,160,90', content)
+            self.assertIn('sprite_001.jpg#xywh=160,90,160,90', content)
+    
+    def test_score_frames(self):
+        """测试：黑屏帧被淘汰，细节丰富的帧得分高于模糊的渐变帧"""
+        rng = np.random.default_rng(0)
+        black = np.zeros((90, 160))
+        gradient = np.tile(np.linspace(0, 255, 160), (90, 1))
+        textured = rng.integers(0, 256, (90, 160))
+        
+        scores = score_frames(np.stack([black, gradient, textured]))['score']
+        self.assertEqual(scores[0], 0)
+        self.assertGreater(scores[2], scores[1])
+    
+    def test_parse_probe_output(self):
+        """测试：一次 ffprobe 输出解析出流信息、字幕轨道和关键帧间隔"""
+        data = {
+            'format': {'format_name': 'mov,mp4', 'duration': '20.0', 'size': '5000000', 'bit_rate': '2000000'},
+            'streams': [
+                {'index': 0, 'codec_type': 'video', 'codec_name': 'h264', 'profile': 'High',
+                 'pix_fmt': 'yuv420p', 'level': 40, 'width': 1920, 'height': 1080, 'r_frame_rate': '30000/1001'},
+                {'index': 1, 'codec_type': 'audio', 'codec_name': 'aac', 'sample_rate': '48000', 'channels': 2},
+                {'index': 2, 'codec_type': 'subtitle', 'codec_name': 'mov_text', 'tags': {'language': 'chi'}},
+            ],
+            'packets': [
+                {'stream_index': 0, 'pts_time': '0.0', 'flags': 'K_'},
+                {'stream_index': 0, 'pts_time': '1.0', 'flags': '__'},
+                {'stream_index': 0, 'pts_time': '4.0', 'flags': 'K_'},
+                {'stream_index': 1, 'pts_time': '5.0', 'flags': 'K_'},
+                {'stream_index': 0, 'pts_time': '14.0', 'flags': 'K_'},
+            ],
+        }
+        result = parse_probe_output(data, 'key')
+        self.assertEqual((result.width, result.height, result.aspect_ratio), (1920, 1080, '16:9'))
+        self.assertEqual(result.frame_rate, 29.97)
+        self.assertEqual(result.bitrate, 2000)
+        self.assertEqual(result.subtitle_tracks, [{'index': 2, 'codec': 'mov_text', 'language': 'chi'}])
+        self.assertEqual(result.keyframe_count, 3)
+        self.assertEqual(result.max_keyframe_interval, 10.0)
+        self.assertEqual(ProbeResult.from_dict(result.to_dict()), result)
+    
+    def test_fingerprint_near_duplicate(self):
+        """测试：加噪声、调亮度后的帧哈希相近，不同画面的哈希相距较远"""
+        rng = np.random.default_rng(1)
+        frames = rng.integers(0, 256, (6, 32, 32)).astype(np.float64)
+        reencoded = np.clip(frames * 0.9 + 10 + rng.normal(0, 4, frames.shape), 0, 255)
+        other = rng.integers(0, 256, (6, 32, 32))
+        
+        original = phash_frames(frames)
+        self.assertEqual(original.shape, (6, 8))
+        self.assertEqual(compare_fingerprints(original, phash_frames(reencoded))['similarity'], 1.0)
+        self.assertLess(compare_fingerprints(original, phash_frames(other))['similarity'], 0.5)
+        
+        # 相同哈希产生相同的索引键，每帧最多 4 个
+        self.assertEqual(band_keys(original), band_keys(original.copy()))
+        self.assertLessEqual(len(band_keys(original)), 6 * 4)
+    
+    def test_positional_chunk_upload(self):
+        """测试：分片乱序从流写入预分配文件的对应位置，大小不符、请求体不完整、校验值不符、正在被写入的分片被拒绝，位图按 Redis 位序解码"""
+        import io
+        import hashlib
+        
+        parts = [os.urandom(4096), os.urandom(4096), os.urandom(100)]
+        content = b''.join(parts)
+        
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root), \
+                patch('videos.services.uploads.get_redis') as mock_redis:
+            mock_redis.return_value.hgetall.return_value = {b'file_size': str(len(content)).encode(), b'chunk_size': b'4096'}
+            mock_redis.return_value.getbit.return_value = 0
+            # 第一个分片尚未到达，增量哈希不推进，完成上传时整个文件计算
+            mock_redis.return_value.bitpos.return_value = 0
+            upload_id = hashlib.md5(content).hexdigest()
+            with self.assertRaises(UploadError):
+                open_upload_session(1, '../../' + upload_id, len(content), 4096)
+            session = open_upload_session(1, upload_id, len(content), 4096)
+            self.assertEqual(session['chunks_total'], 3)
+            self.assertEqual(os.path.getsize(upload_file_path(1, upload_id)), len(content))
+            
+            with self.assertRaises(UploadError):
+                write_chunk(1, upload_id, session, 2, io.BytesIO(b'short'), 5, hashlib.md5(b'short').hexdigest())
+            with self.assertRaises(UploadError):
+                write_chunk(1, upload_id, session, 2, io.BytesIO(parts[2][:50]), 100, hashlib.md5(parts[2]).hexdigest())
+            with self.assertRaises(UploadError):
+                write_chunk(1, upload_id, session, 2, io.BytesIO(os.urandom(100)), 100, hashlib.md5(parts[2]).hexdigest())
+            # 同一分片的另一个请求正在写入时不触碰文件
+            mock_redis.return_value.set.return_value = False
+            with self.assertRaises(UploadConflict):
+                write_chunk(1, upload_id, session, 0, io.BytesIO(parts[0]), len(parts[0]), hashlib.md5(parts[0]).hexdigest())
+            mock_redis.return_value.set.return_value = True
+            # 被拒绝的分片不标记，重传后覆盖
+            for index in (2, 0, 1):
+                chunk_md5 = hashlib.md5(parts[index]).hexdigest()
+                write_chunk(1, upload_id, session, index, io.BytesIO(parts[index]), len(parts[index]), chunk_md5)
+            self.assertEqual(mock_redis.return_value.setbit.call_count, 3)
+            
+            md5, sha256, size = verify_upload(1, upload_id)
+            self.assertEqual((md5, size), (hashlib.md5(content).hexdigest(), len(content)))
+        
+        self.assertEqual(decode_bitmap(b'\xa0', 3), [0, 2])
+    
+    def test_resumable_hash_state(self):
+        """测试：导出中间状态后在新对象中继续计算，结果与 hashlib 一致"""
+        import hashlib
+        from .services import resumable_hash
+        
+        if not resumable_hash.available():
+            self.skipTest("libcrypto 不可用")
+        data = os.urandom(100000)
+        for name in ('md5', 'sha256'):
+            first = resumable_hash.ResumableHash(name)
+            first.update(data[:12345])
+            second = resumable_hash.ResumableHash(name, first.state())
+            second.update(data[12345:])
+            self.assertEqual(second.hexdigest(), hashlib.new(name, data).hexdigest())
+            self.assertEqual(first.hexdigest(), hashlib.new(name, data[:12345]).hexdigest())
+    
+    def test_tus_append_resume(self):
+        """测试：tus 请求体中途断开后从已写入的偏移继续，校验失败时偏移不变"""
+        import io
+        import base64
+        import hashlib
+        
+        self.assertEqual(
+            parse_upload_metadata('filename ' + base64.b64encode('视频.mp4'.encode()).decode() + ',is_private'),
+            {'filename': '视频.mp4', 'is_private': ''},
+        )
+        content = os.urandom(10000)
+        checksum = parse_upload_checksum('sha256 ' + base64.b64encode(hashlib.sha256(content[6000:]).digest()).decode())
+        
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root), \
+                patch('videos.services.uploads.get_redis'):
+            upload_id = create_stream_upload(1, len(content), 'a.mp4', 'ts')
+            upload = {'file_size': len(content), 'offset': 0}
+            
+            # 声明 10000 字节，连接在 6000 字节处断开
+            upload['offset'] = append_stream(1, upload_id, upload, 0, io.BytesIO(content[:6000]), len(content))
+            self.assertEqual(upload['offset'], 6000)
+            
+            with self.assertRaises(ChecksumMismatch):
+                append_stream(1, upload_id, upload, 6000, io.BytesIO(os.urandom(4000)), 4000, checksum)
+            upload['offset'] = append_stream(1, upload_id, upload, 6000, io.BytesIO(content[6000:]), 4000, checksum)
+            self.assertEqual(upload['offset'], len(content))
+            
+            with open(upload_file_path(1, upload_id), 'rb') as f:
+                self.assertEqual(f.read(), content)
+    
+    def test_stale_upload_sweep_and_quota(self):
+        """测试：放弃的上传按修改时间清理，会话仍在的保留；新上传受用户临时空间配额限制"""
+        import time
+        
+        stale, active, fresh = 'a' * 32, 'b' * 32, 'c' * 32
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root, UPLOAD_USER_TEMP_QUOTA=3000), \
+                patch('videos.services.uploads.get_redis') as mock_redis:
+            mock_redis.return_value.exists.side_effect = lambda key: key == f'upload:1:{active}:meta'
+            old = time.time() - 7200
+            for upload_id in (stale, active, fresh):
+                path = upload_file_path(1, upload_id)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(b'\0' * 1000)
+                if upload_id != fresh:
+                    os.utime(path, (old, old))
+            
+            with self.assertRaises(UploadQuotaExceeded):
+                create_stream_upload(1, 1000, 'a.mp4', 'ts')
+            
+            result = sweep_stale_uploads(3600)
+            self.assertEqual((result['files'], result['bytes'], result['remaining_bytes']), (1, 1000, 2000))
+            self.assertFalse(os.path.exists(upload_file_path(1, stale)))
+            self.assertTrue(os.path.exists(upload_file_path(1, active)))
+            
+            create_stream_upload(1, 1000, 'a.mp4', 'ts')
+    
+    def test_progressive_faststart_detection(self):
+        """测试：只有开头已到达部分中 moov 在 mdat 之前的 MP4 才能边上传边处理"""
+        import struct
+        
+        def box(box_type, size):
+            return struct.pack('>I4s', size, box_type) + b'\0' * (size - 8)
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'a.part')
+            with open(path, 'wb') as f:
+                f.write(box(b'ftyp', 24) + box(b'moov', 1000) + box(b'mdat', 5000))
+            self.assertEqual(find_moov_position(path, 6024), 'faststart')
+            # moov 的头部还没到达
+            self.assertIsNone(find_moov_position(path, 30))
+            
+            with open(path, 'wb') as f:
+                f.write(box(b'ftyp', 24) + box(b'mdat', 5000) + box(b'moov', 1000))
+            self.assertEqual(find_moov_position(path, 6024), 'tail')
+            
+            with open(path, 'wb') as f:
+                f.write(b'\x1a\x45\xdf\xa3' + b'\0' * 100)
+            self.assertIsNone(find_moov_position(path, 104))
+    
+    def test_media_range_and_path(self):
+        """测试：Range 解析和媒体路径不能越出视频的 HLS 目录"""
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=500-5000', 1000), (500, 999))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 1000))
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range('bytes=1000-', 1000)
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            hls_dir = os.path.join(temp_dir, 'hls', 'abc')
+            os.makedirs(os.path.join(hls_dir, '720p'))
+            open(os.path.join(hls_dir, '720p', 'segment_000.ts'), 'wb').close()
+            open(os.path.join(temp_dir, 'secret.txt'), 'wb').close()
+            
+            self.assertEqual(
+                resolve_media_path(hls_dir, '720p/segment_000.ts'),
+                os.path.realpath(os.path.join(hls_dir, '720p', 'segment_000.ts'))
+            )
+            self.assertIsNone(resolve_media_path(hls_dir, '../../secret.txt'))
+            self.assertIsNone(resolve_media_path(hls_dir, '720p/missing.ts'))
+    
+    @override_settings(MEDIA_SIGNING_KEY='test-key', MEDIA_TOKEN_TTL=60)
+    def test_playback_token_and_playlist_signing(self):
+        """测试：播放令牌只对签发的视频和目录有效，播放列表中的相对地址带上令牌"""
+        token = mint_playback_token(5, 'abc', viewer_id=7)
+        self.assertTrue(verify_playback_token(token, 5, 'abc'))
+        self.assertFalse(verify_playback_token(token, 6, 'abc'))
+        self.assertFalse(verify_playback_token(token, 5, 'other'))
+        self.assertFalse(verify_playback_token(token.replace('.7.', '.8.'), 5, 'abc'))
+        self.assertFalse(verify_playback_token(mint_playback_token(5, 'abc', ttl=-1), 5, 'abc'))
+        self.assertFalse(verify_playback_token(None, 5, 'abc'))
+        
+        playlist = (
+            '#EXTM3U\n'
+            '#EXT-X-MAP:URI="init.mp4"\n'
+            '#EXTINF:4.0,\n'
+            'segment_000.m4s\n'
+            'https://cdn.example.com/segment_001.m4s\n'
+        )
+        self.assertEqual(sign_playlist(playlist, token).splitlines(), [
+            '#EXTM3U',
+            f'#EXT-X-MAP:URI="init.mp4?token={token}"',
+            '#EXTINF:4.0,',
+            f'segment_000.m4s?token={token}',
+            'https://cdn.example.com/segment_001.m4s',
+        ])
+    
+    def test_playlist_cache(self):
+        """测试：播放列表缓存在文件改写后失效，点播列表可以长期缓存"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'index.m3u8')
+            with open(path, 'w') as f:
+                f.write('#EXTM3U\n#EXTINF:4.0,\nsegment_000.ts\n')
+            
+            first = read_playlist(path)
+            self.assertFalse(first['vod'])
+            self.assertIs(read_playlist(path), first)
+            
+            with open(path, 'w') as f:
+                f.write('#EXTM3U\n#EXTINF:4.0,\nsegment_000.ts\n#EXT-X-ENDLIST\n')
+            second = read_playlist(path)
+            self.assertTrue(second['vod'])
+            self.assertNotEqual(second['etag'], first['etag'])
+            
+            invalidate_playlists(temp_dir)
+            self.assertIsNot(read_playlist(path), second)
+            
+            os.remove(path)
+            self.assertIsNone(read_playlist(path))
+    
+    def test_subtitle_rendering(self):
+        """测试：字幕渲染为 VTT / SRT，按内容哈希生成文件并清理旧版本"""
+        subtitles = [
+            {'startTime': 1.9996, 'endTime': 3661.5, 'text': '你好', 'translation': 'Hello'},
+            {'startTime': 4, 'endTime': 5, 'text': ' '},
+            {'startTime': 6, 'endTime': 7, 'text': '再见'},
+        ]
+        self.assertEqual(render_vtt(subtitles), (
+            'WEBVTT\n\n'
+            '1\n00:00:02.000 --> 01:01:01.500\n你好\nHello\n\n'
+            '3\n00:00:06.000 --> 00:00:07.000\n再见\n'
+        ))
+        self.assertEqual(render_srt(subtitles), (
+            '1\n00:00:02,000 --> 01:01:01,500\n你好\nHello\n\n'
+            '2\n00:00:06,000 --> 00:00:07,000\n再见\n'
+        ))
+        
+        with tempfile.TemporaryDirectory() as temp_dir, self.settings(MEDIA_ROOT=temp_dir):
+            video = Mock(id=1, subtitles_draft=subtitles)
+            first = compile_subtitles(video)
+            self.assertEqual(sorted(os.listdir(subtitle_dir(1))), [f'{first}.srt', f'{first}.vtt'])
+            
+            video.subtitles_draft = subtitles[:1]
+            second = compile_subtitles(video)
+            self.assertNotEqual(first, second)
+            self.assertEqual(sorted(os.listdir(subtitle_dir(1))), [f'{second}.srt', f'{second}.vtt'])
+            
+            video.subtitles_draft = []
+            self.assertIsNone(compile_subtitles(video))
+            self.assertFalse(os.path.exists(subtitle_dir(1)))
@@ -0,0 +1,227 @@
+"""
+tus 1.0 断点续传视图
+支持 creation、termination、checksum 扩展；数据写入与分片上传相同的临时文件，上传完成后由后台任务创建视频
+"""
+import base64
+import binascii
+import logging
+
+from django.urls import reverse
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .models import Video, default_hls_segment_format
+from .services.uploads import (
+    UploadError,
+    UploadConflict,
+    ChecksumMismatch,
+    UploadQuotaExceeded,
+    create_stream_upload,
+    get_stream_upload,
+    append_stream,
+    discard_upload,
+    is_valid_upload_id,
+)
+from .services.progressive import discard_progressive
+from .tasks import queue_upload_completion, start_progressive_processing
+
+logger = logging.getLogger(__name__)
+
+TUS_VERSION = '1.0.0'
+TUS_EXTENSIONS = 'creation,termination,checksum'
+# Upload-Checksum 支持的算法（tus 使用 hashlib 的名称）
+TUS_CHECKSUM_ALGORITHMS = ('md5', 'sha1', 'sha256')
+TUS_CONTENT_TYPE = 'application/offset+octet-stream'
+# tus checksum 扩展约定的校验失败状态码
+HTTP_460_CHECKSUM_MISMATCH = 460
+
+
+def parse_upload_metadata(value):
+    """
+    解析 Upload-Metadata：逗号分隔的 "key base64(value)"，值可以省略
+
+    Raises:
+        UploadError: 格式错误
+    """
+    metadata = {}
+    for pair in filter(None, (item.strip() for item in (value or '').split(','))):
+        key, _, encoded = pair.partition(' ')
+        try:
+            metadata[key] = base64.b64decode(encoded, validate=True).decode('utf-8') if encoded else ''
+        except (binascii.Error, UnicodeDecodeError):
+            raise UploadError(f"Upload-Metadata 格式错误: {key}")
+    return metadata
+
+
+def parse_upload_checksum(value):
+    """
+    解析 Upload-Checksum："算法 base64(摘要)"
+
+    Returns:
+        tuple: (算法, 摘要字节)，没有该请求头时返回 None
+    """
+    if not value:
+        return None
+    algorithm, _, encoded = value.strip().partition(' ')
+    if algorithm not in TUS_CHECKSUM_ALGORITHMS:
+        raise UploadError(f"不支持的校验算法: {algorithm}")
+    try:
+        return algorithm, base64.b64decode(encoded, validate=True)
+    except binascii.Error:
+        raise UploadError("Upload-Checksum 格式错误")
+
+
+def tus_response(status_code=status.HTTP_204_NO_CONTENT, data=None, **headers):
+    response = Response(data, status=status_code)
+    response['Tus-Resumable'] = TUS_VERSION
+    response['Cache-Control'] = 'no-store'
+    for name, value in headers.items():
+        response[name.replace('_', '-')] = str(value)
+    return response
+
+
+def check_tus_version(request):
+    """客户端的 Tus-Resumable 版本不受支持时返回 412 响应"""
+    if request.headers.get('Tus-Resumable') != TUS_VERSION:
+        return tus_response(status.HTTP_412_PRECONDITION_FAILED, Tus_Version=TUS_VERSION)
+    return None
+
+
+def check_upload_id(upload_id):
+    """上传 ID 用于拼接临时文件路径，不是创建时签发的格式时返回 400 响应"""
+    if not is_valid_upload_id(upload_id):
+        return tus_response(status.HTTP_400_BAD_REQUEST, {"detail": "上传 ID 无效"})
+    return None
+
+
+class TusViewMixin:
+    permission_classes = [permissions.IsAuthenticated]
+
+    def options(self, request, *args, **kwargs):
+        return tus_response(
+            Tus_Version=TUS_VERSION,
+            Tus_Extension=TUS_EXTENSIONS,
+            Tus_Checksum_Algorithm=','.join(TUS_CHECKSUM_ALGORITHMS),
+        )
+
+
+class TusUploadView(TusViewMixin, APIView):
+    """tus 创建上传"""
+
+    def post(self, request, *args, **kwargs):
+        """
+        创建上传（creation 扩展）
+
+        请求头:
+        - Upload-Length: 文件大小（不支持 Upload-Defer-Length）
+        - Upload-Metadata: filename（必需）、segment_format、md5（可选）
+        """
+        rejected = check_tus_version(request)
+        if rejected:
+            return rejected
+
+        try:
+            file_size = int(request.headers.get('Upload-Length', ''))
+            metadata = parse_upload_metadata(request.headers.get('Upload-Metadata'))
+        except ValueError:
+            return tus_response(status.HTTP_400_BAD_REQUEST, {"detail": "缺少或无效的 Upload-Length"})
+        except UploadError as e:
+            return tus_response(status.HTTP_400_BAD_REQUEST, {"detail": str(e)})
+
+        file_name = metadata.get('filename') or metadata.get('name')
+        segment_format = metadata.get('segment_format') or default_hls_segment_format()
+        if not file_name:
+            return tus_response(status.HTTP_400_BAD_REQUEST, {"detail": "Upload-Metadata 缺少 filename"})
+        if segment_format not in dict(Video.SEGMENT_FORMAT_CHOICES):
+            return tus_response(status.HTTP_400_BAD_REQUEST, {"detail": f"不支持的切片格式: {segment_format}"})
+
+        try:
+            upload_id = create_stream_upload(
+                request.user.id, file_size, file_name, segment_format, metadata.get('md5', '')
+            )
+        except UploadQuotaExceeded as e:
+            return tus_response(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, {"detail": str(e)})
+        except UploadError as e:
+            return tus_response(status.HTTP_400_BAD_REQUEST, {"detail": str(e)})
+        except OSError as e:
+            logger.error(f"创建 tus 上传失败: user_id={request.user.id}, 错误: {e}")
+            return tus_response(status.HTTP_507_INSUFFICIENT_STORAGE, {"detail": "存储空间不足"})
+
+        location = request.build_absolute_uri(reverse('tus-upload-detail', args=[upload_id]))
+        logger.info(f"创建 tus 上传: upload_id={upload_id}, user_id={request.user.id}, 大小={file_size}")
+        return tus_response(status.HTTP_201_CREATED, Location=location, Upload_Offset=0)
+
+
+class TusUploadDetailView(TusViewMixin, APIView):
+    """tus 查询偏移、追加数据、终止上传"""
+
+    def head(self, request, upload_id, *args, **kwargs):
+        """查询当前偏移，客户端从该位置继续上传"""
+        rejected = check_tus_version(request) or check_upload_id(upload_id)
+        if rejected:
+            return rejected
+
+        upload = get_stream_upload(request.user.id, upload_id)
+        if upload is None:
+            return tus_response(status.HTTP_404_NOT_FOUND)
+        return tus_response(
+            status.HTTP_200_OK,
+            Upload_Offset=upload['offset'],
+            Upload_Length=upload['file_size'],
+        )
+
+    def patch(self, request, upload_id, *args, **kwargs):
+        """从 Upload-Offset 开始追加数据，收齐后提交完成上传任务"""
+        rejected = check_tus_version(request) or check_upload_id(upload_id)
+        if rejected:
+            return rejected
+
+        if request.content_type.split(';')[0].strip() != TUS_CONTENT_TYPE:
+            return tus_response(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        upload = get_stream_upload(request.user.id, upload_id)
+        if upload is None:
+            return tus_response(status.HTTP_404_NOT_FOUND)
+
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length') or 0)
+            checksum = parse_upload_checksum(request.headers.get('Upload-Checksum'))
+        except ValueError:
+            return tus_response(status.HTTP_400_BAD_REQUEST, {"detail": "缺少或无效的 Upload-Offset"})
+        except UploadError as e:
+            return tus_response(status.HTTP_400_BAD_REQUEST, {"detail": str(e)})
+
+        try:
+            new_offset = append_stream(
+                request.user.id, upload_id, upload, offset, request.stream, length, checksum
+            )
+        except UploadConflict as e:
+            return tus_response(status.HTTP_409_CONFLICT, {"detail": str(e)})
+        except ChecksumMismatch as e:
+            return tus_response(HTTP_460_CHECKSUM_MISMATCH, {"detail": str(e)})
+        except UploadError as e:
+            return tus_response(status.HTTP_400_BAD_REQUEST, {"detail": str(e)})
+
+        headers = {'Upload_Offset': new_offset}
+        start_progressive_processing(request.user.id, upload_id, upload['segment_format'])
+        if new_offset == upload['file_size']:
+            # 上传完成，后台校验并创建视频，客户端通过 upload/merge/<task_id>/ 查询结果
+            headers['Upload_Task_Id'] = queue_upload_completion(
+                request.user.id, upload['file_name'], upload_id, upload['file_size'],
+                upload['segment_format'], declared_md5=upload['declared_md5'] or None,
+            )
+        return tus_response(**headers)
+
+    def delete(self, request, upload_id, *args, **kwargs):
+        """终止上传（termination 扩展），删除临时文件"""
+        rejected = check_tus_version(request) or check_upload_id(upload_id)
+        if rejected:
+            return rejected
+
+        if get_stream_upload(request.user.id, upload_id) is None:
+            return tus_response(status.HTTP_404_NOT_FOUND)
+        discard_upload(request.user.id, upload_id)
+        discard_progressive(request.user.id, upload_id)
+        return tus_response()
@@ -8,6 +8,7 @@ from .views import (
     ChunkUploadView,
     CheckFileView,
     MergeChunksView,
+    MergeStatusView,
     VideoViewViewSet,
     VideoCollectionViewSet,
     DanmakuViewSet,
@@ -17,6 +18,8 @@ from .views import (
     admin_handle_report
 )
 from .subtitle_views import translate_subtitles, optimize_subtitles
+from .tus_views import TusUploadView, TusUploadDetailView
+from .media_views import HLSMediaView
 
 router = DefaultRouter()
 router.register(r'categories', CategoryViewSet)
@@ -34,6 +37,14 @@ urlpatterns = [
     path('upload/check/', CheckFileView.as_view(), name='check-file'),
     path('upload/chunk/', ChunkUploadView.as_view(), name='upload-chunk'),
     path('upload/merge/', MergeChunksView.as_view(), name='merge-chunks'),
+    path('upload/merge/<str:task_id>/', MergeStatusView.as_view(), name='merge-status'),
+    
+    # tus 1.0 断点续传
+    path('upload/tus/', TusUploadView.as_view(), name='tus-upload'),
+    path('upload/tus/<str:upload_id>/', TusUploadDetailView.as_view(), name='tus-upload-detail'),
+    
+    # HLS 媒体投递（鉴权后发送播放列表和切片）
+    path('media/<int:video_id>/<str:hls_key>/<path:path>', HLSMediaView.as_view(), name='hls-media'),
     
     # 字幕相关路径
     path('videos/<int:video_id>/subtitles/translate/', translate_subtitles, name='translate-subtitles'),
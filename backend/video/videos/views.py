@@ -8,8 +8,8 @@ from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from django.conf import settings
 import os
-import shutil
-from .models import Category, Tag, Video, VideoLike, Comment, VideoView, VideoCollection, VideoReport
+import errno
+from .models import Category, Tag, Video, VideoLike, Comment, VideoView, VideoCollection, VideoReport, default_hls_segment_format
 from .serializers import (
     CategorySerializer,
     TagSerializer,
@@ -29,11 +29,30 @@ from .pagination import (
     HistoryListPagination,
     CollectionListPagination
 )
-from .tasks import process_video
+from .tasks import process_video, queue_upload_completion, is_merge_task_owner, start_progressive_processing
+from .services.media_assets import (
+    find_instant_asset,
+    retain_asset,
+    delete_video_files,
+)
+from .services.subtitles import subtitle_response
+from .services.view_counter import record_view, pending_views
+from .services.view_events import claim_view, enqueue_view_event
+from .services.uploads import (
+    UploadError,
+    UploadConflict,
+    UploadQuotaExceeded,
+    open_upload_session,
+    write_chunk,
+    get_upload_session,
+    upload_file_path,
+    is_valid_upload_id,
+    received_chunks,
+    received_chunk_count,
+)
 import logging
 from rest_framework.views import APIView
 from rest_framework import serializers
-from django.http import HttpResponse
 
 logger = logging.getLogger(__name__)
 
@@ -313,30 +332,9 @@ class VideoViewSet(viewsets.ModelViewSet):
                 video_id = video.id
                 video_title = video.title
                 
-                # 删除文件
+                # 删除文件（共享资源仍被引用时保留）
                 try:
-                    # 删除原始视频文件
-                    if video.video_file:
-                        video_file_path = os.path.join(settings.MEDIA_ROOT, video.video_file.name)
-                        if os.path.exists(video_file_path):
-                            os.remove(video_file_path)
-                            logger.info(f"已删除视频文件: {video_file_path}")
-                    
-                    # 删除 HLS 文件目录
-                    if video.hls_file:
-                        hls_path_parts = video.hls_file.split('/')
-                        if len(hls_path_parts) >= 3:
-                            hls_dir = os.path.join(settings.MEDIA_ROOT, 'videos', 'hls', hls_path_parts[2])
-                            if os.path.exists(hls_dir):
-                                shutil.rmtree(hls_dir)
-                                logger.info(f"已删除 HLS 目录: {hls_dir}")
-                    
-                    # 删除缩略图
-                    if video.thumbnail:
-                        thumbnail_path = os.path.join(settings.MEDIA_ROOT, video.thumbnail.name)
-                        if os.path.exists(thumbnail_path):
-                            os.remove(thumbnail_path)
-                            logger.info(f"已删除缩略图: {thumbnail_path}")
+                    delete_video_files(video)
                 except Exception as e:
                     logger.error(f"删除视频 {video_id} 的文件失败: {str(e)}")
                 
@@ -376,30 +374,9 @@ class VideoViewSet(viewsets.ModelViewSet):
         video_id = video.id
         video_title = video.title
         
-        # 删除文件
+        # 删除文件（共享资源仍被引用时保留）
         try:
-            # 删除原始视频文件
-            if video.video_file:
-                video_file_path = os.path.join(settings.MEDIA_ROOT, video.video_file.name)
-                if os.path.exists(video_file_path):
-                    os.remove(video_file_path)
-                    logger.info(f"已删除视频文件: {video_file_path}")
-            
-            # 删除 HLS 文件目录
-            if video.hls_file:
-                hls_path_parts = video.hls_file.split('/')
-                if len(hls_path_parts) >= 3:
-                    hls_dir = os.path.join(settings.MEDIA_ROOT, 'videos', 'hls', hls_path_parts[2])
-                    if os.path.exists(hls_dir):
-                        shutil.rmtree(hls_dir)
-                        logger.info(f"已删除 HLS 目录: {hls_dir}")
-            
-            # 删除缩略图
-            if video.thumbnail:
-                thumbnail_path = os.path.join(settings.MEDIA_ROOT, video.thumbnail.name)
-                if os.path.exists(thumbnail_path):
-                    os.remove(thumbnail_path)
-                    logger.info(f"已删除缩略图: {thumbnail_path}")
+            delete_video_files(video)
         except Exception as e:
             logger.error(f"删除文件失败: {str(e)}")
         
@@ -532,67 +509,20 @@ class VideoViewSet(viewsets.ModelViewSet):
         
         # 记录观看数据
         watched_duration = request.data.get('watched_duration', 0)
+        user_id = user.id if user else None
         
-        should_count = False  # 是否应该增加播放次数
+        # 同一观众在去重窗口内重复观看只计一次播放（登录用户按用户，未登录按 IP + User-Agent）
+        counted = claim_view(video.id, user_id, ip_address, user_agent)
+        if counted:
+            record_view(video.id)
         
-        # 对于已登录用户
-        if user:
-            # 查找该用户对该视频的观看记录
-            existing_view = VideoView.objects.filter(
-                video=video,
-                user=user
-            ).order_by('-view_date').first()
-            
-            # 如果已有观看记录，更新它
-            if existing_view:
-                time_diff = timezone.now() - existing_view.view_date
-                
-                # 如果距离上次观看超过1小时，增加播放次数
-                if time_diff.total_seconds() > 3600:  # 1小时 = 3600秒
-                    should_count = True
-                
-                # 更新现有记录
-                existing_view.view_date = timezone.now()
-                existing_view.watched_duration = watched_duration
-                existing_view.ip_address = ip_address
-                existing_view.user_agent = user_agent
-                existing_view.save()
-                
-                view = existing_view
-                logger.info(f"更新用户 {user.id} 对视频 {video.id} 的观看记录")
-            else:
-                # 首次观看，创建新记录
-                view = VideoView.objects.create(
-                    video=video,
-                    user=user,
-                    ip_address=ip_address,
-                    user_agent=user_agent,
-                    watched_duration=watched_duration
-                )
-                should_count = True
-                logger.info(f"创建用户 {user.id} 对视频 {video.id} 的观看记录")
-            
-            if should_count:
-                video.views_count = F('views_count') + 1
-                video.save(update_fields=['views_count'])
-                video.refresh_from_db()
-        else:
-            # 未登录用户，每次都创建新记录并计数
-            view = VideoView.objects.create(
-                video=video,
-                user=None,
-                ip_address=ip_address,
-                user_agent=user_agent,
-                watched_duration=watched_duration
-            )
-            
-            # 更新视频播放次数
-            video.views_count = F('views_count') + 1
-            video.save(update_fields=['views_count'])
-            video.refresh_from_db()
+        # 观看记录由定时任务批量写入；登录用户每次都更新观看历史，未登录观众重复观看不再记录
+        if user or counted:
+            enqueue_view_event(video.id, user_id, ip_address, user_agent, watched_duration)
         
+        # 播放次数由定时任务批量写入数据库，返回值包含尚未写入的部分
         return Response(
-            {"detail": "观看记录已保存", "views_count": video.views_count}, 
+            {"detail": "观看记录已保存", "views_count": video.views_count + pending_views(video.id)}, 
             status=status.HTTP_201_CREATED
         )
     
@@ -879,6 +809,74 @@ class VideoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=True, methods=['get', 'post'], url_path='thumbnail-candidates')
+    def thumbnail_candidates(self, request, pk=None):
+        """
+        自动封面候选帧
+
+        GET: 返回候选帧列表（按得分从高到低）
+        POST: 选择候选帧作为封面，参数 index
+        """
+        video = self.get_object()
+
+        # 确保是视频所有者
+        if video.user != request.user:
+            return Response(
+                {"detail": "您不是该视频的所有者"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        candidates = video.thumbnail_candidates or []
+
+        if request.method == 'GET':
+            current = video.thumbnail.name if video.thumbnail else None
+            return Response([
+                {
+                    'index': index,
+                    'url': request.build_absolute_uri(settings.MEDIA_URL + item['path']),
+                    'score': item.get('score'),
+                    'selected': item['path'] == current,
+                }
+                for index, item in enumerate(candidates)
+            ])
+
+        try:
+            index = int(request.data.get('index'))
+            candidate = candidates[index]
+        except (TypeError, ValueError, IndexError):
+            return Response(
+                {"detail": "无效的候选帧"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        candidate_path = os.path.join(settings.MEDIA_ROOT, candidate['path'])
+        if not os.path.exists(candidate_path):
+            return Response(
+                {"detail": "候选帧文件不存在"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        old_thumbnail = video.thumbnail.name if video.thumbnail else None
+        video.thumbnail = candidate['path']
+        video.save(update_fields=['thumbnail'])
+
+        # 删除旧缩略图（候选帧文件保留，以便再次切换）
+        candidate_paths = {item['path'] for item in candidates}
+        if old_thumbnail and old_thumbnail != video.thumbnail.name and old_thumbnail not in candidate_paths:
+            old_thumbnail_path = os.path.join(settings.MEDIA_ROOT, old_thumbnail)
+            if os.path.exists(old_thumbnail_path):
+                try:
+                    os.remove(old_thumbnail_path)
+                    logger.info(f"已删除旧缩略图: {old_thumbnail_path}")
+                except Exception as e:
+                    logger.warning(f"删除旧缩略图失败: {str(e)}")
+
+        logger.info(f"视频 {video.id} 选择候选帧 {index} 作为封面")
+        return Response({
+            "detail": "封面已更新",
+            "thumbnail_url": request.build_absolute_uri(video.thumbnail.url)
+        })
+
     @action(detail=True, methods=['post'], url_path='detect-subtitle')
     def detect_subtitle(self, request, pk=None):
         """检测视频字幕"""
@@ -996,7 +994,7 @@ class VideoViewSet(viewsets.ModelViewSet):
             "count": len(subtitles)
         })
 
-    @action(detail=True, methods=['get'], url_path='subtitles\.vtt')
+    @action(detail=True, methods=['get'], url_path=r'subtitles\.vtt')
     def subtitles_vtt(self, request, pk=None):
         """输出 WebVTT 字幕文件（用于播放器加载）"""
         video = self.get_object()
@@ -1009,42 +1007,21 @@ class VideoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        subtitles = video.subtitles_draft or []
-        lines = ["WEBVTT", ""]
+        return subtitle_response(request, video, 'vtt')
 
-        def _format_vtt_time(seconds):
-            try:
-                seconds = float(seconds)
-            except Exception:
-                seconds = 0.0
-            if seconds < 0:
-                seconds = 0.0
-            hours = int(seconds // 3600)
-            minutes = int((seconds % 3600) // 60)
-            secs = int(seconds % 60)
-            ms = int(round((seconds - int(seconds)) * 1000))
-            return f"{hours:02d}:{minutes:02d}:{secs:02d}.{ms:03d}"
-
-        for i, sub in enumerate(subtitles):
-            if not isinstance(sub, dict):
-                continue
-            start = sub.get('startTime', 0)
-            end = sub.get('endTime', 0)
-            text = (sub.get('text') or '').strip()
-            translation = (sub.get('translation') or '').strip()
-            if not text and not translation:
-                continue
-
-            lines.append(str(i + 1))
-            lines.append(f"{_format_vtt_time(start)} --> {_format_vtt_time(end)}")
-            if text:
-                lines.append(text)
-            if translation:
-                lines.append(translation)
-            lines.append("")
-
-        content = "\n".join(lines)
-        return HttpResponse(content, content_type='text/vtt; charset=utf-8')
+    @action(detail=True, methods=['get'], url_path=r'subtitles\.srt')
+    def subtitles_srt(self, request, pk=None):
+        """输出 SRT 字幕文件（用于下载）"""
+        video = self.get_object()
+
+        has_permission, error_message = check_video_view_permission(video, request.user)
+        if not has_permission:
+            return Response(
+                {"detail": error_message},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        return subtitle_response(request, video, 'srt')
 
 
     @action(detail=True, methods=['post'], url_path='generate-subtitles')
@@ -1221,6 +1198,10 @@ class CommentViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+# 分片以原始请求体上传时的 Content-Type
+CHUNK_CONTENT_TYPE = 'application/octet-stream'
+
+
 # 创建分片上传的类视图
 class ChunkUploadView(APIView):
     """视频分片上传视图"""
@@ -1228,28 +1209,60 @@ class ChunkUploadView(APIView):
     parser_classes = [MultiPartParser, FormParser]
     
     def post(self, request, *args, **kwargs):
-        """处理分片上传"""
-        chunk = request.FILES.get('chunk')
-        file_name = request.POST.get('file_name')
-        file_md5 = request.POST.get('file_md5')
-        chunk_index = int(request.POST.get('chunk_index', 0))
-        chunks_total = int(request.POST.get('chunks_total', 1))
-        
-        if not chunk or not file_name or not file_md5:
+        """
+        处理分片上传
+        
+        请求体为 application/octet-stream 时，参数放在查询字符串中，分片从请求流直接写入临时文件并计算 MD5，
+        不经过 multipart 解析和 Django 的上传临时文件；multipart 表单（chunk 字段）保留兼容
+        """
+        try:
+            if request.content_type.split(';')[0].strip() == CHUNK_CONTENT_TYPE:
+                params = request.query_params
+                chunk = request.stream
+                chunk_length = int(request.headers.get('Content-Length') or 0)
+            else:
+                params = request.POST
+                chunk = request.FILES.get('chunk')
+                chunk_length = chunk.size if chunk else 0
+            
+            chunk_index = int(params.get('chunk_index', 0))
+            chunks_total = int(params.get('chunks_total', 1))
+            file_size = int(params.get('file_size', 0))
+            chunk_size = int(params.get('chunk_size', 0))
+        except (TypeError, ValueError):
+            return Response({"detail": "分片参数无效"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        file_name = params.get('file_name')
+        file_md5 = params.get('file_md5')
+        chunk_md5 = params.get('chunk_md5')
+        
+        if not chunk or not file_name or not file_md5 or not file_size or not chunk_size or not chunk_md5:
             return Response(
                 {"detail": "缺少必要参数"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if not is_valid_upload_id(file_md5):
+            return Response({"detail": "文件 MD5 无效"}, status=status.HTTP_400_BAD_REQUEST)
         
-        # 创建用户上传目录
-        temp_dir = os.path.join(settings.MEDIA_ROOT, 'temp', 'chunks', file_md5)
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        # 保存分片文件
-        chunk_file_path = os.path.join(temp_dir, f"{chunk_index}")
-        with open(chunk_file_path, 'wb+') as destination:
-            for chunk_data in chunk.chunks():
-                destination.write(chunk_data)
+        # 分片直接写入预分配的临时文件中的对应位置
+        try:
+            session = open_upload_session(request.user.id, file_md5, file_size, chunk_size)
+            write_chunk(request.user.id, file_md5, session, chunk_index, chunk, chunk_length, chunk_md5)
+        except UploadQuotaExceeded as e:
+            return Response({"detail": str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except UploadConflict as e:
+            return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
+        except UploadError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except OSError as e:
+            logger.error(f"写入分片失败: md5={file_md5}, index={chunk_index}, 错误: {e}")
+            if e.errno == errno.ENOSPC:
+                return Response({"detail": "存储空间不足"}, status=status.HTTP_507_INSUFFICIENT_STORAGE)
+            return Response({"detail": "分片保存失败"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        # 开头的分片足够时提前开始探测和转码
+        segment_format = params.get('segment_format') or default_hls_segment_format()
+        start_progressive_processing(request.user.id, file_md5, segment_format)
         
         return Response({
             "detail": f"分片 {chunk_index + 1}/{chunks_total} 上传成功", 
@@ -1272,6 +1285,8 @@ class CheckFileView(APIView):
                 {"detail": "缺少必要参数"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if not is_valid_upload_id(file_md5):
+            return Response({"detail": "文件 MD5 无效"}, status=status.HTTP_400_BAD_REQUEST)
         
         # 检查是否存在同MD5的视频
         video = Video.objects.filter(
@@ -1287,22 +1302,40 @@ class CheckFileView(APIView):
                 "video": serializer.data
             })
         
-        # 文件不存在，但检查是否有已上传的分片
-        temp_dir = os.path.join(settings.MEDIA_ROOT, 'temp', 'chunks', file_md5)
-        
-        if os.path.exists(temp_dir):
-            # 获取已上传的分片列表
-            uploaded_chunks = []
-            for filename in os.listdir(temp_dir):
-                try:
-                    chunk_index = int(filename)
-                    uploaded_chunks.append(chunk_index)
-                except ValueError:
-                    continue
+        # 全站已有相同内容的公开视频：秒传，直接复用源文件和转码结果
+        asset = find_instant_asset(file_md5, file_size)
+        if asset:
+            from django.db import transaction
             
+            with transaction.atomic():
+                # 资源可能刚被最后一个视频释放，此时不秒传，按正常流程上传
+                asset = retain_asset(asset)
+                if asset:
+                    video = Video.objects.create(
+                        title=os.path.splitext(file_name)[0],
+                        user=request.user,
+                        video_file=asset.video_file,
+                        media_asset=asset,
+                        hls_segment_format=asset.media_info.get('hls_segment_format', default_hls_segment_format())
+                    )
+            if asset:
+                logger.info(f"秒传：视频 {video.id} 复用共享资源 {asset.id}，用户ID: {request.user.id}")
+                
+                serializer = VideoDetailSerializer(video, context={'request': request})
+                return Response({
+                    "exists": True,
+                    "instant": True,
+                    "video": serializer.data
+                })
+        
+        # 文件不存在，但检查是否有已上传的分片（Redis 位图）
+        session = get_upload_session(request.user.id, file_md5)
+        
+        if session and os.path.exists(upload_file_path(request.user.id, file_md5)):
             return Response({
                 "exists": False,
-                "uploaded_chunks": uploaded_chunks
+                "uploaded_chunks": received_chunks(request.user.id, file_md5, session),
+                "chunk_size": session['chunk_size']
             })
         
         return Response({
@@ -1312,121 +1345,95 @@ class CheckFileView(APIView):
 
 
 class MergeChunksView(APIView):
-    """合并文件分片视图"""
+    """完成分片上传视图"""
     permission_classes = [permissions.IsAuthenticated]
     
     def post(self, request, *args, **kwargs):
-        """合并分片并创建视频记录"""
-        from django.db import transaction
-        
+        """分片收齐后提交完成上传任务"""
         file_name = request.data.get('file_name')
         file_md5 = request.data.get('file_md5')
         file_size = request.data.get('file_size')
-        chunks_total = int(request.data.get('chunks_total', 1))
+        segment_format = request.data.get('segment_format') or default_hls_segment_format()
         
         if not file_name or not file_md5 or not file_size:
             return Response(
                 {"detail": "缺少必要参数"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if not is_valid_upload_id(file_md5):
+            return Response({"detail": "文件 MD5 无效"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            chunks_total = int(request.data.get('chunks_total', 1))
+        except (TypeError, ValueError):
+            return Response({"detail": "分片数量无效"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if segment_format not in dict(Video.SEGMENT_FORMAT_CHOICES):
+            return Response(
+                {"detail": f"不支持的切片格式: {segment_format}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         # 检查分片是否全部上传
-        temp_dir = os.path.join(settings.MEDIA_ROOT, 'temp', 'chunks', file_md5)
+        session = get_upload_session(request.user.id, file_md5)
         
-        if not os.path.exists(temp_dir):
+        if not session or not os.path.exists(upload_file_path(request.user.id, file_md5)):
             return Response(
                 {"detail": "没有找到上传的分片"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # 检查分片数量
-        chunks = os.listdir(temp_dir)
-        if len(chunks) != chunks_total:
+        # 检查分片数量（位图计数）
+        received = received_chunk_count(request.user.id, file_md5)
+        if session['chunks_total'] != chunks_total or received != chunks_total:
             return Response(
-                {"detail": f"分片不完整，预期 {chunks_total} 个，实际 {len(chunks)} 个"}, 
+                {"detail": f"分片不完整，预期 {session['chunks_total']} 个，实际 {received} 个"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # 创建上传目录
-        upload_dir = os.path.join(settings.MEDIA_ROOT, 'videos', 'uploads', 
-                                 f"{timezone.now().year}",
-                                 f"{timezone.now().month:02d}",
-                                 f"{timezone.now().day:02d}")
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # 确定文件扩展名
-        file_ext = os.path.splitext(file_name)[1]
-        if not file_ext:
-            file_ext = '.mp4'  # 默认使用mp4扩展名
-        
-        # 合并后的文件路径
-        merged_filename = f"{file_md5}{file_ext}"
-        merged_file_path = os.path.join(upload_dir, merged_filename)
+        # 合并在后台任务中进行，同一文件重复请求时返回已提交的任务
+        task_id = queue_upload_completion(
+            request.user.id, file_name, file_md5, file_size, segment_format, declared_md5=file_md5
+        )
         
-        # 使用事务确保数据库和文件系统的一致性
-        try:
-            with transaction.atomic():
-                # 合并分片
-                with open(merged_file_path, 'wb') as target_file:
-                    # 按索引顺序合并
-                    for i in range(chunks_total):
-                        chunk_path = os.path.join(temp_dir, str(i))
-                        if os.path.exists(chunk_path):
-                            with open(chunk_path, 'rb') as chunk_file:
-                                target_file.write(chunk_file.read())
-                
-                # 创建视频记录
-                video_file_path = os.path.join(
-                    'videos', 'uploads',
-                    f"{timezone.now().year}",
-                    f"{timezone.now().month:02d}",
-                    f"{timezone.now().day:02d}", 
-                    merged_filename
-                )
-                
-                video = Video.objects.create(
-                    title=os.path.splitext(file_name)[0],  # 使用文件名作为标题
-                    user=request.user,
-                    video_file=video_file_path
-                )
-                
-                # 记录视频ID和详细信息
-                logger.info(f"新创建视频ID: {video.id}, 标题: {video.title}, 用户ID: {video.user.id}")
-                
-                # 清理临时分片（只有在数据库记录创建成功后才清理）
-                shutil.rmtree(temp_dir)
-                
-                # 返回视频信息
-                serializer = VideoDetailSerializer(
-                    video, 
-                    context={'request': request}
-                )
-                
-                response_data = {
-                    "detail": "文件合并成功",
-                    "video": serializer.data
-                }
-                logger.info(f"合并分片API响应: {response_data}")
-                
-                return Response(response_data)
-                
-        except Exception as e:
-            # 发生错误时清理已合并的文件
-            logger.error(f"合并分片失败: {str(e)}")
-            
-            # 删除已合并的文件
-            if os.path.exists(merged_file_path):
-                try:
-                    os.remove(merged_file_path)
-                    logger.info(f"已清理失败的合并文件: {merged_file_path}")
-                except Exception as cleanup_error:
-                    logger.error(f"清理合并文件失败: {str(cleanup_error)}")
-            
-            # 保留临时分片，以便用户重试
-            return Response(
-                {"detail": f"文件合并失败: {str(e)}"}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+        return Response({
+            "detail": "分片合并中",
+            "task_id": task_id
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class MergeStatusView(APIView):
+    """分片合并任务状态视图"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, task_id, *args, **kwargs):
+        """查询合并进度，完成后返回视频信息"""
+        from celery.result import AsyncResult
+        
+        result = AsyncResult(task_id)
+        data = {"task_id": task_id, "state": result.state}
+        
+        if result.state == 'PROGRESS':
+            meta = result.info or {}
+            if meta.get('user_id') != request.user.id:
+                return Response({"detail": "任务不存在"}, status=status.HTTP_404_NOT_FOUND)
+            data.update(stage=meta.get('stage'), progress=meta.get('progress'))
+        
+        elif result.state == 'SUCCESS':
+            payload = result.result or {}
+            video = Video.objects.filter(id=payload.get('video_id'), user=request.user).first()
+            if video is None:
+                return Response({"detail": "任务不存在"}, status=status.HTTP_404_NOT_FOUND)
+            data["progress"] = 100
+            data["video"] = VideoDetailSerializer(video, context={'request': request}).data
+        
+        elif result.state == 'FAILURE':
+            # 失败结果中没有用户信息，只返回当前用户提交的完成任务
+            if not is_merge_task_owner(task_id, request.user.id):
+                return Response({"detail": "任务不存在"}, status=status.HTTP_404_NOT_FOUND)
+            data["detail"] = f"文件合并失败: {result.result}"
+        
+        return Response(data)
 
 
 class VideoViewViewSet(viewsets.ModelViewSet):
@@ -110,24 +110,32 @@ export async function checkFileExists(fileName, fileMD5, fileSize) {
  * @param {string} fileMD5 - 文件MD5值
  * @param {number} chunkIndex - 分片索引
  * @param {number} totalChunks - 总分片数
+ * @param {number} fileSize - 文件大小
+ * @param {number} chunkSize - 分片大小（服务端按 chunkIndex * chunkSize 定位写入）
  * @param {Function} onProgress - 进度回调
  * @returns {Promise<object>} - 返回上传结果
  */
-export async function uploadChunk(chunk, fileName, fileMD5, chunkIndex, totalChunks, onProgress) {
-  const formData = new FormData();
-  formData.append('chunk', chunk);
-  formData.append('file_name', fileName);
-  formData.append('file_md5', fileMD5);
-  formData.append('chunk_index', chunkIndex);
-  formData.append('chunks_total', totalChunks);
+export async function uploadChunk(chunk, fileName, fileMD5, chunkIndex, totalChunks, fileSize, chunkSize, onProgress) {
+  // 分片 MD5 由服务端在写入时校验，损坏的分片会被立即拒绝
+  const chunkMD5 = SparkMD5.ArrayBuffer.hash(await chunk.arrayBuffer());
 
   try {
+    // 分片作为原始请求体发送，服务端直接写入临时文件，参数放在查询字符串中
     const response = await service({
       url: '/videos/upload/chunk/',
       method: 'post',
-      data: formData,
+      params: {
+        file_name: fileName,
+        file_md5: fileMD5,
+        chunk_index: chunkIndex,
+        chunks_total: totalChunks,
+        file_size: fileSize,
+        chunk_size: chunkSize,
+        chunk_md5: chunkMD5
+      },
+      data: chunk,
       headers: {
-        'Content-Type': 'multipart/form-data'
+        'Content-Type': 'application/octet-stream'
       },
       onUploadProgress: (progressEvent) => {
         if (onProgress && progressEvent.total > 0) {
@@ -148,7 +156,7 @@ export async function uploadChunk(chunk, fileName, fileMD5, chunkIndex, totalChu
  * @param {string} fileMD5 - 文件MD5值
  * @param {number} fileSize - 文件大小
  * @param {number} totalChunks - 总分片数
- * @returns {Promise<object>} - 返回合并结果
+ * @returns {Promise<object>} - 返回合并任务（task_id）
  */
 export async function mergeChunks(fileName, fileMD5, fileSize, totalChunks) {
   try {
@@ -169,6 +177,34 @@ export async function mergeChunks(fileName, fileMD5, fileSize, totalChunks) {
   }
 }
 
+/**
+ * 轮询分片合并任务，直到合并完成
+ * @param {string} taskId - 合并任务ID
+ * @param {Function} onProgress - 合并进度回调（0-100）
+ * @param {number} interval - 轮询间隔（毫秒）
+ * @returns {Promise<object>} - 返回创建的视频
+ */
+export async function waitForMerge(taskId, onProgress, interval = 1000) {
+  while (true) {
+    const result = await service({
+      url: `/videos/upload/merge/${taskId}/`,
+      method: 'get'
+    });
+
+    if (result.state === 'SUCCESS') {
+      return result.video;
+    }
+    if (result.state === 'FAILURE') {
+      throw new Error(result.detail || '文件合并失败');
+    }
+    if (result.state === 'PROGRESS' && onProgress) {
+      onProgress(result.progress || 0);
+    }
+
+    await new Promise((resolve) => setTimeout(resolve, interval));
+  }
+}
+
 /**
  * 上传整个文件（分片上传、断点续传）
  * @param {File} file - 文件对象
@@ -196,8 +232,9 @@ export async function uploadFile(file, onProgress) {
     // 获取已上传的分片索引
     const uploadedChunks = checkResult.uploaded_chunks || [];
     
-    // 3. 创建文件分片
-    const chunks = createFileChunks(file);
+    // 3. 创建文件分片（续传时沿用服务端记录的分片大小）
+    const chunkSize = checkResult.chunk_size || DEFAULT_CHUNK_SIZE;
+    const chunks = createFileChunks(file, chunkSize);
     
     // 4. 上传所有未上传的分片
     const uploadPromises = [];
@@ -220,6 +257,8 @@ export async function uploadFile(file, onProgress) {
           fileMD5,
           chunk.index,
           totalChunks,
+          file.size,
+          chunkSize,
           () => {
             // 每完成一个分片，更新总进度
             completedChunks++;
@@ -238,14 +277,17 @@ export async function uploadFile(file, onProgress) {
       await Promise.all(uploadPromises);
     }
     
-    // 5. 合并文件分片
-    onProgress && onProgress(95, '处理中...');
-    const mergeResult = await mergeChunks(file.name, fileMD5, file.size, totalChunks);
+    // 5. 合并文件分片（后台任务），轮询合并进度
+    onProgress && onProgress(90, '合并中...');
+    const mergeTask = await mergeChunks(file.name, fileMD5, file.size, totalChunks);
+    const video = await waitForMerge(mergeTask.task_id, (progress) => {
+      onProgress && onProgress(90 + progress * 0.1, '合并中...');
+    });
     
     // 6. 上传完成
     onProgress && onProgress(100, '上传完成');
     
-    return mergeResult.video;
+    return video;
   } catch (error) {
     console.error('上传文件失败:', error);
     throw error;
@@ -258,5 +300,6 @@ export default {
   checkFileExists,
   uploadChunk,
   mergeChunks,
+  waitForMerge,
   uploadFile
 }; 
\ No newline at end of file
@@ -1,6 +1,7 @@
 /**
  * 视频处理工具函数
  */
+import { getToken } from './auth';
 
 /**
  * 计算视频宽高比
@@ -146,3 +147,18 @@ export function extractThumbnailFromVideo(videoFile, timeOffset = 0.5) {
     }, 5000);
   });
 }
+
+/**
+ * hls.js 配置：请求带上登录令牌，播放地址（hls_url）中的签名过期后，重新加载播放列表时按登录状态鉴权
+ * @param {Object} config - 其他 hls.js 配置
+ * @returns {Object} hls.js 配置
+ */
+export function hlsAuthConfig(config = {}) {
+  return {
+    ...config,
+    xhrSetup(xhr) {
+      const token = getToken();
+      if (token) xhr.setRequestHeader('Authorization', `Bearer ${token}`);
+    }
+  };
+}
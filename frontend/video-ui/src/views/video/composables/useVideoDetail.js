@@ -23,6 +23,7 @@ export function useVideoDetail(videoId) {
     category: null,
     tags: [],
     hls_file: '',
+    hls_url: '',
     thumbnail: '',
     collection: null,
     collectionIndex: 0
@@ -93,6 +94,7 @@ export function useVideoDetail(videoId) {
         category: response.category,
         tags: response.tags || [],
         hls_file: response.hls_file,
+        hls_url: response.hls_url,
         thumbnail: response.thumbnail
       };
       